@@ -0,0 +1,130 @@
+"""
+Activity Cache for Libreya
+Per-user cache of user_activity rows, so the reader, favorites and
+recommendations of an active user are answered without asking Supabase
+again. Filled on first read, kept current write-through by the endpoints that
+change activity, and bounded by users and rows with LRU eviction by user.
+
+Loads race with writes: a load that started before a write to the same user
+must not overwrite it. Writes are numbered; a load takes marker() before it
+asks upstream and put() drops its rows if the user was written since.
+
+The cache is per process. Writes handled by another worker are only seen
+after ACTIVITY_CACHE_TTL, like any other per-worker state here.
+"""
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from metrics import Counter, gauge_from
+
+ACTIVITY_CACHE_USERS = int(os.getenv("ACTIVITY_CACHE_USERS", "10000"))
+ACTIVITY_CACHE_ROWS = int(os.getenv("ACTIVITY_CACHE_ROWS", "200000"))
+ACTIVITY_CACHE_TTL = float(os.getenv("ACTIVITY_CACHE_TTL", "60"))
+
+Row = Dict[str, Any]
+
+
+class ActivityCache:
+    def __init__(self, max_users: int = ACTIVITY_CACHE_USERS, max_rows: int = ACTIVITY_CACHE_ROWS,
+                 ttl: float = ACTIVITY_CACHE_TTL):
+        self.max_users = max_users
+        self.max_rows = max_rows
+        self.ttl = ttl
+        # user_id -> (loaded at, {book_id: row}), least recently used first
+        self.users: "OrderedDict[str, Any]" = OrderedDict()
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sequence = itertools.count(1)
+        self._last_write = 0
+        # Recent writes by user; loads older than _forgotten can't be checked and are dropped
+        self._writes: "OrderedDict[str, int]" = OrderedDict()
+        self._forgotten = 0
+
+    def get(self, user_id: str) -> Optional[Dict[int, Row]]:
+        """The user's rows by book id, or None when not cached"""
+        entry = self.users.get(user_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                self._drop(user_id)
+            self.misses += 1
+            return None
+        self.users.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def marker(self) -> int:
+        return self._last_write
+
+    def put(self, user_id: str, rows: List[Row], marker: int):
+        """Cache rows loaded after `marker`, unless the user was written since"""
+        if marker < self._forgotten or self._writes.get(user_id, 0) > marker:
+            return
+        self._drop(user_id)
+        by_book = {row["book_id"]: row for row in rows}
+        self.users[user_id] = (time.monotonic(), by_book)
+        self.rows += len(by_book)
+        self._evict()
+
+    def upsert(self, user_id: str, row: Row):
+        """Write-through of one saved row; users not cached are loaded fresh on their next read"""
+        self._written(user_id)
+        entry = self.users.get(user_id)
+        if entry is not None:
+            by_book = entry[1]
+            if row["book_id"] not in by_book:
+                self.rows += 1
+            by_book[row["book_id"]] = row
+            self._evict()
+
+    def remove(self, user_id: str, book_id: Optional[int] = None):
+        """Forget one row of a user, or all of them"""
+        self._written(user_id)
+        entry = self.users.get(user_id)
+        if entry is None:
+            return
+        if book_id is None:
+            self._drop(user_id)
+        elif entry[1].pop(book_id, None) is not None:
+            self.rows -= 1
+
+    def remove_book(self, book_id: int):
+        """A deleted book's rows are gone for every user"""
+        for user_id in [u for u, (_, by_book) in self.users.items() if book_id in by_book]:
+            self.remove(user_id, book_id)
+
+    def _written(self, user_id: str):
+        self._last_write = next(self._sequence)
+        self._writes[user_id] = self._last_write
+        self._writes.move_to_end(user_id)
+        while len(self._writes) > self.max_users:
+            _, sequence = self._writes.popitem(last=False)
+            self._forgotten = max(self._forgotten, sequence)
+
+    def _drop(self, user_id: str):
+        entry = self.users.pop(user_id, None)
+        if entry is not None:
+            self.rows -= len(entry[1])
+
+    def _evict(self):
+        while self.users and (len(self.users) > self.max_users or self.rows > self.max_rows):
+            _, (_, by_book) = self.users.popitem(last=False)
+            self.rows -= len(by_book)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"users": len(self.users), "rows": self.rows, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "max_users": self.max_users, "max_rows": self.max_rows}
+
+
+activity_cache = ActivityCache()
+
+gauge_from("libreya_activity_cache_rows", "Activity rows held by the per-user cache",
+           lambda: {(): activity_cache.rows})
+gauge_from("libreya_activity_cache_lookups_total", "Per-user activity cache lookups by result",
+           lambda: {("hit",): activity_cache.hits, ("miss",): activity_cache.misses},
+           labels=("result",), kind=Counter)
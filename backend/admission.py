@@ -0,0 +1,208 @@
+"""
+Admission Control for Libreya
+A global limiter on concurrent upstream (Supabase) requests with a bounded
+wait queue, and per-client token buckets for expensive routes.
+"""
+import asyncio
+import ipaddress
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "32"))
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", "256"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "5.0"))
+# Addresses or networks of proxies whose X-Forwarded-For is believed, comma separated
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1")
+
+
+class UpstreamSaturated(Exception):
+    """Raised when an upstream request is shed instead of queued"""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class UpstreamLimiter:
+    """
+    Semaphore with a bounded FIFO wait queue. Requests beyond the queue bound,
+    or that wait longer than queue_timeout, are shed with UpstreamSaturated.
+    """
+
+    def __init__(self, max_concurrency: int = UPSTREAM_MAX_CONCURRENCY,
+                 max_queue: int = UPSTREAM_MAX_QUEUE,
+                 queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: "OrderedDict[asyncio.Future, None]" = OrderedDict()
+        self.admitted = 0
+        self.shed = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # Optional callback receiving every queue wait in seconds (metrics)
+        self.on_wait = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise UpstreamSaturated("Upstream wait queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[waiter] = None
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._waiters.pop(waiter, None)
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed over just as we timed out: pass it on
+                self._release_slot()
+            self.shed += 1
+            raise UpstreamSaturated("Timed out waiting for an upstream slot")
+        except asyncio.CancelledError:
+            self._waiters.pop(waiter, None)
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        waited = time.perf_counter() - started
+        self.wait_count += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        if self.on_wait:
+            self.on_wait(waited)
+        self.admitted += 1
+
+    def release(self):
+        self._release_slot()
+
+    def _release_slot(self):
+        # Hand the slot straight to the oldest live waiter, in_flight stays the same
+        while self._waiters:
+            waiter, _ = self._waiters.popitem(last=False)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_count": self.wait_count,
+            "wait_avg_ms": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+
+class RateLimiter:
+    """Per-client token buckets for one route class, LRU-bounded by client count"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    def check(self, client: str) -> Tuple[bool, float]:
+        """Take one token for client. Returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.burst)
+            self._buckets[client] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            self.allowed += 1
+            return True, 0.0
+        self.limited += 1
+        return False, (1 - bucket.tokens) / self.rate
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+def _limit_from_env(name: str, rate: float, burst: float) -> RateLimiter:
+    return RateLimiter(
+        float(os.getenv(f"RATE_LIMIT_{name}_PER_SECOND", str(rate))),
+        float(os.getenv(f"RATE_LIMIT_{name}_BURST", str(burst))),
+    )
+
+
+# Route classes with their own budgets
+RATE_LIMITS: Dict[str, RateLimiter] = {
+    "book": _limit_from_env("BOOK", 2.0, 20),
+    "search": _limit_from_env("SEARCH", 2.0, 10),
+}
+
+
+def parse_networks(spec: str) -> tuple:
+    """Comma separated addresses or CIDR networks"""
+    return tuple(ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip())
+
+
+_trusted_proxies = parse_networks(TRUSTED_PROXIES)
+
+
+def _is_trusted(address: Optional[str], trusted) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_key(headers, peer: Optional[str], trusted=None) -> str:
+    """
+    Identify the caller. X-Forwarded-For is only believed when the peer is a
+    trusted proxy, and then the right-most hop that isn't one is the client:
+    anything left of it was written by the client and can't be trusted.
+    """
+    trusted = _trusted_proxies if trusted is None else trusted
+    forwarded = headers.get("x-forwarded-for")
+    if not forwarded or not _is_trusted(peer, trusted):
+        return peer or "unknown"
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted):
+            return hop
+    return hops[0] if hops else peer
@@ -0,0 +1,228 @@
+"""
+Admin Analytics for Libreya
+Daily rollups kept up to date as requests pass through the API, so the admin
+dashboard reads a few counters instead of scanning users and user_activity.
+
+Per day: distinct active readers (a HyperLogLog sketch, about 1.6% error in
+4 KB no matter how many readers), book opens per book and per category,
+favorites added and removed, signups per auth provider and guest migrations.
+Only the last ANALYTICS_DAYS days are kept.
+
+Rollups start counting when the process does and are persisted as JSON
+snapshots, like the trending counts. With several workers each one rolls up
+the requests it served into its own snapshot file (see snapshots.py), and a
+report merges the other workers' latest snapshots, at most SNAPSHOT_INTERVAL
+old, into the answering worker's live rollups.
+"""
+import base64
+import hashlib
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import snapshots
+
+ANALYTICS_DAYS = int(os.getenv("ANALYTICS_DAYS", "90"))
+ANALYTICS_SNAPSHOT = os.getenv("LIBREYA_ANALYTICS_SNAPSHOT",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), ".analytics.json"))
+SNAPSHOT_INTERVAL = 60.0
+# Most opened books listed in a report
+TOP_BOOKS = 20
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2**precision one-byte registers"""
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers or bytes(self.size))
+
+    def add(self, value: str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Small range correction: linear counting
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
+
+    def dump(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode()
+
+
+class DayRollup:
+    COUNTERS = ("opens", "favorites_added", "favorites_removed", "guest_migrations")
+
+    def __init__(self):
+        self.readers = HyperLogLog()
+        self.opens = 0
+        self.favorites_added = 0
+        self.favorites_removed = 0
+        self.guest_migrations = 0
+        self.book_opens: Counter = Counter()
+        self.category_opens: Counter = Counter()
+        self.signups: Counter = Counter()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"readers": self.readers.dump(), **{name: getattr(self, name) for name in self.COUNTERS},
+                "book_opens": dict(self.book_opens), "category_opens": dict(self.category_opens),
+                "signups": dict(self.signups)}
+
+    def merge(self, other: "DayRollup"):
+        self.readers.merge(other.readers)
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.book_opens.update(other.book_opens)
+        self.category_opens.update(other.category_opens)
+        self.signups.update(other.signups)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DayRollup":
+        day = cls()
+        day.readers = HyperLogLog(registers=base64.b64decode(data["readers"]))
+        for name in cls.COUNTERS:
+            setattr(day, name, data.get(name, 0))
+        day.book_opens = Counter({int(k): v for k, v in data.get("book_opens", {}).items()})
+        day.category_opens = Counter(data.get("category_opens", {}))
+        day.signups = Counter(data.get("signups", {}))
+        return day
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class Analytics:
+    def __init__(self, days: int = ANALYTICS_DAYS, snapshot_path: Optional[str] = ANALYTICS_SNAPSHOT):
+        self.max_days = days
+        self.snapshot_path = snapshot_path
+        self.days: "OrderedDict[str, DayRollup]" = OrderedDict()
+        self.since = time.time()
+        self._saved = time.monotonic()
+
+    def _day(self) -> DayRollup:
+        key = today()
+        day = self.days.get(key)
+        if day is None:
+            day = self.days[key] = DayRollup()
+            while len(self.days) > self.max_days:
+                self.days.popitem(last=False)
+        if self.snapshot_path and time.monotonic() - self._saved >= SNAPSHOT_INTERVAL:
+            self.save()
+        return day
+
+    # ---- events ----
+
+    def record_open(self, book_id: int, category: Optional[str]):
+        day = self._day()
+        day.opens += 1
+        day.book_opens[book_id] += 1
+        if category:
+            day.category_opens[category] += 1
+
+    def record_reader(self, user_id: str, was_favorite: bool = False, is_favorite: bool = False):
+        day = self._day()
+        day.readers.add(user_id)
+        if is_favorite and not was_favorite:
+            day.favorites_added += 1
+        elif was_favorite and not is_favorite:
+            day.favorites_removed += 1
+
+    def record_signup(self, auth_provider: str):
+        self._day().signups[auth_provider or "unknown"] += 1
+
+    def record_migration(self, guests: int = 1):
+        self._day().guest_migrations += guests
+
+    # ---- reports ----
+
+    def _all_workers(self) -> Tuple[float, Dict[str, DayRollup]]:
+        """This worker's rollups merged with the other workers' last snapshots"""
+        since = self.since
+        merged: Dict[str, DayRollup] = {}
+        others = snapshots.peers(self.snapshot_path) if self.snapshot_path else []
+        for data in [self._snapshot()] + others:
+            since = min(since, data["since"])
+            for key, day in data["days"].items():
+                merged.setdefault(key, DayRollup()).merge(DayRollup.from_dict(day))
+        return since, merged
+
+    def report(self, days: int = 30) -> Dict[str, Any]:
+        """Per-day series and window totals for the last `days` days across all workers, oldest first"""
+        start = (datetime.now(timezone.utc).date() - timedelta(days=max(1, days) - 1)).isoformat()
+        since, merged = self._all_workers()
+        window = [(key, merged[key]) for key in sorted(merged) if key >= start]
+        readers = HyperLogLog()
+        book_opens: Counter = Counter()
+        category_opens: Counter = Counter()
+        signups: Counter = Counter()
+        series: List[Dict[str, Any]] = []
+        for key, day in window:
+            readers.merge(day.readers)
+            book_opens.update(day.book_opens)
+            category_opens.update(day.category_opens)
+            signups.update(day.signups)
+            series.append({"date": key, "active_readers": day.readers.count(),
+                           **{name: getattr(day, name) for name in DayRollup.COUNTERS},
+                           "signups": dict(day.signups)})
+        totals = {name: sum(getattr(day, name) for _, day in window) for name in DayRollup.COUNTERS}
+        guests = signups.get("guest", 0)
+        return {
+            "since": datetime.fromtimestamp(since, timezone.utc).isoformat(),
+            "days": series,
+            "totals": {"active_readers": readers.count(), **totals, "signups": dict(signups)},
+            "guest_conversion_rate": round(totals["guest_migrations"] / guests, 4) if guests else None,
+            "top_books": [{"book_id": book_id, "opens": opens} for book_id, opens in book_opens.most_common(TOP_BOOKS)],
+            "opens_by_category": dict(category_opens.most_common()),
+        }
+
+    # ---- persistence ----
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {"since": self.since, "days": {k: d.to_dict() for k, d in self.days.items()}}
+
+    def save(self, background: bool = True):
+        self._saved = time.monotonic()
+        if self.snapshot_path:
+            snapshots.save(self.snapshot_path, self._snapshot(), "analytics", background)
+
+    def load(self):
+        """Merge the snapshots of workers that have stopped"""
+        if not self.snapshot_path:
+            return
+        claimed = snapshots.claim(self.snapshot_path, "analytics")
+        for data in claimed:
+            try:
+                self.restore(data["since"], ((k, DayRollup.from_dict(d)) for k, d in data["days"].items()))
+            except (ValueError, KeyError, TypeError):
+                continue
+        if claimed:
+            # Now owned by this worker: don't lose them if it dies before the next save
+            self.save()
+
+    def restore(self, since: float, days: Iterable):
+        self.since = min(self.since, since)
+        for key, day in sorted(days, key=lambda item: item[0]):
+            if key in self.days:
+                self.days[key].merge(day)
+            else:
+                self.days[key] = day
+        self.days = OrderedDict(sorted(self.days.items())[-self.max_days:])
+
+
+analytics = Analytics()
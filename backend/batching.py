@@ -0,0 +1,123 @@
+"""
+Request Batching for Libreya
+DataLoader-style loaders: lookups by key made by concurrent requests within
+one event-loop tick are collected and answered by a single upstream call,
+and results are cached for the rest of the request that asked for them.
+A batch that fails is retried one key at a time, so only the requests for
+the offending keys see the error.
+
+    books = BatchLoader("books", load_books)      # load_books(keys) -> {key: value}
+    book = await books.load(42)
+    several = await books.load_many([1, 2, 3])
+
+The per-request cache lives in a context variable that RequestCacheMiddleware
+sets for each request, so nothing is shared between requests except the
+batched call itself. Outside a request, loads still batch but aren't cached.
+"""
+import asyncio
+import os
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from metrics import Counter, gauge_from
+
+# 0 dispatches on the next loop iteration; a few ms catches requests arriving just after
+BATCH_WINDOW = float(os.getenv("BATCH_WINDOW_MS", "0")) / 1000
+# Keys per upstream call, keeping in.(...) URLs a sane length
+MAX_BATCH = 200
+
+_request_cache: ContextVar[Optional[Dict[Any, Any]]] = ContextVar("libreya_request_cache", default=None)
+
+LoadFunction = Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+
+
+class BatchLoader:
+    def __init__(self, name: str, load: LoadFunction, default: Any = None,
+                 max_batch: int = MAX_BATCH, window: float = BATCH_WINDOW):
+        """load(keys) returns {key: value}; keys it leaves out resolve to `default`"""
+        self.name = name
+        self._load = load
+        self.default = default
+        self.max_batch = max_batch
+        self.window = window
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self.keys = 0
+        self.batches = 0
+        self.cache_hits = 0
+        loaders[name] = self
+
+    async def load(self, key: Hashable) -> Any:
+        cache = _request_cache.get()
+        if cache is not None and (self.name, key) in cache:
+            self.cache_hits += 1
+            return cache[(self.name, key)]
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._pending:
+                if self.window:
+                    loop.call_later(self.window, self._dispatch)
+                else:
+                    loop.call_soon(self._dispatch)
+            future = self._pending[key] = loop.create_future()
+        # Shielded: one request giving up must not cancel the result for the others
+        value = await asyncio.shield(future)
+        if cache is not None:
+            cache[(self.name, key)] = value
+        return value
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch):
+            chunk = keys[start:start + self.max_batch]
+            asyncio.get_running_loop().create_task(self._run({key: pending[key] for key in chunk}))
+
+    async def _run(self, batch: Dict[Hashable, asyncio.Future], retry: bool = True):
+        self.batches += 1
+        if retry:
+            self.keys += len(batch)
+        try:
+            values = await self._load(list(batch))
+        except BaseException as e:
+            if retry and len(batch) > 1 and isinstance(e, Exception):
+                # Key by key, so one bad key can't fail the requests that happened to share its batch
+                await asyncio.gather(*(self._run({key: future}, retry=False) for key, future in batch.items()))
+                return
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key, self.default))
+
+
+class RequestCacheMiddleware:
+    """Pure ASGI middleware giving each request its own loader cache"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _request_cache.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_cache.reset(token)
+
+
+loaders: Dict[str, BatchLoader] = {}
+
+gauge_from("libreya_batch_loads_total", "Batched lookups by loader: keys loaded, upstream batches, cache hits",
+           lambda: {key: value for name, loader in loaders.items()
+                    for key, value in (((name, "keys"), loader.keys), ((name, "batches"), loader.batches),
+                                       ((name, "cache_hits"), loader.cache_hits))},
+           labels=("loader", "kind"), kind=Counter)
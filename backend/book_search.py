@@ -0,0 +1,194 @@
+"""
+In-Book Search for Libreya
+Positional token index of one book's text, built the first time the book is
+searched and kept in memory, so finding a word or phrase doesn't mean sending
+the whole content_body to the client.
+
+Offsets are character positions in the chapter's plain text as the reader
+shows it (text_stats.strip_html of the chapter), and chapters are numbered
+from 0 in the reader's order. A query matches where its words appear next to
+each other, ignoring case and punctuation; quotes around it are optional.
+
+Indexes are evicted least recently used first once their estimated size
+passes SEARCH_INDEX_MEMORY, and are dropped when the book changes through
+the admin API. Each worker keeps its own, expiring after SEARCH_INDEX_TTL so
+changes made elsewhere (the seeder, another worker) are picked up.
+"""
+import asyncio
+import os
+import re
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import Counter, gauge_from
+from text_stats import split_chapters, strip_html
+
+SEARCH_INDEX_MEMORY = int(os.getenv("SEARCH_INDEX_MEMORY_MB", "256")) * 1024 * 1024
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "3600"))
+# Characters of context on each side of a match
+SNIPPET_CONTEXT = 60
+MAX_QUERY_TERMS = 16
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class SearchQueryInvalid(Exception):
+    pass
+
+
+def query_terms(query: str) -> List[str]:
+    terms = [word.casefold() for word in _WORD_RE.findall(query)]
+    if not terms:
+        raise SearchQueryInvalid("Query has no words to search for")
+    if len(terms) > MAX_QUERY_TERMS:
+        raise SearchQueryInvalid(f"Query is limited to {MAX_QUERY_TERMS} words")
+    return terms
+
+
+class BookIndex:
+    """Token positions of one book; position n is the n-th word of the book"""
+
+    def __init__(self, chapters: List[Tuple[str, str]]):
+        self.titles: List[str] = []
+        self.texts: List[str] = []
+        # First position of each chapter, and where each word starts/ends in its chapter
+        self.chapter_starts = array("I")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.postings: Dict[str, array] = {}
+        for title, content in chapters:
+            text = strip_html(content)
+            self.titles.append(title)
+            self.texts.append(text)
+            self.chapter_starts.append(len(self.starts))
+            for match in _WORD_RE.finditer(text):
+                token = match.group().casefold()
+                positions = self.postings.get(token)
+                if positions is None:
+                    positions = self.postings[token] = array("I")
+                positions.append(len(self.starts))
+                self.starts.append(match.start())
+                self.ends.append(match.end())
+        self.size = (sum(sys.getsizeof(text) for text in self.texts)
+                     + sum(sys.getsizeof(token) + 64 + 4 * len(positions)
+                           for token, positions in self.postings.items())
+                     + 8 * len(self.starts))
+
+    def find(self, terms: List[str]) -> List[int]:
+        """Positions where the phrase starts, in reading order"""
+        lists = []
+        for k, term in enumerate(terms):
+            positions = self.postings.get(term)
+            if positions is None:
+                return []
+            lists.append((len(positions), k, positions))
+        lists.sort()
+        _, k, positions = lists[0]
+        found = {p - k for p in positions}
+        for _, k, positions in lists[1:]:
+            found.intersection_update(p - k for p in positions)
+            if not found:
+                return []
+        # A phrase doesn't run across a chapter boundary
+        last = len(terms) - 1
+        return sorted(p for p in found
+                      if bisect_right(self.chapter_starts, p) == bisect_right(self.chapter_starts, p + last))
+
+    def match(self, position: int, length: int) -> Dict[str, Any]:
+        chapter = bisect_right(self.chapter_starts, position) - 1
+        text = self.texts[chapter]
+        start, end = self.starts[position], self.ends[position + length - 1]
+        before = max(0, start - SNIPPET_CONTEXT)
+        after = min(len(text), end + SNIPPET_CONTEXT)
+        snippet = " ".join(text[before:after].split())
+        return {
+            "chapter": chapter,
+            "chapter_title": self.titles[chapter],
+            "offset": start,
+            "length": end - start,
+            "snippet": ("…" if before else "") + snippet + ("…" if after < len(text) else ""),
+        }
+
+
+# Loads (title, content_body) of a book, or None when it doesn't exist
+BookLoader = Callable[[int], Awaitable[Optional[Tuple[str, str]]]]
+
+
+class SearchIndexCache:
+    def __init__(self, max_bytes: int = SEARCH_INDEX_MEMORY, ttl: float = SEARCH_INDEX_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # book_id -> (built at, index), least recently used first
+        self.indexes: "OrderedDict[int, Tuple[float, BookIndex]]" = OrderedDict()
+        self.bytes = 0
+        self.builds = 0
+        self.hits = 0
+        self.evictions = 0
+        self._building: Dict[int, asyncio.Future] = {}
+
+    async def get(self, book_id: int, load: BookLoader) -> Optional[BookIndex]:
+        """The book's index, built once even when many requests ask at the same time"""
+        entry = self.indexes.get(book_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self.indexes.move_to_end(book_id)
+            self.hits += 1
+            return entry[1]
+        building = self._building.get(book_id)
+        if building is None:
+            building = self._building[book_id] = asyncio.ensure_future(self._build(book_id, load))
+        # Shielded: one request giving up must not cancel the build for the others
+        return await asyncio.shield(building)
+
+    async def _build(self, book_id: int, load: BookLoader) -> Optional[BookIndex]:
+        task = asyncio.current_task()
+        try:
+            book = await load(book_id)
+            if book is None:
+                return None
+            title, content = book
+            # Indexing a long book takes a while; keep the event loop free meanwhile
+            index = await asyncio.to_thread(BookIndex, split_chapters(content, title))
+            self.builds += 1
+            # Not cached if the book changed while this build was loading it
+            if self._building.get(book_id) is task:
+                self._drop(book_id)
+                self.indexes[book_id] = (time.monotonic(), index)
+                self.bytes += index.size
+                self._evict()
+            return index
+        finally:
+            if self._building.get(book_id) is task:
+                del self._building[book_id]
+
+    def invalidate(self, book_id: int):
+        """Forget a changed or deleted book; a build in progress is not cached either"""
+        self._drop(book_id)
+        self._building.pop(book_id, None)
+
+    def _drop(self, book_id: int):
+        entry = self.indexes.pop(book_id, None)
+        if entry is not None:
+            self.bytes -= entry[1].size
+
+    def _evict(self):
+        # The newest index stays even if it alone is over the budget
+        while len(self.indexes) > 1 and self.bytes > self.max_bytes:
+            _, (_, index) = self.indexes.popitem(last=False)
+            self.bytes -= index.size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"books": len(self.indexes), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "builds": self.builds, "hits": self.hits, "evictions": self.evictions}
+
+
+search_indexes = SearchIndexCache()
+
+gauge_from("libreya_search_index_bytes", "Estimated memory held by in-book search indexes",
+           lambda: {(): search_indexes.bytes})
+gauge_from("libreya_search_index_builds_total", "In-book search indexes built",
+           lambda: {(): search_indexes.builds}, kind=Counter)
@@ -0,0 +1,219 @@
+"""
+Book Categorization Engine for Libreya
+Scores every category in a single regex pass over title, author, description
+and the opening of the book body, returning weighted multi-labels.
+"""
+import math
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_CATEGORY = "Fiction"
+
+# How much of the body is scanned (characters of plain text)
+BODY_SAMPLE_CHARS = 20000
+
+# Weight of a keyword hit depending on where it was found
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "description": 1.5,
+    "body": 1.0,
+}
+
+# Labels whose share of the total score falls below this are dropped
+MIN_LABEL_SHARE = 0.15
+MAX_LABELS = 3
+
+# Keyword -> weight per category. Keywords are matched on word boundaries,
+# so list the inflections that matter explicitly.
+CATEGORY_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "Poetry": {
+        "poetry": 2.0, "poems": 2.0, "poem": 1.5, "verse": 1.0, "verses": 1.0,
+        "sonnet": 1.5, "sonnets": 1.5, "ode": 1.0, "ballad": 1.0, "ballads": 1.0,
+        "canto": 1.5, "stanza": 1.0, "leaves of grass": 2.0,
+    },
+    "Drama": {
+        "play": 1.0, "plays": 1.0, "tragedy": 1.5, "comedy": 1.5, "drama": 2.0,
+        "act i": 2.0, "act 1": 2.0, "scene i": 1.5, "dramatis personae": 3.0,
+        "exeunt": 2.0, "exit": 0.5, "enter": 0.3,
+    },
+    "Science Fiction": {
+        "science fiction": 3.0, "sci-fi": 3.0, "space": 1.0, "future": 0.5,
+        "robot": 2.0, "robots": 2.0, "martian": 2.5, "martians": 2.5,
+        "mars": 2.0, "moon": 1.0, "worlds": 1.5, "time machine": 3.0,
+        "utopia": 1.5, "invention": 0.5, "scientist": 1.0, "comet": 1.0,
+        "planet": 1.5, "invisible": 1.0,
+    },
+    "Mystery": {
+        "mystery": 2.0, "detective": 2.5, "crime": 1.5, "murder": 1.5,
+        "inspector": 1.0, "sherlock": 3.0, "holmes": 2.0, "clue": 1.0,
+        "scotland yard": 2.0,
+    },
+    "Horror": {
+        "horror": 2.0, "terror": 1.5, "ghost": 1.5, "ghosts": 1.5,
+        "supernatural": 2.0, "vampire": 3.0, "vampires": 3.0, "monster": 1.5,
+        "haunted": 1.5, "corpse": 1.0, "dread": 0.5,
+    },
+    "Adventure": {
+        "adventure": 1.5, "adventures": 1.5, "journey": 1.5, "expedition": 1.5,
+        "voyage": 1.5, "treasure": 2.0, "island": 1.0, "pirate": 2.0,
+        "pirates": 2.0, "ship": 0.5, "jungle": 1.0, "quest": 1.0,
+    },
+    "Romance": {
+        "romance": 2.0, "love": 1.0, "lovers": 1.5, "heart": 0.5,
+        "passion": 1.0, "marriage": 1.0, "married": 0.5, "courtship": 1.5,
+        "suitor": 1.5,
+    },
+    "Philosophy": {
+        "philosophy": 2.5, "ethics": 2.0, "moral": 1.0, "morals": 1.0,
+        "wisdom": 1.0, "meditations": 2.0, "republic": 1.0, "virtue": 1.0,
+        "metaphysics": 2.0, "reason": 0.5,
+    },
+    "Biography": {
+        "biography": 3.0, "life of": 1.5, "autobiography": 3.0, "memoir": 2.5,
+        "memoirs": 1.0, "narrative of the life": 3.0, "i was born": 2.0,
+    },
+    "History": {
+        "history": 1.5, "war": 0.75, "revolution": 1.0, "empire": 1.0,
+        "historical": 1.0, "chronicle": 1.0, "chronicles": 1.0, "dynasty": 1.0,
+    },
+    "Children's Literature": {
+        "children": 1.5, "fairy": 2.0, "fairies": 2.0, "tales for": 2.0,
+        "fairy tales": 3.0, "fables": 2.0, "once upon a time": 2.0,
+        "princess": 1.0, "goblin": 1.5, "wonderland": 2.0,
+    },
+    "Essays": {
+        "essay": 2.0, "essays": 2.0, "reflections": 1.5, "papers": 1.0,
+        "discourse": 1.5, "treatise": 1.5,
+    },
+}
+
+# Priors for prolific authors whose titles say little about the genre
+AUTHOR_HINTS: Dict[str, Dict[str, float]] = {
+    "h.g. wells": {"Science Fiction": 4.0},
+    "jules verne": {"Science Fiction": 2.5, "Adventure": 2.5},
+    "edgar rice burroughs": {"Adventure": 3.0, "Science Fiction": 1.5},
+    "william shakespeare": {"Drama": 5.0},
+    "arthur conan doyle": {"Mystery": 3.0},
+    "wilkie collins": {"Mystery": 2.5},
+    "gaston leroux": {"Mystery": 2.0, "Horror": 1.0},
+    "edgar allan poe": {"Horror": 2.5, "Poetry": 1.0},
+    "bram stoker": {"Horror": 3.0},
+    "mary shelley": {"Horror": 2.0, "Science Fiction": 1.5},
+    "jane austen": {"Romance": 3.0},
+    "charlotte brontë": {"Romance": 2.0},
+    "emily brontë": {"Romance": 2.0},
+    "anne brontë": {"Romance": 1.5},
+    "e. nesbit": {"Children's Literature": 3.0},
+    "george macdonald": {"Children's Literature": 2.5},
+    "lewis carroll": {"Children's Literature": 3.0},
+    "robert louis stevenson": {"Adventure": 2.5},
+    "h. rider haggard": {"Adventure": 3.0},
+    "jack london": {"Adventure": 2.0},
+    "alexandre dumas": {"Adventure": 2.5},
+    "sir walter scott": {"History": 2.0, "Adventure": 1.0},
+    "james fenimore cooper": {"Adventure": 2.5},
+    "friedrich nietzsche": {"Philosophy": 4.0},
+    "plato": {"Philosophy": 4.0},
+    "marcus aurelius": {"Philosophy": 4.0},
+    "homer": {"Poetry": 3.0, "Adventure": 1.0},
+    "john milton": {"Poetry": 3.0},
+    "walt whitman": {"Poetry": 3.0},
+    "dante alighieri": {"Poetry": 3.0},
+    "geoffrey chaucer": {"Poetry": 3.0},
+}
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _trie_regex(words: List[str]) -> str:
+    """
+    Regex alternation shaped like a trie of the given words, so the engine
+    walks shared prefixes once instead of retrying every keyword per position.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        # Longer continuations are tried before accepting the shorter word
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if terminal else body
+
+    return build(trie)
+
+
+def _compile_keywords() -> Tuple["re.Pattern[str]", Dict[str, List[Tuple[str, float]]]]:
+    """Build one trie-shaped regex for every keyword of every category"""
+    index: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword, weight in keywords.items():
+            index[keyword].append((category, weight))
+    # Case-sensitive on purpose: callers lowercase the text once, which is much
+    # cheaper than IGNORECASE matching at every position
+    pattern = re.compile(rf"\b{_trie_regex(list(index))}(?![\w-])")
+    return pattern, dict(index)
+
+
+KEYWORD_PATTERN, KEYWORD_INDEX = _compile_keywords()
+
+
+def _score_field(text: str, field_weight: float, scores: Dict[str, float], saturate: bool = False):
+    """Add keyword hits found in text to the running category scores"""
+    hits: Dict[str, float] = defaultdict(float)
+    for match in KEYWORD_PATTERN.finditer(text.lower()):
+        for category, weight in KEYWORD_INDEX[match.group(0)]:
+            hits[category] += weight
+    for category, value in hits.items():
+        # Long bodies repeat words a lot; log-scale so one frequent word can't dominate
+        scores[category] += field_weight * (math.log1p(value) if saturate else value)
+
+
+def body_sample(content_body: str, limit: int = BODY_SAMPLE_CHARS) -> str:
+    """Plain text of the opening of an HTML book body"""
+    if not content_body:
+        return ""
+    # Over-read before stripping tags so the sample still has ~limit characters of text
+    return _TAG_RE.sub(" ", content_body[: limit * 2])[:limit]
+
+
+def score_categories(title: str, author: str, description: str = "", body: str = "") -> Dict[str, float]:
+    """Raw (unnormalized) score for every category that got at least one hit"""
+    scores: Dict[str, float] = defaultdict(float)
+    _score_field(title or "", FIELD_WEIGHTS["title"], scores)
+    _score_field(description or "", FIELD_WEIGHTS["description"], scores)
+    if body:
+        _score_field(body_sample(body), FIELD_WEIGHTS["body"], scores, saturate=True)
+    for category, weight in AUTHOR_HINTS.get((author or "").strip().lower(), {}).items():
+        scores[category] += weight
+    return dict(scores)
+
+
+def categorize(title: str, author: str, description: str = "", body: str = "") -> List[Tuple[str, float]]:
+    """
+    Weighted labels for a book, best first, weights summing to 1.
+    Falls back to Fiction when nothing matched.
+    """
+    scores = score_categories(title, author, description, body)
+    total = sum(scores.values())
+    if total <= 0:
+        return [(DEFAULT_CATEGORY, 1.0)]
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    labels = [(c, s / total) for c, s in ranked if s / total >= MIN_LABEL_SHARE][:MAX_LABELS]
+    if not labels:
+        labels = [(ranked[0][0], ranked[0][1] / total)]
+    kept = sum(w for _, w in labels)
+    return [(c, round(w / kept, 3)) for c, w in labels]
+
+
+def primary_category(labels: List[Tuple[str, float]]) -> str:
+    """Top label of a categorize() result"""
+    return labels[0][0] if labels else DEFAULT_CATEGORY
@@ -0,0 +1,138 @@
+"""
+Cover Image Cache for Libreya
+Downloads each book cover once, renders fixed-size thumbnail variants and
+keeps them on local disk so the API can serve covers without a third-party hop.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import os
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+# name -> (width, height) bounding box; aspect ratio is preserved
+COVER_SIZES: Dict[str, Tuple[int, int]] = {
+    "thumb": (120, 180),
+    "small": (240, 360),
+    "medium": (480, 720),
+}
+DEFAULT_COVER_SIZE = "thumb"
+
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cover_cache"))
+COVER_MAX_BYTES = 5 * 1024 * 1024
+
+
+class CoverNotFound(Exception):
+    pass
+
+
+class CoverUnavailable(Exception):
+    pass
+
+
+class CoverCache:
+    """Disk cache of resized covers, keyed by book id and size"""
+
+    def __init__(self, directory: str = COVER_CACHE_DIR):
+        self.directory = directory
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _path(self, book_id: int, size: str) -> str:
+        return os.path.join(self.directory, str(book_id), f"{size}.jpg")
+
+    def _read(self, book_id: int, size: str) -> Optional[Tuple[bytes, str]]:
+        path = self._path(book_id, size)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data, _etag(data)
+
+    async def get(self, book_id: int, size: str, source_url_loader) -> Tuple[bytes, str]:
+        """
+        Return (jpeg bytes, etag) for a cover variant, downloading and rendering
+        every variant the first time any of them is asked for.
+        source_url_loader is an async callable returning the book's cover_image.
+        """
+        cached = self._read(book_id, size)
+        if cached:
+            return cached
+
+        # One download per book even when many clients ask at once
+        lock = self._locks.setdefault(book_id, asyncio.Lock())
+        try:
+            async with lock:
+                cached = self._read(book_id, size)
+                if cached:
+                    return cached
+                source = await source_url_loader(book_id)
+                if not source:
+                    raise CoverNotFound(f"Book {book_id} has no cover")
+                original = await _download(source)
+                try:
+                    variants = await asyncio.to_thread(_render_variants, original)
+                except Exception as e:
+                    raise CoverUnavailable(f"Cover for book {book_id} could not be decoded: {e}")
+                for name, data in variants.items():
+                    _write_atomic(self._path(book_id, name), data)
+        finally:
+            self._locks.pop(book_id, None)
+        return variants[size], _etag(variants[size])
+
+    def invalidate(self, book_id: int):
+        """Drop cached variants, e.g. after the cover_image of a book changed"""
+        for name in COVER_SIZES:
+            try:
+                os.remove(self._path(book_id, name))
+            except FileNotFoundError:
+                pass
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.sha1(data).hexdigest() + '"'
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+async def _download(source: str) -> bytes:
+    if source.startswith("data:"):
+        # cover_image may hold a base64 data URL instead of a remote URL
+        try:
+            return base64.b64decode(source.split(",", 1)[1])
+        except (IndexError, ValueError) as e:
+            raise CoverUnavailable(f"Cover data URL is malformed: {e}")
+    try:
+        async with httpx.AsyncClient(timeout=30, follow_redirects=True) as client:
+            response = await client.get(source)
+    except httpx.HTTPError as e:
+        raise CoverUnavailable(f"Cover download failed: {e}")
+    if response.status_code != 200:
+        raise CoverUnavailable(f"Cover download failed with status {response.status_code}")
+    if len(response.content) > COVER_MAX_BYTES:
+        raise CoverUnavailable("Cover image is too large")
+    return response.content
+
+
+def _render_variants(original: bytes) -> Dict[str, bytes]:
+    """Resize the original into every configured size (runs in a worker thread)"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(original)) as image:
+        image = image.convert("RGB")
+        variants = {}
+        for name, box in COVER_SIZES.items():
+            variant = image.copy()
+            variant.thumbnail(box, Image.LANCZOS)
+            out = io.BytesIO()
+            variant.save(out, format="JPEG", quality=82, optimize=True, progressive=True)
+            variants[name] = out.getvalue()
+    return variants
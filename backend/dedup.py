@@ -0,0 +1,117 @@
+"""
+Near-Duplicate Edition Detection for Libreya
+MinHash signatures over word shingles, indexed with LSH banding so a new
+book is only compared against the few existing books that share a band.
+"""
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Signature layout: NUM_BANDS bands of ROWS_PER_BAND values each.
+# With 16 x 4 the LSH candidate threshold sits around Jaccard 0.5.
+NUM_PERM = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+
+SHINGLE_SIZE = 5
+
+# Estimated Jaccard similarity at which two texts count as the same work
+DUPLICATE_THRESHOLD = 0.8
+
+_MAX_HASH = (1 << 64) - 1
+_TAG_RE = re.compile(r"<[^>]+>")
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def shingles(content: str, size: int = SHINGLE_SIZE) -> Iterable[bytes]:
+    """Word n-grams of the plain text of an HTML (or plain) book body"""
+    words = _WORD_RE.findall(_TAG_RE.sub(" ", content).lower())
+    for i in range(max(len(words) - size + 1, 1)):
+        yield " ".join(words[i:i + size]).encode()
+
+
+def minhash(content: str, num_perm: int = NUM_PERM) -> List[int]:
+    """
+    One-permutation MinHash: every shingle is hashed once and lands in one of
+    num_perm bins, each bin keeping its minimum. Empty bins are filled from the
+    next non-empty bin (rotation densification) so signatures stay comparable.
+    """
+    bins: List[Optional[int]] = [None] * num_perm
+    for shingle in shingles(content):
+        h = _hash64(shingle)
+        slot, value = h % num_perm, h // num_perm
+        current = bins[slot]
+        if current is None or value < current:
+            bins[slot] = value
+
+    if all(b is None for b in bins):
+        return [_MAX_HASH] * num_perm
+
+    signature: List[int] = []
+    for i in range(num_perm):
+        offset = 0
+        while bins[(i + offset) % num_perm] is None:
+            offset += 1
+        # Offset the borrowed value so densified bins don't all collide
+        signature.append((bins[(i + offset) % num_perm] + offset * (_MAX_HASH // num_perm)) & _MAX_HASH)
+    return signature
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def band_keys(signature: List[int]) -> List[str]:
+    """LSH bucket keys for a signature, one per band"""
+    keys = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(",".join(map(str, rows)).encode(), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+class LSHIndex:
+    """In-memory LSH index of book signatures"""
+
+    def __init__(self):
+        self.signatures: Dict[int, List[int]] = {}
+        self.buckets: Dict[str, Set[int]] = defaultdict(set)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, book_id: int, signature: List[int]):
+        self.signatures[book_id] = signature
+        for key in band_keys(signature):
+            self.buckets[key].add(book_id)
+
+    def query(self, signature: List[int], threshold: float = DUPLICATE_THRESHOLD) -> List[Tuple[int, float]]:
+        """Existing books similar to the signature, most similar first"""
+        candidates: Set[int] = set()
+        for key in band_keys(signature):
+            candidates |= self.buckets.get(key, set())
+        matches = [(book_id, similarity(signature, self.signatures[book_id])) for book_id in candidates]
+        return sorted((m for m in matches if m[1] >= threshold), key=lambda m: m[1], reverse=True)
+
+
+def fingerprint_row(book_id: int, signature: List[int]) -> dict:
+    """Row for the book_fingerprints table"""
+    # Stored as strings: 64-bit unsigned values don't fit a signed BIGINT
+    return {
+        "book_id": book_id,
+        "signature": [str(v) for v in signature],
+        "bands": band_keys(signature),
+    }
+
+
+def signature_from_row(row: dict) -> List[int]:
+    return [int(v) for v in row.get("signature") or []]
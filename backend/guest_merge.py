@@ -0,0 +1,76 @@
+"""
+Guest Migration Merge for Libreya
+Folds the reading activity of guest accounts into registered accounts.
+
+user_activity is unique on (user_id, book_id), so moving a guest's rows onto
+an account that already has a row for the same book can't be a plain update.
+merge_activity() computes, in one pass over both users' rows, the final row
+of every affected (user, book): the furthest position, favorite if either
+was, legacy highlights unioned without duplicates. The caller writes them with
+one upsert on (user_id, book_id) and then deletes the guests' rows.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+
+Row = Dict[str, Any]
+
+# Columns written by the upsert; every row carries all of them, as a bulk insert needs
+MERGED_COLUMNS = ("user_id", "book_id", "last_position", "is_favorite", "highlights",
+                  "chapter_read_count", "created_at", "updated_at")
+
+
+def _highlight_key(highlight: Any) -> str:
+    return json.dumps(highlight, sort_keys=True, default=str)
+
+
+def merge_rows(target: Row, guest: Row) -> Row:
+    """One account's row for a book, combined with the guest's row for the same book"""
+    highlights = list(target.get("highlights") or [])
+    seen = {_highlight_key(h) for h in highlights}
+    for highlight in guest.get("highlights") or []:
+        key = _highlight_key(highlight)
+        if key not in seen:
+            seen.add(key)
+            highlights.append(highlight)
+    created = [r.get("created_at") for r in (target, guest) if r.get("created_at")]
+    updated = [r.get("updated_at") for r in (target, guest) if r.get("updated_at")]
+    return {
+        "user_id": target["user_id"],
+        "book_id": target["book_id"],
+        "last_position": max(target.get("last_position") or 0.0, guest.get("last_position") or 0.0),
+        "is_favorite": bool(target.get("is_favorite") or guest.get("is_favorite")),
+        "highlights": highlights,
+        "chapter_read_count": max(target.get("chapter_read_count") or 0, guest.get("chapter_read_count") or 0),
+        "created_at": min(created) if created else None,
+        "updated_at": max(updated) if updated else None,
+    }
+
+
+def merge_activity(pairs: Iterable[Tuple[str, str]], rows: Iterable[Row]) -> Tuple[List[Row], int]:
+    """
+    pairs are (guest_id, new_user_id); rows are the current activity rows of all
+    of them. Returns the rows to upsert and how many collided with an existing row.
+    Several guests may fold into the same account.
+    """
+    target_of = dict(pairs)
+    by_key: Dict[Tuple[str, Any], Row] = {}
+    guest_rows: List[Row] = []
+    for row in rows:
+        if row["user_id"] in target_of:
+            guest_rows.append(row)
+        else:
+            by_key[(row["user_id"], row["book_id"])] = row
+
+    merged: Dict[Tuple[str, Any], Row] = {}
+    collisions = 0
+    for row in guest_rows:
+        key = (target_of[row["user_id"]], row["book_id"])
+        current = merged.get(key) or by_key.get(key)
+        if current is None:
+            merged[key] = {column: row.get(column) for column in MERGED_COLUMNS}
+            merged[key]["user_id"] = key[0]
+            merged[key]["highlights"] = list(row.get("highlights") or [])
+        else:
+            collisions += 1
+            merged[key] = merge_rows({**current, "user_id": key[0]}, row)
+    return list(merged.values()), collisions
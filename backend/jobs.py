@@ -0,0 +1,298 @@
+"""
+Background Jobs for Libreya
+A small in-process job runner for long admin operations: a bounded queue,
+a fixed number of worker tasks, progress reporting, cooperative cancellation
+and job state persisted as JSON files so it survives restarts and can be read
+by every worker process on the host.
+
+A job runs in the process it was submitted to, and only that process writes
+its file. Any other process can list it, and cancels it by dropping a
+<id>.cancel flag file next to it, which the owner picks up the next time it
+persists progress (or before starting a queued job).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("LIBREYA_JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jobs"))
+JOB_WORKERS = int(os.getenv("LIBREYA_JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("LIBREYA_JOB_QUEUE_SIZE", "100"))
+# Finished jobs kept on disk; older ones are pruned
+JOB_HISTORY = 200
+# Progress is persisted at most this often
+PERSIST_INTERVAL = 1.0
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, INTERRUPTED = (
+    "queued", "running", "succeeded", "failed", "cancelled", "interrupted")
+FINISHED = {SUCCEEDED, FAILED, CANCELLED, INTERRUPTED}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, params: Dict[str, Any], job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.state = QUEUED
+        self.done = 0
+        self.total: Optional[int] = None
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self._persisted = 0.0
+        self._runner: Optional["JobRunner"] = None
+
+    @property
+    def progress(self) -> float:
+        if self.state == SUCCEEDED:
+            return 100.0
+        if not self.total:
+            return 0.0
+        return round(min(100.0, 100.0 * self.done / self.total), 1)
+
+    def update(self, done: int, total: Optional[int] = None, message: str = "", check: bool = True):
+        """
+        Report progress from inside a job. Raises JobCancelled once cancellation
+        was requested, unless check is False (steps that must not stop halfway).
+        """
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message:
+            self.message = message
+        if self._runner and time.monotonic() - self._persisted >= PERSIST_INTERVAL:
+            if self._runner.cancel_flagged(self.id):
+                self.cancel_requested = True
+            self._runner.persist(self)
+        if check:
+            self.check()
+
+    def check(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "kind": self.kind, "params": self.params, "state": self.state,
+            "progress": self.progress, "done": self.done, "total": self.total, "message": self.message,
+            "result": self.result, "error": self.error, "created_at": self.created_at,
+            "started_at": self.started_at, "finished_at": self.finished_at,
+            "cancel_requested": self.cancel_requested,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        job = cls(data["kind"], data.get("params") or {}, data["id"])
+        for name in ("state", "done", "total", "message", "result", "error", "created_at",
+                     "started_at", "finished_at", "cancel_requested"):
+            setattr(job, name, data.get(name, getattr(job, name)))
+        return job
+
+
+JobFunction = Callable[..., Awaitable[Any]]
+
+
+class JobRunner:
+    def __init__(self, directory: str = JOBS_DIR, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE):
+        self.directory = directory
+        self.workers = workers
+        self.queue_size = queue_size
+        self.kinds: Dict[str, JobFunction] = {}
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    def register(self, kind: str, function: JobFunction):
+        """function(job, **params) runs the job and returns a JSON-serializable result"""
+        self.kinds[kind] = function
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _cancel_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.cancel")
+
+    def cancel_flagged(self, job_id: str) -> bool:
+        """Whether another process asked for the job to be cancelled"""
+        return os.path.exists(self._cancel_path(job_id))
+
+    def _read(self, job_id: str) -> Optional[Job]:
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return Job.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def persist(self, job: Job):
+        job._persisted = time.monotonic()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._path(job.id) + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(job.to_dict(), f, default=str)
+            os.replace(tmp, self._path(job.id))
+        except OSError as e:
+            logger.warning("could not persist job %s: %s", job.id, e)
+
+    def load(self):
+        """Pick up persisted jobs; ones that were queued or running when the process stopped are interrupted"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.state not in FINISHED:
+                job.state, job.finished_at = INTERRUPTED, time.time()
+                self.persist(job)
+            self.jobs[job.id] = job
+        self._prune()
+
+    def _prune(self):
+        finished = sorted((j for j in self.jobs.values() if j.state in FINISHED), key=lambda j: j.created_at)
+        for job in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job.id]
+            for path in (self._path(job.id), self._cancel_path(job.id)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            return
+        self._loop = loop
+        self._stopping = False
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        self._stopping = True
+        for job in self.jobs.values():
+            if job.state == RUNNING:
+                job.cancel_requested = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self.jobs.values():
+            if job.state not in FINISHED:
+                job.state, job.finished_at = INTERRUPTED, time.time()
+                self.persist(job)
+
+    def submit(self, kind: str, **params) -> Job:
+        if kind not in self.kinds:
+            raise KeyError(kind)
+        self.start()
+        job = Job(kind, params)
+        job._runner = self
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull("Too many background jobs queued")
+        self.jobs[job.id] = job
+        self.persist(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        # Not ours: possibly started by another worker process sharing the directory
+        return self.jobs.get(job_id) or self._read(job_id)
+
+    def list(self, limit: int = 50) -> List[Job]:
+        """Jobs of every process sharing the directory, newest first"""
+        jobs = dict(self.jobs)
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                job_id = name[:-len(".json")]
+                if name.endswith(".json") and job_id not in jobs:
+                    job = self._read(job_id)
+                    if job is not None:
+                        jobs[job_id] = job
+        return sorted(jobs.values(), key=lambda j: j.created_at, reverse=True)[:limit]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = self._read(job_id)
+            if job is not None and job.state not in FINISHED:
+                # Run by another process: it sees the flag on its next persist
+                try:
+                    with open(self._cancel_path(job_id), "w"):
+                        pass
+                except OSError as e:
+                    logger.warning("could not flag job %s for cancellation: %s", job_id, e)
+                    return job
+                job.cancel_requested = True
+            return job
+        if job.state in FINISHED:
+            return job
+        job.cancel_requested = True
+        if job.state == QUEUED:
+            job.state, job.finished_at = CANCELLED, time.time()
+        self.persist(job)
+        return job
+
+    async def _work(self):
+        # Checked between jobs too: the HTTP stack can swallow the cancellation of a running job
+        while not self._stopping:
+            job = await self._queue.get()
+            try:
+                if job.state == QUEUED and self.cancel_flagged(job.id):
+                    job.cancel_requested = True
+                    job.state, job.finished_at = CANCELLED, time.time()
+                    self.persist(job)
+                elif job.state == QUEUED:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.state, job.started_at = RUNNING, time.time()
+        self.persist(job)
+        try:
+            job.result = await self.kinds[job.kind](job, **job.params)
+            job.state = SUCCEEDED
+        except JobCancelled:
+            job.state = CANCELLED
+        except asyncio.CancelledError:
+            job.state = INTERRUPTED
+            raise
+        except Exception as e:
+            logger.exception("job %s (%s) failed", job.id, job.kind)
+            job.state, job.error = FAILED, f"{type(e).__name__}: {e}"
+        finally:
+            job.finished_at = time.time()
+            self.persist(job)
+            self._prune()
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize() if self._queue else 0, "states": states}
@@ -0,0 +1,59 @@
+"""
+Libreya launcher
+`python server.py` runs one uvicorn worker, like before. With --workers N,
+this process becomes the supervisor and the catalog loader: it publishes the
+shared catalog snapshot before the workers start and keeps it fresh while
+they serve.
+"""
+import argparse
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from shared_catalog import CatalogLoader
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Libreya API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="Worker processes (default: $WEB_CONCURRENCY or 1)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--shared-catalog", action=argparse.BooleanOptionalAction, default=None,
+                        help="Serve catalog reads from a shared snapshot (default: on with more than one worker)")
+    parser.add_argument("--catalog-refresh", type=float, default=float(os.getenv("LIBREYA_CATALOG_REFRESH", "30")),
+                        help="Seconds between catalog snapshots")
+    return parser.parse_args(argv)
+
+
+def main(supabase_url: str, headers: Dict[str, str], argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    shared = args.shared_catalog if args.shared_catalog is not None else args.workers > 1
+
+    loader = None
+    if shared:
+        path = os.getenv("LIBREYA_SHARED_CATALOG") or os.path.join(
+            tempfile.gettempdir(), f"libreya-catalog-{os.getpid()}.seg")
+        # Inherited by the spawned workers
+        os.environ["LIBREYA_SHARED_CATALOG"] = path
+        loader = CatalogLoader(path, supabase_url, headers, args.catalog_refresh)
+        if not loader.refresh():
+            logger.warning("starting without a catalog snapshot; workers read from Supabase until one is published")
+        loader.start()
+
+    try:
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+    finally:
+        if loader is not None:
+            loader.stop()
+            for leftover in (loader.path, loader.path + ".dirty"):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
@@ -0,0 +1,233 @@
+"""
+Metrics for Libreya
+Minimal in-process Prometheus-style counters, gauges and histograms, an ASGI
+middleware timing every request by route template, and an httpx transport
+timing every Supabase call by table and operation.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import httpx
+
+from resilience import table_of
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last)..., sum]
+        self.values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        # Called before rendering to refresh gauges that mirror other state
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            try:
+                collect()
+            except Exception:
+                pass
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "libreya_http_requests_total", "HTTP requests handled", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "libreya_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")))
+http_response_bytes = registry.register(Histogram(
+    "libreya_http_response_bytes", "HTTP response body size", ("route",), SIZE_BUCKETS))
+http_in_flight = registry.register(Gauge(
+    "libreya_http_requests_in_flight", "HTTP requests currently being handled"))
+
+upstream_latency = registry.register(Histogram(
+    "libreya_upstream_request_duration_seconds", "Supabase request latency per attempt, including body read",
+    ("table", "operation", "status")))
+upstream_response_bytes = registry.register(Histogram(
+    "libreya_upstream_response_bytes", "Supabase response body size", ("table", "operation"), SIZE_BUCKETS))
+upstream_request_bytes = registry.register(Histogram(
+    "libreya_upstream_request_bytes", "Supabase request body size", ("table", "operation"), SIZE_BUCKETS))
+upstream_in_flight = registry.register(Gauge(
+    "libreya_upstream_requests_in_flight", "Supabase requests currently on the wire", ("table",)))
+upstream_queue_wait = registry.register(Histogram(
+    "libreya_upstream_queue_wait_seconds", "Time spent waiting for an upstream slot"))
+
+OPERATIONS = {"GET": "select", "HEAD": "select", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """Times each Supabase attempt from send until the body has been read"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        table = table_of(request)
+        operation = OPERATIONS.get(request.method, request.method.lower())
+        if request.method == "POST" and "merge-duplicates" in request.headers.get("prefer", ""):
+            operation = "upsert"
+        upstream_in_flight.inc(table)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.inner.handle_async_request(request)
+            await response.aread()
+            status = str(response.status_code)
+            upstream_response_bytes.observe(len(response.content), table, operation)
+            return response
+        finally:
+            upstream_latency.observe(time.perf_counter() - started, table, operation, status)
+            upstream_in_flight.dec(table)
+            body = request.content if request.method in ("POST", "PATCH") else b""
+            if body:
+                upstream_request_bytes.observe(len(body), table, operation)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware so streaming responses are timed to their last byte"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        state = {"status": "500", "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = str(message["status"])
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            # Route templates keep label cardinality bounded
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc(method, path, state["status"])
+            http_latency.observe(time.perf_counter() - started, method, path, state["status"])
+            http_response_bytes.observe(state["bytes"], path)
+
+
+def gauge_from(name: str, documentation: str, read: Callable[[], Dict[LabelValues, float]],
+               labels: Iterable[str] = (), kind=Gauge) -> Counter:
+    """Register a gauge (or counter) whose series are read from other state at scrape time"""
+    gauge = registry.register(kind(name, documentation, labels))
+
+    def collect():
+        gauge.values = dict(read())
+    registry.collectors.append(collect)
+    return gauge
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render() -> str:
+    return registry.render()
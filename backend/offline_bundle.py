@@ -0,0 +1,90 @@
+"""
+Offline Bundles for Libreya
+A user's library packed into one zip for reading offline, written member by
+member into a write-only sink that is drained after each book, so the
+response streams while it is produced and only one book is held at a time.
+
+Layout:
+
+    books/<id>/chapters/0000.html   chapter HTML, split like the reader does
+    books/<id>/metadata.json        list columns, updated_at and the chapter index
+    activity.json                   the user's activity rows and highlights
+    manifest.json                   version, library and the books in this bundle
+
+A bundle's version is the time it was generated. Asked for with
+since=<version of an earlier bundle>, a delta bundle carries only the books
+whose content changed after that, plus those missing from have=<the book ids
+the client holds>; "library" in the manifest always lists every book the
+user should have, so the client drops the ones no longer in it.
+"""
+import json
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from text_stats import split_chapters
+
+BUNDLE_FORMAT = 1
+COMPRESS_LEVEL = 6
+
+
+class BundleVersionInvalid(Exception):
+    pass
+
+
+def parse_version(version: str) -> datetime:
+    """A bundle version as a naive UTC datetime, like the timestamps the API writes"""
+    try:
+        parsed = datetime.fromisoformat(version.strip())
+    except ValueError:
+        raise BundleVersionInvalid(f"Not a bundle version: {version!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class _Sink:
+    """Write-only file object; ZipFile falls back to streaming mode for it"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class BundleWriter:
+    """Each method adds members and returns the archive bytes produced so far"""
+
+    def __init__(self, compresslevel: int = COMPRESS_LEVEL):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+
+    def add_json(self, name: str, data: Any) -> bytes:
+        self._zip.writestr(name, json.dumps(data, separators=(",", ":"), default=str))
+        return self._sink.drain()
+
+    def add_book(self, book: Dict[str, Any]) -> bytes:
+        """Write a book row holding content_body as chapters plus metadata"""
+        prefix = f"books/{book['id']}"
+        chapters = []
+        for n, (title, content) in enumerate(split_chapters(book.get("content_body"), book.get("title") or "Book")):
+            path = f"{prefix}/chapters/{n:04d}.html"
+            self._zip.writestr(path, content)
+            chapters.append({"index": n, "title": title, "path": path})
+        metadata = {key: value for key, value in book.items() if key != "content_body"}
+        metadata["chapters"] = chapters
+        return self.add_json(f"{prefix}/metadata.json", metadata)
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
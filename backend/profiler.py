@@ -0,0 +1,227 @@
+"""
+On-Demand Profiler for Libreya
+A sampling profiler of the event loop thread that admins switch on for a few
+seconds or for the next N matching requests, plus per-request traces that
+split upstream time from time spent in-process.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+
+import httpx
+
+from resilience import table_of
+
+MAX_SESSION_SECONDS = 120
+MAX_TRACES = 1000
+MAX_STACK_DEPTH = 64
+
+current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+
+
+class RequestTrace:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.queue_wait = 0.0
+        self.upstream = 0.0
+        self.calls: List[dict] = []
+
+    def add_upstream(self, table: str, operation: str, status: str, seconds: float):
+        self.upstream += seconds
+        self.calls.append({"table": table, "operation": operation, "status": status, "ms": round(seconds * 1000, 3)})
+
+    def finish(self, status):
+        self.status = status
+        self.wall = time.perf_counter() - self.started
+        self.cpu = time.thread_time() - self.cpu_started
+
+    def to_dict(self) -> dict:
+        # Calls may overlap (asyncio.gather), so upstream time can exceed wall time.
+        # cpu_ms is loop-thread CPU while the request was open, so it also
+        # includes whatever concurrent requests ran in between.
+        in_process = max(0.0, self.wall - self.upstream - self.queue_wait)
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "wall_ms": round(self.wall * 1000, 3),
+            "upstream_ms": round(self.upstream * 1000, 3),
+            "queue_wait_ms": round(self.queue_wait * 1000, 3),
+            "in_process_ms": round(in_process * 1000, 3),
+            "cpu_ms": round(self.cpu * 1000, 3),
+            "upstream_calls": self.calls,
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """One profiling run: stack samples of the loop thread plus request traces"""
+
+    def __init__(self, seconds: float, requests: int, path_prefix: str, interval: float):
+        self.seconds = min(seconds, MAX_SESSION_SECONDS)
+        self.requests = requests
+        self.path_prefix = path_prefix
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.traces: List[dict] = []
+        self.matched = 0
+        self.started_at = time.time()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._done: Optional[asyncio.Event] = None
+        self._sampler: Optional[threading.Thread] = None
+
+    def matches(self, path: str) -> bool:
+        return path.startswith(self.path_prefix)
+
+    def start(self):
+        self._done = asyncio.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="libreya-profiler", daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def record(self, trace: RequestTrace):
+        self.matched += 1
+        if len(self.traces) < MAX_TRACES:
+            self.traces.append(trace.to_dict())
+        if self.requests and self.matched >= self.requests:
+            self._done.set()
+
+    async def wait(self):
+        """Run until the time budget is used or enough requests were traced"""
+        try:
+            await asyncio.wait_for(self._done.wait(), self.seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._stop.set()
+            await asyncio.to_thread(self._sampler.join)
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, readable by flamegraph.pl and speedscope"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self) -> dict:
+        traces = self.traces
+        totals = {
+            key: round(sum(t[key] for t in traces), 3)
+            for key in ("wall_ms", "upstream_ms", "queue_wait_ms", "in_process_ms", "cpu_ms")
+        }
+        return {
+            "started_at": self.started_at,
+            "duration_s": round(time.time() - self.started_at, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "path_prefix": self.path_prefix,
+            "requests_traced": self.matched,
+            "totals": totals,
+            "top_stacks": [{"stack": s, "samples": c} for s, c in self.stacks.most_common(20)],
+            "traces": traces,
+        }
+
+
+class Profiler:
+    """Holds the (single) active session"""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+
+    def begin(self, seconds: float, requests: int, path_prefix: str, interval: float) -> ProfileSession:
+        if self.session is not None:
+            raise RuntimeError("A profiling session is already running")
+        session = ProfileSession(seconds, requests, path_prefix, interval)
+        session.start()
+        self.session = session
+        return session
+
+    def end(self, session: ProfileSession):
+        if self.session is session:
+            self.session = None
+
+
+profiler = Profiler()
+
+
+def on_queue_wait(seconds: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.queue_wait += seconds
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Adds each upstream attempt to the trace of the request being profiled"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        trace = current_trace.get()
+        if trace is None:
+            return await self.inner.handle_async_request(request)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.inner.handle_async_request(request)
+            await response.aread()
+            status = str(response.status_code)
+            return response
+        finally:
+            trace.add_upstream(table_of(request), request.method, status, time.perf_counter() - started)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ProfilerMiddleware:
+    """Traces requests matching the active session; a no-op check otherwise"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        session = profiler.session
+        if scope["type"] != "http" or session is None or not session.matches(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace(scope.get("method", ""), scope["path"])
+        token = current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            trace.finish(status["code"])
+            session.record(trace)
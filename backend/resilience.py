@@ -0,0 +1,313 @@
+"""
+Upstream Resilience for Libreya
+Jittered retries for idempotent reads, a circuit breaker per Supabase table
+and a stale-while-revalidate cache for public reads, applied as an httpx
+transport layer around the admission-controlled transport.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.1"))
+RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "1.0"))
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("UPSTREAM_BREAKER_RESET", "15"))
+
+# table -> (fresh seconds, max stale seconds). Within the fresh window the cached
+# response is served directly; after it, the cache is served while a background
+# request revalidates it; during an outage anything up to max stale is served.
+# Only public tables are listed: user data is never served stale.
+STALE_POLICIES: Dict[str, Tuple[float, float]] = {
+    "books": (float(os.getenv("STALE_BOOKS_FRESH", "0")), float(os.getenv("STALE_BOOKS_MAX", "86400"))),
+    "app_settings": (float(os.getenv("STALE_SETTINGS_FRESH", "15")), float(os.getenv("STALE_SETTINGS_MAX", "86400"))),
+}
+STALE_CACHE_MAX_BYTES = int(os.getenv("STALE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+STALE_HEADER = "X-Libreya-Stale"
+
+
+class UpstreamUnavailable(Exception):
+    """Upstream failed (or its breaker is open) and nothing stale could be served"""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+def table_of(request: httpx.Request) -> str:
+    """Supabase table (or service) a request is addressed to"""
+    path = request.url.path
+    if path.startswith("/rest/v1/"):
+        return path[len("/rest/v1/"):].split("/", 1)[0] or "rest"
+    return path.strip("/").split("/", 1)[0] or "root"
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open probe -> closed"""
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open" and not self.probing:
+            # Exactly one request probes the upstream
+            self.probing = True
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def release_probe(self):
+        """The probe never reached upstream (shed or cancelled): let the next request probe instead"""
+        if self.state == "half_open":
+            self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
+
+class StaleEntry:
+    __slots__ = ("status", "headers", "content", "stored_at")
+
+    def __init__(self, response: httpx.Response, content: bytes):
+        self.status = response.status_code
+        self.headers = [(k, v) for k, v in response.headers.items()
+                        if k.lower() not in ("content-length", "content-encoding", "transfer-encoding")]
+        self.content = content
+        self.stored_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+    def to_response(self, request: httpx.Request, stale: bool) -> httpx.Response:
+        headers = list(self.headers)
+        if stale:
+            headers.append((STALE_HEADER, str(int(self.age()))))
+        return httpx.Response(self.status, headers=headers, content=self.content, request=request)
+
+
+class StaleCache:
+    """Last good response per URL, LRU-bounded by total body size"""
+
+    def __init__(self, max_bytes: int = STALE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, StaleEntry]" = OrderedDict()
+        self.hits = 0
+        self.stale_served = 0
+
+    def get(self, key: str) -> Optional[StaleEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, response: httpx.Response):
+        content = response.content
+        if len(content) > self.max_bytes // 8:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old.content)
+        self._entries[key] = StaleEntry(response, content)
+        self.size += len(content)
+        while self.size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.content)
+
+    def invalidate_table(self, table: str):
+        prefix = f"/rest/v1/{table}"
+        for key in [k for k in self._entries if prefix in k]:
+            self.size -= len(self._entries.pop(key).content)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "stale_served": self.stale_served}
+
+
+class Resilience:
+    """
+    Retry, breaker and stale-cache state shared by every upstream client.
+    Lives outside the transport so it survives the client being recreated.
+    """
+
+    def __init__(self, attempts: int = RETRY_ATTEMPTS,
+                 base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY,
+                 breaker_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 breaker_reset: float = BREAKER_RESET_TIMEOUT,
+                 policies: Optional[Dict[str, Tuple[float, float]]] = None,
+                 cache: Optional[StaleCache] = None):
+        self.attempts = attempts
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.policies = STALE_POLICIES if policies is None else policies
+        self.cache = cache or StaleCache()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self._revalidating: set = set()
+        # Strong references to the refresh tasks; the loop only keeps weak ones
+        self._refreshes: set = set()
+
+    def breaker(self, table: str) -> CircuitBreaker:
+        breaker = self.breakers.get(table)
+        if breaker is None:
+            breaker = self.breakers[table] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def _cache_key(self, request: httpx.Request) -> Optional[str]:
+        if request.method != "GET" or table_of(request) not in self.policies:
+            return None
+        return str(request.url)
+
+    async def handle(self, inner: httpx.AsyncBaseTransport, request: httpx.Request) -> httpx.Response:
+        table = table_of(request)
+        key = self._cache_key(request)
+        entry = self.cache.get(key) if key else None
+
+        if entry is not None:
+            fresh_for, _ = self.policies[table]
+            if entry.age() < fresh_for:
+                self.cache.hits += 1
+                return entry.to_response(request, stale=False)
+            if fresh_for > 0 and self.breaker(table).state == "closed":
+                # Serve stale now, refresh behind the caller's back
+                self._revalidate(inner, request, key)
+                self.cache.hits += 1
+                return entry.to_response(request, stale=True)
+
+        try:
+            response = await self._send(inner, request, table)
+        except UpstreamUnavailable:
+            stale = self._stale_fallback(request, table, entry)
+            if stale is not None:
+                return stale
+            raise
+
+        if key and response.status_code == 200:
+            self.cache.put(key, response)
+        elif response.status_code >= 500 or response.status_code == 429:
+            stale = self._stale_fallback(request, table, entry)
+            if stale is not None:
+                return stale
+        elif request.method != "GET" and table in self.policies and response.status_code < 400:
+            # A write to a cached table makes its fresh-window entries wrong
+            if self.policies[table][0] > 0:
+                self.cache.invalidate_table(table)
+        return response
+
+    def _stale_fallback(self, request: httpx.Request, table: str, entry: Optional[StaleEntry]) -> Optional[httpx.Response]:
+        if entry is None:
+            return None
+        if entry.age() > self.policies[table][1]:
+            return None
+        self.cache.stale_served += 1
+        return entry.to_response(request, stale=True)
+
+    async def _send(self, inner: httpx.AsyncBaseTransport, request: httpx.Request, table: str) -> httpx.Response:
+        breaker = self.breaker(table)
+        if not breaker.allow():
+            raise UpstreamUnavailable(f"Upstream {table} is unavailable (circuit open)", breaker.retry_after())
+
+        attempts = self.attempts if request.method in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                response = await inner.handle_async_request(request)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                if last or not breaker.allow():
+                    raise UpstreamUnavailable(f"Upstream {table} request failed: {e!r}")
+            except BaseException:
+                # Says nothing about the upstream, but a half-open probe must not stay claimed
+                breaker.release_probe()
+                raise
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                if last or response.status_code not in RETRY_STATUSES or not breaker.allow():
+                    return response
+                await response.aclose()
+            self.retries += 1
+            # Full jitter: spread retries of concurrent callers apart
+            await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+        raise UpstreamUnavailable(f"Upstream {table} request failed")
+
+    def _revalidate(self, inner: httpx.AsyncBaseTransport, request: httpx.Request, key: str):
+        if key in self._revalidating:
+            return
+        self._revalidating.add(key)
+        table = table_of(request)
+        fresh_request = httpx.Request(request.method, request.url, headers=request.headers)
+
+        async def refresh():
+            try:
+                response = await self._send(inner, fresh_request, table)
+                await response.aread()
+                if response.status_code == 200:
+                    self.cache.put(key, response)
+            except Exception:
+                pass
+            finally:
+                self._revalidating.discard(key)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "breakers": {table: b.stats() for table, b in self.breakers.items()},
+            "stale_cache": self.cache.stats(),
+        }
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, resilience: Resilience):
+        self.inner = inner
+        self.resilience = resilience
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.resilience.handle(self.inner, request)
+
+    async def aclose(self):
+        await self.inner.aclose()
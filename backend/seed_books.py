@@ -4,17 +4,22 @@ Fetches books from Standard Ebooks and Project Gutenberg
 """
 import httpx
 import asyncio
+import argparse
 import re
 import os
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import json
 import base64
+from datetime import datetime
+from categorizer import categorize, primary_category
+from dedup import LSHIndex, minhash, fingerprint_row, signature_from_row
+from text_stats import text_stats
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://bruzgztsltjtzwkkehif.supabase.co")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY", "")
+GUTENBERG_BASE_URL = os.getenv("GUTENBERG_BASE_URL", "https://www.gutenberg.org")
 
 # Standard Ebooks catalog
 STANDARD_EBOOKS_API = "https://standardebooks.org/ebooks"
@@ -36,6 +41,9 @@ def get_supabase_headers():
 
 def clean_gutenberg_text(html_content: str) -> str:
     """Remove Project Gutenberg headers and footers, keep only book content"""
+    # BeautifulSoup and lxml cost ~70ms to import; only pay for them when parsing
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'lxml')
     
     # Remove script and style elements
@@ -59,36 +67,9 @@ def clean_gutenberg_text(html_content: str) -> str:
     
     return text.strip()
 
-def categorize_book(title: str, author: str, description: str = "") -> str:
-    """Categorize book based on title, author, and description"""
-    text = f"{title} {author} {description}".lower()
-    
-    if any(word in text for word in ['poetry', 'poems', 'verse', 'sonnet']):
-        return "Poetry"
-    elif any(word in text for word in ['play', 'tragedy', 'comedy', 'drama', 'act i', 'act 1']):
-        return "Drama"
-    elif any(word in text for word in ['science fiction', 'sci-fi', 'space', 'future', 'robot']):
-        return "Science Fiction"
-    elif any(word in text for word in ['mystery', 'detective', 'crime', 'murder']):
-        return "Mystery"
-    elif any(word in text for word in ['horror', 'terror', 'ghost', 'supernatural']):
-        return "Horror"
-    elif any(word in text for word in ['adventure', 'journey', 'expedition', 'voyage']):
-        return "Adventure"
-    elif any(word in text for word in ['romance', 'love', 'heart', 'passion']):
-        return "Romance"
-    elif any(word in text for word in ['philosophy', 'ethics', 'moral', 'wisdom']):
-        return "Philosophy"
-    elif any(word in text for word in ['biography', 'life of', 'autobiography', 'memoir']):
-        return "Biography"
-    elif any(word in text for word in ['history', 'war', 'revolution', 'empire']):
-        return "History"
-    elif any(word in text for word in ['children', 'fairy', 'tales for']):
-        return "Children's Literature"
-    elif any(word in text for word in ['essay', 'essays', 'reflections']):
-        return "Essays"
-    else:
-        return "Fiction"
+def categorize_book(title: str, author: str, description: str = "", body: str = "") -> str:
+    """Categorize book based on title, author, description and the opening of the body"""
+    return primary_category(categorize(title, author, description, body))
 
 # Popular public domain books with their Gutenberg IDs
 CLASSIC_BOOKS = [
@@ -358,45 +339,62 @@ CLASSIC_BOOKS = [
     {"title": "Old Mortality", "author": "Sir Walter Scott", "gutenberg_id": 6943},
 ]
 
-async def fetch_gutenberg_text(gutenberg_id: int) -> str:
-    """Fetch book text from Project Gutenberg"""
-    urls = [
-        f"https://www.gutenberg.org/cache/epub/{gutenberg_id}/pg{gutenberg_id}.txt",
-        f"https://www.gutenberg.org/files/{gutenberg_id}/{gutenberg_id}-0.txt",
-        f"https://www.gutenberg.org/files/{gutenberg_id}/{gutenberg_id}.txt",
+def gutenberg_text_to_html(text: str) -> str:
+    """Clean a plain-text Gutenberg book and convert it to simple HTML"""
+    cleaned = clean_gutenberg_text(text)
+    paragraphs = cleaned.split('\n\n')
+    html_content = ""
+    for p in paragraphs:
+        p = p.strip()
+        if p:
+            # Check if it's a chapter heading
+            if re.match(r'^(CHAPTER|Chapter|BOOK|Book|PART|Part|ACT|Act|SCENE|Scene)', p):
+                html_content += f"<h2>{p}</h2>\n"
+            else:
+                html_content += f"<p>{p}</p>\n"
+    return html_content
+
+def gutenberg_text_urls(gutenberg_id: int) -> list:
+    """Candidate plain-text URLs for a Gutenberg book, best first"""
+    return [
+        f"{GUTENBERG_BASE_URL}/cache/epub/{gutenberg_id}/pg{gutenberg_id}.txt",
+        f"{GUTENBERG_BASE_URL}/files/{gutenberg_id}/{gutenberg_id}-0.txt",
+        f"{GUTENBERG_BASE_URL}/files/{gutenberg_id}/{gutenberg_id}.txt",
     ]
-    
+
+async def fetch_gutenberg_source(gutenberg_id: int) -> dict:
+    """
+    Fetch book text from Project Gutenberg.
+    Returns the HTML content plus the URL it came from and its cache validators,
+    or an empty dict if no URL worked.
+    """
     async with httpx.AsyncClient(timeout=60) as client:
-        for url in urls:
+        for url in gutenberg_text_urls(gutenberg_id):
             try:
                 response = await client.get(url)
                 if response.status_code == 200:
-                    text = response.text
-                    # Clean the text
-                    cleaned = clean_gutenberg_text(text)
-                    # Convert to simple HTML
-                    paragraphs = cleaned.split('\n\n')
-                    html_content = ""
-                    for p in paragraphs:
-                        p = p.strip()
-                        if p:
-                            # Check if it's a chapter heading
-                            if re.match(r'^(CHAPTER|Chapter|BOOK|Book|PART|Part|ACT|Act|SCENE|Scene)', p):
-                                html_content += f"<h2>{p}</h2>\n"
-                            else:
-                                html_content += f"<p>{p}</p>\n"
-                    return html_content
+                    return {
+                        "content": gutenberg_text_to_html(response.text),
+                        "source_text_url": url,
+                        "source_etag": response.headers.get("ETag"),
+                        "source_last_modified": response.headers.get("Last-Modified"),
+                    }
             except Exception as e:
                 print(f"Error fetching from {url}: {e}")
                 continue
     
-    return ""
+    return {}
+
+async def fetch_gutenberg_text(gutenberg_id: int) -> str:
+    """Fetch book text from Project Gutenberg"""
+    source = await fetch_gutenberg_source(gutenberg_id)
+    return source.get("content", "")
 
 async def get_gutenberg_cover(gutenberg_id: int) -> str:
     """Try to get cover image from Project Gutenberg"""
     cover_urls = [
-        f"https://www.gutenberg.org/cache/epub/{gutenberg_id}/pg{gutenberg_id}.cover.medium.jpg",
-        f"https://www.gutenberg.org/cache/epub/{gutenberg_id}/pg{gutenberg_id}.cover.small.jpg",
+        f"{GUTENBERG_BASE_URL}/cache/epub/{gutenberg_id}/pg{gutenberg_id}.cover.medium.jpg",
+        f"{GUTENBERG_BASE_URL}/cache/epub/{gutenberg_id}/pg{gutenberg_id}.cover.small.jpg",
     ]
     
     async with httpx.AsyncClient(timeout=30) as client:
@@ -411,21 +409,65 @@ async def get_gutenberg_cover(gutenberg_id: int) -> str:
     
     return ""
 
-async def seed_single_book(book_info: dict) -> dict:
+async def load_fingerprint_index(page_size: int = 1000) -> LSHIndex:
+    """Load the stored fingerprints of every book into an in-memory LSH index"""
+    index = LSHIndex()
+    last_id = 0
+    async with httpx.AsyncClient(timeout=60) as client:
+        while True:
+            # Keyset paging: each page is an index range scan, however deep
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/book_fingerprints?select=book_id,signature"
+                f"&book_id=gt.{last_id}&order=book_id.asc&limit={page_size}",
+                headers=get_supabase_headers()
+            )
+            if response.status_code != 200:
+                print(f"Could not load fingerprints, duplicate check limited to this run: {response.text}")
+                break
+            rows = response.json()
+            for row in rows:
+                index.add(row['book_id'], signature_from_row(row))
+            if len(rows) < page_size:
+                break
+            last_id = rows[-1]['book_id']
+    return index
+
+async def store_fingerprint(client: httpx.AsyncClient, book_id: int, signature: list) -> bool:
+    """Persist a book's MinHash signature and LSH bands"""
+    response = await client.post(
+        f"{SUPABASE_URL}/rest/v1/book_fingerprints",
+        headers={**get_supabase_headers(), "Prefer": "resolution=merge-duplicates,return=minimal"},
+        json=fingerprint_row(book_id, signature)
+    )
+    return response.status_code in [200, 201, 204]
+
+async def seed_single_book(book_info: dict, index: LSHIndex = None, skip_duplicates: bool = True) -> dict:
     """Seed a single book to the database"""
     print(f"Processing: {book_info['title']} by {book_info['author']}")
     
     # Fetch content
-    content = await fetch_gutenberg_text(book_info['gutenberg_id'])
-    if not content:
+    source = await fetch_gutenberg_source(book_info['gutenberg_id'])
+    if not source:
         print(f"  - Could not fetch content, skipping")
         return None
+    content = source['content'][:500000]  # Limit content size
+    
+    # Near-duplicate check against the existing corpus
+    signature = minhash(content)
+    if index is not None:
+        duplicates = index.query(signature)
+        if duplicates:
+            dup_id, score = duplicates[0]
+            if skip_duplicates:
+                print(f"  - Near-duplicate of book {dup_id} (similarity {score:.2f}), skipping")
+                return None
+            print(f"  - Warning: near-duplicate of book {dup_id} (similarity {score:.2f})")
     
     # Get cover
     cover = await get_gutenberg_cover(book_info['gutenberg_id'])
     
-    # Categorize
-    category = categorize_book(book_info['title'], book_info['author'])
+    # Categorize (title, author and the opening of the text)
+    labels = categorize(book_info['title'], book_info['author'], body=content)
     
     # Create description
     description = f"A classic work by {book_info['author']}. This public domain text is sourced from Project Gutenberg."
@@ -433,13 +475,19 @@ async def seed_single_book(book_info: dict) -> dict:
     book_data = {
         "title": book_info['title'],
         "author": book_info['author'],
-        "content_body": content[:500000],  # Limit content size
-        "category": category,
+        "content_body": content,
+        "category": primary_category(labels),
+        "categories": [{"category": c, "weight": w} for c, w in labels],
         "cover_image": cover,
         "is_featured": book_info.get('is_featured', False),
         "read_count": 0,
         "description": description,
-        "source_url": f"https://www.gutenberg.org/ebooks/{book_info['gutenberg_id']}"
+        "source_url": f"https://www.gutenberg.org/ebooks/{book_info['gutenberg_id']}",
+        # Validators for incremental re-seeding (--sync)
+        "source_text_url": source['source_text_url'],
+        "source_etag": source['source_etag'],
+        "source_last_modified": source['source_last_modified'],
+        **text_stats(content),
     }
     
     # Insert into Supabase
@@ -452,27 +500,216 @@ async def seed_single_book(book_info: dict) -> dict:
         
         if response.status_code in [200, 201]:
             print(f"  - Successfully added: {book_info['title']}")
-            return response.json()[0] if response.json() else book_data
+            created = response.json()[0] if response.json() else book_data
+            if created.get('id') is not None:
+                await store_fingerprint(client, created['id'], signature)
+                if index is not None:
+                    index.add(created['id'], signature)
+            return created
         else:
             print(f"  - Failed to add: {response.text}")
             return None
 
-async def seed_all_books(max_books: int = 300):
-    """Seed all classic books to the database"""
+async def fingerprint_existing_books(index: LSHIndex, page_size: int = 50) -> int:
+    """Fingerprint books inserted before duplicate detection existed"""
+    added = 0
+    last_id = 0
+    async with httpx.AsyncClient(timeout=60) as client:
+        while True:
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/books?select=id,content_body&id=gt.{last_id}&order=id.asc&limit={page_size}",
+                headers=get_supabase_headers()
+            )
+            if response.status_code != 200 or not response.json():
+                break
+            rows = response.json()
+            for row in rows:
+                if row['id'] in index.signatures or not row.get('content_body'):
+                    continue
+                signature = minhash(row['content_body'])
+                if await store_fingerprint(client, row['id'], signature):
+                    index.add(row['id'], signature)
+                    added += 1
+            last_id = rows[-1]['id']
+    return added
+
+async def seed_all_books(max_books: int = 300, skip_duplicates: bool = True, progress=None,
+                         delay: float = 0.5) -> dict:
+    """
+    Seed all classic books to the database. progress(done, total, title) is
+    called after each book; the background job runner uses it to report
+    progress and to stop a cancelled run between books.
+    """
     # Mark some books as featured
     featured_indices = [0, 1, 2, 3, 4, 5, 9, 14, 19, 24]  # First few popular ones
     
-    for i, book in enumerate(CLASSIC_BOOKS[:max_books]):
-        book['is_featured'] = i in featured_indices
-        await seed_single_book(book)
+    index = await load_fingerprint_index()
+    print(f"Loaded {len(index)} fingerprints for duplicate detection")
+    
+    books = CLASSIC_BOOKS[:max_books]
+    counts = {"added": 0, "skipped": 0}
+    for i, book in enumerate(books):
+        book = {**book, 'is_featured': i in featured_indices}
+        created = await seed_single_book(book, index=index, skip_duplicates=skip_duplicates)
+        counts["added" if created else "skipped"] += 1
+        if progress:
+            progress(i + 1, len(books), book['title'])
         # Small delay to avoid rate limiting
-        await asyncio.sleep(0.5)
+        if i + 1 < len(books):
+            await asyncio.sleep(delay)
+    return counts
+
+async def recategorize_all_books(page_size: int = 100, dry_run: bool = False) -> int:
+    """Re-run the categorization engine over every book already in the database"""
+    changed = 0
+    last_id = 0
+    async with httpx.AsyncClient(timeout=60) as client:
+        while True:
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/books?select=id,title,author,description,category,categories,content_body"
+                f"&id=gt.{last_id}&order=id.asc&limit={page_size}",
+                headers=get_supabase_headers()
+            )
+            if response.status_code != 200:
+                print(f"Failed to page books after id {last_id}: {response.text}")
+                break
+            rows = response.json()
+            if not rows:
+                break
+            for row in rows:
+                labels = categorize(row['title'], row['author'], description=row.get('description') or "",
+                                    body=row.get('content_body') or "")
+                category = primary_category(labels)
+                categories = [{"category": c, "weight": w} for c, w in labels]
+                if category != row.get('category'):
+                    print(f"  {row['title']}: {row.get('category')} -> {category}")
+                    changed += 1
+                elif categories == row.get('categories'):
+                    continue
+                if dry_run:
+                    continue
+                await client.patch(
+                    f"{SUPABASE_URL}/rest/v1/books?id=eq.{row['id']}",
+                    headers=get_supabase_headers(),
+                    json={"category": category, "categories": categories}
+                )
+            last_id = rows[-1]['id']
+    return changed
+
+async def sync_single_book(client: httpx.AsyncClient, row: dict) -> str:
+    """
+    Re-fetch one book's source with a conditional request and PATCH it if the
+    upstream text changed. Returns "unchanged", "updated" or "failed".
+    """
+    url = row.get('source_text_url')
+    if not url:
+        match = re.search(r'/ebooks/(\d+)', row.get('source_url') or '')
+        if not match:
+            return "failed"
+        # Seeded before validators were stored: start from the preferred URL
+        url = gutenberg_text_urls(int(match.group(1)))[0]
+
+    headers = {}
+    if row.get('source_etag'):
+        headers["If-None-Match"] = row['source_etag']
+    if row.get('source_last_modified'):
+        headers["If-Modified-Since"] = row['source_last_modified']
+
+    try:
+        response = await client.get(url, headers=headers)
+    except Exception as e:
+        print(f"  - Error fetching {url}: {e}")
+        return "failed"
+
+    if response.status_code == 304:
+        return "unchanged"
+    if response.status_code != 200:
+        print(f"  - {row['title']}: source returned {response.status_code}")
+        return "failed"
+
+    etag = response.headers.get("ETag")
+    if etag and etag == row.get('source_etag'):
+        # Upstream ignored the conditional request but the representation is the same
+        return "unchanged"
+
+    content = gutenberg_text_to_html(response.text)[:500000]
+    labels = categorize(row['title'], row['author'], description=row.get('description') or "",
+                        body=content)
+    patch = {
+        "content_body": content,
+        "category": primary_category(labels),
+        "categories": [{"category": c, "weight": w} for c, w in labels],
+        "source_text_url": url,
+        "source_etag": etag,
+        "source_last_modified": response.headers.get("Last-Modified"),
+        "updated_at": datetime.utcnow().isoformat(),
+        **text_stats(content),
+    }
+    update = await client.patch(
+        f"{SUPABASE_URL}/rest/v1/books?id=eq.{row['id']}",
+        headers=get_supabase_headers(),
+        json=patch
+    )
+    if update.status_code not in [200, 204]:
+        print(f"  - Failed to update {row['title']}: {update.text}")
+        return "failed"
+    await store_fingerprint(client, row['id'], minhash(content))
+    print(f"  - Updated: {row['title']}")
+    return "updated"
+
+async def sync_books(page_size: int = 100) -> dict:
+    """Re-process only the books whose upstream source changed since the last run"""
+    counts = {"unchanged": 0, "updated": 0, "failed": 0}
+    last_id = 0
+    async with httpx.AsyncClient(timeout=60) as client:
+        while True:
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/books?select=id,title,author,description,source_url,source_text_url,source_etag,source_last_modified"
+                f"&id=gt.{last_id}&order=id.asc&limit={page_size}",
+                headers=get_supabase_headers()
+            )
+            if response.status_code != 200:
+                print(f"Failed to page books after id {last_id}: {response.text}")
+                break
+            rows = response.json()
+            if not rows:
+                break
+            for row in rows:
+                counts[await sync_single_book(client, row)] += 1
+            last_id = rows[-1]['id']
+    return counts
 
 async def main():
+    parser = argparse.ArgumentParser(description="Seed Libreya books")
+    parser.add_argument("--recategorize", action="store_true", help="re-categorize existing books instead of seeding")
+    parser.add_argument("--dry-run", action="store_true", help="with --recategorize, only report changes")
+    parser.add_argument("--keep-duplicates", action="store_true", help="insert near-duplicate editions, only warn")
+    parser.add_argument("--fingerprint-existing", action="store_true", help="fingerprint books that have no stored fingerprint")
+    parser.add_argument("--sync", action="store_true", help="re-fetch only books whose upstream text changed")
+    args = parser.parse_args()
+
+    if args.sync:
+        print("Syncing books with upstream sources...")
+        counts = await sync_books()
+        print(f"\nSync complete: {counts['updated']} updated, {counts['unchanged']} unchanged, {counts['failed']} failed")
+        return
+
+    if args.fingerprint_existing:
+        index = await load_fingerprint_index()
+        added = await fingerprint_existing_books(index)
+        print(f"Fingerprinted {added} books ({len(index)} total)")
+        return
+
+    if args.recategorize:
+        print("Re-categorizing existing books...")
+        changed = await recategorize_all_books(dry_run=args.dry_run)
+        print(f"\nDone, {changed} books changed category")
+        return
+
     print("Starting book seeding process...")
     print(f"Will seed {len(CLASSIC_BOOKS)} books")
     
-    await seed_all_books(len(CLASSIC_BOOKS))
+    await seed_all_books(len(CLASSIC_BOOKS), skip_duplicates=not args.keep_duplicates)
     
     print("\nSeeding complete!")
 
@@ -4,14 +4,38 @@ A reading app backend using FastAPI and Supabase
 """
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 import os
-import httpx
+import io
+import csv
+import json
+import time
 import uuid
+import base64
+import asyncio
+import httpx
+from urllib.parse import quote
 from dotenv import load_dotenv
+from admission import RATE_LIMITS, UpstreamSaturated, client_key
+from resilience import UpstreamUnavailable
+from upstream import upstream_client, close_client, warm_pool, limiter as upstream_limiter, resilience as upstream_resilience
+import metrics
+from profiler import profiler, ProfilerMiddleware
+from covers import CoverCache, CoverNotFound, CoverUnavailable, COVER_SIZES, DEFAULT_COVER_SIZE
+from shared_catalog import SharedCatalog
+from sync import hub as sync_hub, SyncLimitReached
+from jobs import Job, JobRunner, JobQueueFull
+from trending import trending
+from analytics import analytics
+from batching import BatchLoader, RequestCacheMiddleware
+from activity_cache import activity_cache
+from guest_merge import merge_activity
+from text_stats import STATS_COLUMNS, text_stats
+from book_search import SearchQueryInvalid, query_terms, search_indexes
+from offline_bundle import BUNDLE_FORMAT, BundleVersionInvalid, BundleWriter, parse_version
 
 load_dotenv()
 
@@ -24,8 +48,71 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Bundle-Version"],
 )
 
+app.add_middleware(ProfilerMiddleware)
+
+app.add_middleware(RequestCacheMiddleware)
+
+# Outermost, so the latency of CORS preflights and error responses is recorded too
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.exception_handler(UpstreamSaturated)
+async def upstream_saturated_handler(request: Request, exc: UpstreamSaturated):
+    """Shed requests fail fast instead of piling onto a throttled Supabase"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))}
+    )
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))}
+    )
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARMUP_MODE == "blocking":
+        await warm_up()
+    elif WARMUP_MODE:
+        asyncio.get_running_loop().create_task(warm_up())
+
+@app.on_event("startup")
+async def load_jobs():
+    jobs.load()
+    trending.load()
+    analytics.load()
+
+@app.on_event("shutdown")
+async def shutdown_upstream():
+    await jobs.stop()
+    # On the loop's way out: written before the process exits
+    trending.save(background=False)
+    analytics.save(background=False)
+    await close_client()
+
+def rate_limit(route_class: str):
+    """Dependency enforcing the per-client token bucket of a route class"""
+    limiter = RATE_LIMITS[route_class]
+
+    async def check(request: Request):
+        enforce_rate_limit(request, limiter)
+    return check
+
+def enforce_rate_limit(request: Request, limiter):
+    allowed, retry_after = limiter.check(client_key(request.headers, request.client.host if request.client else None))
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, slow down",
+            headers={"Retry-After": str(max(1, round(retry_after + 0.5)))}
+        )
+
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://bruzgztsltjtzwkkehif.supabase.co")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY", "")
@@ -54,6 +141,40 @@ def get_service_role_headers():
         "Prefer": "return=representation"
     }
 
+# Recently verified admin tokens -> expiry, so admin tools don't cost two lookups per call
+ADMIN_TOKEN_TTL = 60
+_admin_tokens: Dict[str, float] = {}
+
+async def require_admin(request: Request):
+    """Dependency: the caller must send the Supabase access token of an admin user"""
+    auth = request.headers.get("authorization", "")
+    token = auth[7:].strip() if auth.lower().startswith("bearer ") else ""
+    if not token:
+        raise HTTPException(status_code=401, detail="Admin token required")
+    now = time.monotonic()
+    if _admin_tokens.get(token, 0) > now:
+        return
+
+    async with upstream_client() as client:
+        response = await client.get(f"{SUPABASE_URL}/auth/v1/user", headers=get_supabase_headers(token))
+        if response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        user = response.json()
+        is_admin = bool(user.get("email")) and user.get("email") == ADMIN_EMAIL
+        if not is_admin:
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/users?id=eq.{user.get('id')}&select=is_admin",
+                headers=get_service_role_headers()
+            )
+            rows = response.json() if response.status_code == 200 else []
+            is_admin = bool(rows and rows[0].get("is_admin"))
+
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if len(_admin_tokens) > 1000:
+        _admin_tokens.clear()
+    _admin_tokens[token] = now + ADMIN_TOKEN_TTL
+
 # ============= MODELS =============
 
 class UserProfile(BaseModel):
@@ -80,6 +201,9 @@ class Book(BaseModel):
     description: Optional[str] = None
     source_url: Optional[str] = None
     created_at: Optional[str] = None
+    word_count: Optional[int] = None
+    chapter_count: Optional[int] = None
+    reading_minutes: Optional[int] = None
 
 class UserActivity(BaseModel):
     id: Optional[int] = None
@@ -87,11 +211,33 @@ class UserActivity(BaseModel):
     book_id: int
     last_position: float = 0.0
     is_favorite: bool = False
-    highlights: List[Dict[str, Any]] = []
+    # Legacy whole-array highlights; leave unset and use /api/highlights instead
+    highlights: Optional[List[Dict[str, Any]]] = None
     chapter_read_count: int = 0
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
 
+class Highlight(BaseModel):
+    id: Optional[int] = None
+    user_id: str
+    book_id: int
+    chapter: int = 0
+    position: float = 0.0
+    end_position: Optional[float] = None
+    text: str
+    color: Optional[str] = None
+    note: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+class HighlightUpdate(BaseModel):
+    chapter: Optional[int] = None
+    position: Optional[float] = None
+    end_position: Optional[float] = None
+    text: Optional[str] = None
+    color: Optional[str] = None
+    note: Optional[str] = None
+
 class AppSettings(BaseModel):
     id: Optional[int] = None
     key: str
@@ -112,12 +258,87 @@ class GuestMigration(BaseModel):
 async def health_check():
     return {"status": "healthy", "service": "Libreya API", "timestamp": datetime.utcnow().isoformat()}
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of request, upstream and admission metrics"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/admin/upstream", dependencies=[Depends(require_admin)])
+async def get_upstream_stats():
+    """Upstream queue depth, wait times, breaker states and rate limiting counters (Admin only)"""
+    return {
+        "upstream": upstream_limiter.stats(),
+        "resilience": upstream_resilience.stats(),
+        "rate_limits": {name: limiter.stats() for name, limiter in RATE_LIMITS.items()},
+        "warmup": warmup_status,
+        "shared_catalog": shared_catalog.stats(),
+        "sync": sync_hub.stats(),
+        "jobs": jobs.stats(),
+        "trending": trending.stats(),
+        "activity_cache": activity_cache.stats(),
+    }
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profiler(seconds: float = 10, requests: int = 0, path: str = "/api/",
+                       interval_ms: float = 5, format: str = "json"):
+    """
+    Sample the event loop for `seconds`, or until the next `requests` requests
+    under `path` have finished. format=collapsed returns flamegraph.pl input.
+    """
+    if seconds <= 0 or requests < 0 or interval_ms < 1:
+        raise HTTPException(status_code=400, detail="Invalid profiling parameters")
+    try:
+        session = profiler.begin(seconds, requests, path, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await session.wait()
+    finally:
+        profiler.end(session)
+
+    if format == "collapsed":
+        return PlainTextResponse(session.collapsed())
+    return session.summary()
+
+# ============= WARM-UP =============
+
+# Off by default. "background" warms up while already serving, "blocking"
+# finishes warming before the first request is accepted.
+WARMUP_MODE = os.getenv("LIBREYA_WARMUP", "").lower()
+WARMUP_CONNECTIONS = int(os.getenv("LIBREYA_WARMUP_CONNECTIONS", "4"))
+# The home screen's list calls: warms every layer and fills the catalog's stale cache
+WARMUP_PATHS = ("/api/books?limit=300", "/api/books/featured?limit=10", "/api/settings")
+
+warmup_status: Dict[str, Any] = {"mode": WARMUP_MODE or "off", "state": "idle"}
+
+async def warm_up():
+    """Pre-open the upstream pool, then run the home requests once in-process"""
+    warmup_status["state"] = "running"
+    started = time.perf_counter()
+    await warm_pool(f"{SUPABASE_URL}/rest/v1/books?select=id&limit=1", get_supabase_headers(), WARMUP_CONNECTIONS)
+    warmup_status["pool_seconds"] = round(time.perf_counter() - started, 3)
+    statuses = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://warm-up") as client:
+        for path in WARMUP_PATHS:
+            try:
+                statuses[path] = (await client.get(path)).status_code
+            except Exception as e:
+                statuses[path] = repr(e)
+    warmup_status.update(state="done", seconds=round(time.perf_counter() - started, 3), requests=statuses)
+
+# ============= SHARED CATALOG =============
+
+# Set by the multi-worker launcher (python server.py --workers N). Catalog list
+# reads are then answered from the loader's shared snapshot; without it, or
+# before the first snapshot exists, they go to Supabase as before.
+shared_catalog = SharedCatalog(os.getenv("LIBREYA_SHARED_CATALOG"))
+
 # ============= INITIALIZATION =============
 
 @app.post("/api/init-database")
 async def init_database():
     """Initialize database tables in Supabase"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         # Check if tables exist by trying to query them
         try:
             # Test users table
@@ -167,8 +388,9 @@ async def init_database():
 async def create_user(user: UserProfile, request: Request):
     """Create or update a user profile"""
     auth_header = request.headers.get("Authorization", "")
+    headers = get_supabase_headers(auth_header.replace("Bearer ", "") if "Bearer " in auth_header else None)
     
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         user_data = {
             "id": user.id or str(uuid.uuid4()),
             "email": user.email,
@@ -182,14 +404,25 @@ async def create_user(user: UserProfile, request: Request):
             "created_at": datetime.utcnow().isoformat()
         }
         
+        # The app posts the profile on every login: only a new row is a signup
+        new_user = not user.id
+        if user.id:
+            existing = await client.get(
+                f"{SUPABASE_URL}/rest/v1/users?id=eq.{user.id}&select=id",
+                headers=headers
+            )
+            new_user = existing.status_code == 200 and not existing.json()
+        
         # Upsert user
         response = await client.post(
             f"{SUPABASE_URL}/rest/v1/users",
-            headers={**get_supabase_headers(auth_header.replace("Bearer ", "") if "Bearer " in auth_header else None), "Prefer": "resolution=merge-duplicates,return=representation"},
+            headers={**headers, "Prefer": "resolution=merge-duplicates,return=representation"},
             json=user_data
         )
         
         if response.status_code in [200, 201]:
+            if new_user:
+                analytics.record_signup(user.auth_provider)
             return response.json()[0] if response.json() else user_data
         else:
             raise HTTPException(status_code=response.status_code, detail=response.text)
@@ -197,7 +430,7 @@ async def create_user(user: UserProfile, request: Request):
 @app.get("/api/users/{user_id}")
 async def get_user(user_id: str, request: Request):
     """Get user profile by ID"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         response = await client.get(
             f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
             headers=get_supabase_headers()
@@ -213,7 +446,7 @@ async def get_user(user_id: str, request: Request):
 @app.patch("/api/users/{user_id}")
 async def update_user(user_id: str, updates: Dict[str, Any], request: Request):
     """Update user profile"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         updates["updated_at"] = datetime.utcnow().isoformat()
         
         response = await client.patch(
@@ -229,18 +462,23 @@ async def update_user(user_id: str, updates: Dict[str, Any], request: Request):
 @app.delete("/api/users/{user_id}")
 async def delete_user(user_id: str, request: Request):
     """Delete user and all their data (GDPR compliant)"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         # Delete user activity first
         await client.delete(
             f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{user_id}",
             headers=get_supabase_headers()
         )
+        await client.delete(
+            f"{SUPABASE_URL}/rest/v1/highlights?user_id=eq.{user_id}",
+            headers=get_supabase_headers()
+        )
         
         # Delete user profile
         response = await client.delete(
             f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
             headers=get_supabase_headers()
         )
+        activity_cache.remove(user_id)
         
         if response.status_code in [200, 204]:
             return {"success": True, "message": "User and all associated data deleted"}
@@ -249,7 +487,7 @@ async def delete_user(user_id: str, request: Request):
 @app.post("/api/users/accept-terms")
 async def accept_terms(data: TermsAcceptance):
     """Record terms acceptance"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         response = await client.patch(
             f"{SUPABASE_URL}/rest/v1/users?id=eq.{data.user_id}",
             headers=get_supabase_headers(),
@@ -263,115 +501,220 @@ async def accept_terms(data: TermsAcceptance):
             return {"success": True}
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
+MIGRATION_BATCH = 100
+MIGRATION_BATCH_MAX = 10000
+
 @app.post("/api/users/migrate-guest")
 async def migrate_guest(data: GuestMigration):
     """Migrate guest user data to registered account"""
-    async with httpx.AsyncClient() as client:
-        # Update all user_activity records from guest to new user
-        response = await client.patch(
-            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{data.guest_uuid}",
-            headers=get_supabase_headers(),
-            json={"user_id": data.new_user_id}
+    result = await migrate_guests([data], get_supabase_headers())
+    return {"success": True, "message": "Guest data migrated successfully", **result}
+
+@app.post("/api/admin/users/migrate-guests", dependencies=[Depends(require_admin)])
+async def migrate_guests_batch(migrations: List[GuestMigration]):
+    """Migrate many guests at once (Admin only), in chunks of MIGRATION_BATCH guests"""
+    if len(migrations) > MIGRATION_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {MIGRATION_BATCH_MAX} migrations per request")
+    totals = {"guests": 0, "rows": 0, "merged": 0}
+    for start in range(0, len(migrations), MIGRATION_BATCH):
+        result = await migrate_guests(migrations[start:start + MIGRATION_BATCH], get_service_role_headers())
+        for key in totals:
+            totals[key] += result[key]
+    return {"success": True, **totals}
+
+async def migrate_guests(migrations: List[GuestMigration], headers: Dict[str, str]) -> Dict[str, int]:
+    """
+    Fold guests' activity into their new accounts: one read of every row
+    involved, one upsert of the merged rows on (user_id, book_id), then the
+    guests' activity rows and profiles are deleted. Highlights rows have no
+    per-book uniqueness and simply change owner.
+    """
+    pairs = [(m.guest_uuid, m.new_user_id) for m in migrations]
+    guests = [guest for guest, _ in pairs]
+    if len(set(guests)) != len(guests) or any(guest == user for guest, user in pairs):
+        raise HTTPException(status_code=400, detail="Each guest must be migrated once, to another account")
+    if not pairs:
+        return {"guests": 0, "rows": 0, "merged": 0}
+    everyone = ",".join(dict.fromkeys(guests + [user for _, user in pairs]))
+    guest_list = ",".join(guests)
+
+    async with upstream_client() as client:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=in.({everyone})",
+            headers=headers
         )
-        
-        if response.status_code in [200, 204]:
-            # Delete the guest user profile
-            await client.delete(
-                f"{SUPABASE_URL}/rest/v1/users?id=eq.{data.guest_uuid}",
-                headers=get_supabase_headers()
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        rows, merged = merge_activity(pairs, response.json())
+
+        if rows:
+            response = await client.post(
+                f"{SUPABASE_URL}/rest/v1/user_activity?on_conflict=user_id,book_id",
+                headers={**headers, "Prefer": "resolution=merge-duplicates,return=minimal"},
+                json=rows
             )
-            return {"success": True, "message": "Guest data migrated successfully"}
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+            if response.status_code not in [200, 201, 204]:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+
+        # Highlights before the profile delete cascades to them: every guest's
+        # must have moved, or nothing is deleted and the migration can be retried
+        responses = await asyncio.gather(*(
+            client.patch(
+                f"{SUPABASE_URL}/rest/v1/highlights?user_id=eq.{guest}",
+                headers=headers,
+                json={"user_id": user}
+            ) for guest, user in pairs
+        ))
+        for response in responses:
+            if response.status_code not in [200, 204]:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+        responses = await asyncio.gather(
+            client.delete(f"{SUPABASE_URL}/rest/v1/user_activity?user_id=in.({guest_list})", headers=headers),
+            client.delete(f"{SUPABASE_URL}/rest/v1/users?id=in.({guest_list})", headers=headers),
+        )
+        for response in responses:
+            if response.status_code not in [200, 204]:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+
+    analytics.record_migration(len(pairs))
+    for guest, user in pairs:
+        activity_cache.remove(guest)
+        activity_cache.remove(user)
+    return {"guests": len(pairs), "rows": len(rows), "merged": merged}
 
 # ============= BOOK ENDPOINTS =============
 
 @app.get("/api/books")
 async def get_books(
+    request: Request,
     limit: int = 50,
     offset: int = 0,
     category: Optional[str] = None,
     featured: Optional[bool] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    order: str = "popular"
 ):
-    """Get books with filters"""
-    async with httpx.AsyncClient() as client:
-        url = f"{SUPABASE_URL}/rest/v1/books?select=id,title,author,category,cover_image,is_featured,read_count,description&order=read_count.desc&limit={limit}&offset={offset}"
-        
-        if category:
-            url += f"&category=eq.{category}"
-        if featured is not None:
-            url += f"&is_featured=eq.{str(featured).lower()}"
-        if search:
-            # PostgREST uses * as wildcard in URLs (translates to % in SQL)
-            url += f"&or=(title.ilike.*{search}*,author.ilike.*{search}*)"
+    """Get books with filters; order=trending ranks by recent opens instead of all-time read_count"""
+    if order not in BOOK_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of {', '.join(BOOK_ORDERS)}")
+    if search:
+        enforce_rate_limit(request, RATE_LIMITS["search"])
+    if order == "trending":
+        return await get_trending_books(limit, offset, category, featured, search)
+    catalog = shared_catalog.view()
+    if catalog is not None:
+        return with_cover_thumbnails(catalog.books(limit, offset, category, featured, search))
+    async with upstream_client() as client:
+        url = f"{SUPABASE_URL}/rest/v1/books?select={BOOK_LIST_COLUMNS}&order=read_count.desc&limit={limit}&offset={offset}"
+        url += book_filters(category, featured, search)
         
         response = await client.get(url, headers=get_supabase_headers())
         
         if response.status_code == 200:
-            return response.json()
+            return with_cover_thumbnails(response.json())
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
+BOOK_ORDERS = ("popular", "trending")
+BOOK_LIST_COLUMNS = "id,title,author,category,cover_image,is_featured,read_count,description," + ",".join(STATS_COLUMNS)
+
+def book_filters(category: Optional[str], featured: Optional[bool], search: Optional[str]) -> str:
+    """PostgREST query string filters shared by the book list queries"""
+    filters = ""
+    if category:
+        filters += f"&category=eq.{category}"
+    if featured is not None:
+        filters += f"&is_featured=eq.{str(featured).lower()}"
+    if search:
+        # PostgREST uses * as wildcard in URLs (translates to % in SQL)
+        filters += f"&or=(title.ilike.*{search}*,author.ilike.*{search}*)"
+    return filters
+
+async def get_trending_books(limit: int, offset: int, category: Optional[str],
+                             featured: Optional[bool], search: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Books of the precomputed trending top-k that match the filters, in trending
+    order, topped up with the most read books once the trending ones run out.
+    """
+    ranked = trending.top()
+    wanted = max(0, offset) + max(0, limit)
+    filters = book_filters(category, featured, search)
+    rows: List[Dict[str, Any]] = []
+    async with upstream_client() as client:
+        if ranked:
+            ids = ",".join(str(book_id) for book_id, _ in ranked)
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/books?select={BOOK_LIST_COLUMNS}&id=in.({ids}){filters}",
+                headers=get_supabase_headers()
+            )
+            if response.status_code != 200:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+            by_id = {book["id"]: book for book in response.json()}
+            for book_id, score in ranked:
+                if book_id in by_id:
+                    rows.append({**by_id[book_id], "trending_score": round(score, 3)})
+        if len(rows) < wanted:
+            url = (f"{SUPABASE_URL}/rest/v1/books?select={BOOK_LIST_COLUMNS}&order=read_count.desc"
+                   f"&limit={wanted - len(rows)}{filters}")
+            if ranked:
+                url += f"&id=not.in.({','.join(str(book_id) for book_id, _ in ranked)})"
+            response = await client.get(url, headers=get_supabase_headers())
+            if response.status_code != 200:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+            rows.extend(response.json())
+    return with_cover_thumbnails(rows[max(0, offset):wanted])
+
 @app.get("/api/books/featured")
 async def get_featured_books(limit: int = 10):
     """Get featured books (highest read count)"""
-    async with httpx.AsyncClient() as client:
+    catalog = shared_catalog.view()
+    if catalog is not None:
+        return with_cover_thumbnails(catalog.books(limit, featured=True))
+    async with upstream_client() as client:
         response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/books?select=id,title,author,category,cover_image,is_featured,read_count,description&is_featured=eq.true&order=read_count.desc&limit={limit}",
+            f"{SUPABASE_URL}/rest/v1/books?select={BOOK_LIST_COLUMNS}&is_featured=eq.true&order=read_count.desc&limit={limit}",
             headers=get_supabase_headers()
         )
         
         if response.status_code == 200:
-            return response.json()
+            return with_cover_thumbnails(response.json())
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
 @app.get("/api/books/recommended/{user_id}")
 async def get_recommended_books(user_id: str, limit: int = 10):
     """Get recommended books based on user's reading history"""
-    async with httpx.AsyncClient() as client:
-        # Get user's most read categories
-        activity_response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{user_id}&select=book_id",
-            headers=get_supabase_headers()
-        )
-        
-        if activity_response.status_code == 200:
-            activities = activity_response.json()
-            if activities:
-                # Get books from those categories
-                book_ids = [a["book_id"] for a in activities]
-                books_response = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/books?id=in.({','.join(map(str, book_ids))})&select=category",
-                    headers=get_supabase_headers()
-                )
-                
-                if books_response.status_code == 200:
-                    books = books_response.json()
-                    categories = list(set([b["category"] for b in books if b.get("category")]))
-                    
-                    if categories:
-                        # Get recommended books from those categories
-                        rec_response = await client.get(
-                            f"{SUPABASE_URL}/rest/v1/books?select=id,title,author,category,cover_image,is_featured,read_count,description&category=in.({','.join(categories)})&id=not.in.({','.join(map(str, book_ids))})&order=read_count.desc&limit={limit}",
-                            headers=get_supabase_headers()
-                        )
-                        
-                        if rec_response.status_code == 200:
-                            return rec_response.json()
+    # Get user's most read categories; both lookups batch with concurrent requests
+    book_ids, categories = [], []
+    try:
+        book_ids = list(await user_activity_rows(user_id))
+        books = [b for b in await book_loader.load_many(book_ids) if b]
+        categories = sorted(set(b["category"] for b in books if b.get("category")))
+    except HTTPException:
+        pass
+    async with upstream_client() as client:
+        if categories:
+            # Get recommended books from those categories
+            rec_response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/books?select={BOOK_LIST_COLUMNS}&category=in.({','.join(categories)})&id=not.in.({','.join(map(str, book_ids))})&order=read_count.desc&limit={limit}",
+                headers=get_supabase_headers()
+            )
+            
+            if rec_response.status_code == 200:
+                return with_cover_thumbnails(rec_response.json())
         
         # Fallback to popular books
         response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/books?select=id,title,author,category,cover_image,is_featured,read_count,description&order=read_count.desc&limit={limit}",
+            f"{SUPABASE_URL}/rest/v1/books?select={BOOK_LIST_COLUMNS}&order=read_count.desc&limit={limit}",
             headers=get_supabase_headers()
         )
         
         if response.status_code == 200:
-            return response.json()
+            return with_cover_thumbnails(response.json())
         return []
 
-@app.get("/api/books/{book_id}")
+@app.get("/api/books/{book_id}", dependencies=[Depends(rate_limit("book"))])
 async def get_book(book_id: int):
     """Get a single book with full content"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         response = await client.get(
             f"{SUPABASE_URL}/rest/v1/books?id=eq.{book_id}",
             headers=get_supabase_headers()
@@ -380,6 +723,8 @@ async def get_book(book_id: int):
         if response.status_code == 200:
             data = response.json()
             if data:
+                trending.record(book_id)
+                analytics.record_open(book_id, data[0].get("category"))
                 # Increment read count
                 await client.patch(
                     f"{SUPABASE_URL}/rest/v1/books?id=eq.{book_id}",
@@ -390,10 +735,46 @@ async def get_book(book_id: int):
             raise HTTPException(status_code=404, detail="Book not found")
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
+SEARCH_RESULTS_MAX = 200
+
+async def _load_book_text(book_id: int) -> Optional[Tuple[str, str]]:
+    async with upstream_client() as client:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/books?id=eq.{book_id}&select=title,content_body",
+            headers=get_supabase_headers()
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        data = response.json()
+        return (data[0].get("title") or "Book", data[0].get("content_body") or "") if data else None
+
+@app.get("/api/books/{book_id}/search", dependencies=[Depends(rate_limit("search"))])
+async def search_book(book_id: int, q: str, limit: int = 50):
+    """Find a word or phrase inside a book: chapter, character offset in the chapter text and a snippet"""
+    if not 1 <= limit <= SEARCH_RESULTS_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_RESULTS_MAX}")
+    try:
+        terms = query_terms(q)
+    except SearchQueryInvalid as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    index = await search_indexes.get(book_id, _load_book_text)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    positions = index.find(terms)
+    return {
+        "book_id": book_id,
+        "query": q,
+        "total": len(positions),
+        "matches": [index.match(position, len(terms)) for position in positions[:limit]],
+    }
+
 @app.get("/api/books/categories/list")
 async def get_categories():
     """Get all unique categories"""
-    async with httpx.AsyncClient() as client:
+    catalog = shared_catalog.view()
+    if catalog is not None:
+        return list(catalog.categories)
+    async with upstream_client() as client:
         response = await client.get(
             f"{SUPABASE_URL}/rest/v1/books?select=category",
             headers=get_supabase_headers()
@@ -405,12 +786,52 @@ async def get_categories():
             return sorted(categories)
         return []
 
+# ============= COVER IMAGES =============
+
+cover_cache = CoverCache()
+
+COVER_CACHE_CONTROL = "public, max-age=2592000, stale-while-revalidate=86400"
+
+async def _load_cover_source(book_id: int) -> Optional[str]:
+    async with upstream_client() as client:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/books?id=eq.{book_id}&select=cover_image",
+            headers=get_supabase_headers()
+        )
+        if response.status_code == 200 and response.json():
+            return response.json()[0].get("cover_image")
+        return None
+
+@app.get("/api/covers/{book_id}")
+async def get_cover(book_id: int, request: Request, size: str = DEFAULT_COVER_SIZE):
+    """Serve a locally cached, resized cover image"""
+    if size not in COVER_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(COVER_SIZES)}")
+    try:
+        data, etag = await cover_cache.get(book_id, size, _load_cover_source)
+    except CoverNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except CoverUnavailable as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    headers = {"ETag": etag, "Cache-Control": COVER_CACHE_CONTROL}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+def with_cover_thumbnails(books: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Point list results at the cover proxy instead of the full-size remote image"""
+    for book in books:
+        if book.get("cover_image") and book.get("id") is not None:
+            book["cover_thumbnail"] = f"/api/covers/{book['id']}?size={DEFAULT_COVER_SIZE}"
+    return books
+
 # ============= ADMIN BOOK ENDPOINTS =============
 
 @app.post("/api/admin/books")
 async def create_book(book: Book):
     """Create a new book (Admin only)"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         book_data = {
             "title": book.title,
             "author": book.author,
@@ -421,7 +842,8 @@ async def create_book(book: Book):
             "read_count": book.read_count,
             "description": book.description,
             "source_url": book.source_url,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.utcnow().isoformat(),
+            **text_stats(book.content_body),
         }
         
         response = await client.post(
@@ -431,14 +853,17 @@ async def create_book(book: Book):
         )
         
         if response.status_code in [200, 201]:
+            shared_catalog.invalidate()
             return response.json()[0] if response.json() else book_data
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
 @app.patch("/api/admin/books/{book_id}")
 async def update_book(book_id: int, updates: Dict[str, Any]):
     """Update a book (Admin only)"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         updates["updated_at"] = datetime.utcnow().isoformat()
+        if "content_body" in updates:
+            updates.update(text_stats(updates["content_body"]))
         
         response = await client.patch(
             f"{SUPABASE_URL}/rest/v1/books?id=eq.{book_id}",
@@ -447,19 +872,28 @@ async def update_book(book_id: int, updates: Dict[str, Any]):
         )
         
         if response.status_code in [200, 204]:
+            if "cover_image" in updates:
+                cover_cache.invalidate(book_id)
+            if "content_body" in updates:
+                search_indexes.invalidate(book_id)
+            shared_catalog.invalidate()
             return {"success": True, "message": "Book updated"}
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
 @app.delete("/api/admin/books/{book_id}")
 async def delete_book(book_id: int):
     """Delete a book (Admin only)"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         response = await client.delete(
             f"{SUPABASE_URL}/rest/v1/books?id=eq.{book_id}",
             headers=get_supabase_headers()
         )
         
         if response.status_code in [200, 204]:
+            shared_catalog.invalidate()
+            trending.forget(book_id)
+            activity_cache.remove_book(book_id)
+            search_indexes.invalidate(book_id)
             return {"success": True, "message": "Book deleted"}
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
@@ -468,53 +902,40 @@ async def delete_book(book_id: int):
 @app.get("/api/activity/{user_id}")
 async def get_user_activity(user_id: str):
     """Get all activity for a user"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{user_id}",
-            headers=get_supabase_headers()
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+    return list((await user_activity_rows(user_id)).values())
 
 @app.get("/api/activity/{user_id}/{book_id}")
 async def get_book_activity(user_id: str, book_id: int):
     """Get activity for a specific book"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{user_id}&book_id=eq.{book_id}",
-            headers=get_supabase_headers()
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                return data[0]
-            return None
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+    # Loads (and caches) all of the user's rows: the same one query, and the next book is local
+    return (await user_activity_rows(user_id)).get(book_id)
 
 @app.post("/api/activity")
-async def create_or_update_activity(activity: UserActivity):
+async def create_or_update_activity(activity: UserActivity, request: Request):
     """Create or update reading activity"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         activity_data = {
             "user_id": activity.user_id,
             "book_id": activity.book_id,
             "last_position": activity.last_position,
             "is_favorite": activity.is_favorite,
-            "highlights": activity.highlights,
             "chapter_read_count": activity.chapter_read_count,
             "updated_at": datetime.utcnow().isoformat()
         }
+        if activity.highlights is not None:
+            activity_data["highlights"] = activity.highlights
         
-        # Check if activity exists
-        check_response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{activity.user_id}&book_id=eq.{activity.book_id}",
-            headers=get_supabase_headers()
-        )
-        
-        if check_response.status_code == 200 and check_response.json():
+        # Check if activity exists, locally when the user's rows are cached
+        cached = activity_cache.get(activity.user_id)
+        if cached is not None:
+            existing = [cached[activity.book_id]] if activity.book_id in cached else []
+        else:
+            check_response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{activity.user_id}&book_id=eq.{activity.book_id}",
+                headers=get_supabase_headers()
+            )
+            existing = check_response.json() if check_response.status_code == 200 else []
+        if existing:
             # Update existing
             response = await client.patch(
                 f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{activity.user_id}&book_id=eq.{activity.book_id}",
@@ -529,39 +950,307 @@ async def create_or_update_activity(activity: UserActivity):
                 headers=get_supabase_headers(),
                 json=activity_data
             )
+            if response.status_code == 409:
+                # Created meanwhile by another worker whose write this cache hasn't seen
+                del activity_data["created_at"]
+                response = await client.patch(
+                    f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{activity.user_id}&book_id=eq.{activity.book_id}",
+                    headers=get_supabase_headers(),
+                    json=activity_data
+                )
         
         if response.status_code in [200, 201, 204]:
+            saved = response.json() if response.status_code in [200, 201] else []
+            activity_cache.upsert(activity.user_id,
+                                  saved[0] if saved else {**(existing[0] if existing else {}), **activity_data})
+            publish_activity(activity, existing[0] if existing else None, request.headers.get("x-device-id"))
+            analytics.record_reader(activity.user_id, bool(existing and existing[0].get("is_favorite")),
+                                    activity.is_favorite)
             return {"success": True}
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
 @app.get("/api/favorites/{user_id}")
 async def get_favorites(user_id: str):
     """Get user's favorite books"""
-    async with httpx.AsyncClient() as client:
+    activities = (await user_activity_rows(user_id)).values()
+    book_ids = [a["book_id"] for a in activities if a.get("is_favorite")]
+    books = await book_loader.load_many(book_ids)
+    # Loader rows are shared with the other requests of the batch
+    return with_cover_thumbnails([dict(b) for b in books if b])
+
+# ============= BATCHED LOOKUPS =============
+
+async def load_books_by_id(book_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    async with upstream_client() as client:
         response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{user_id}&is_favorite=eq.true&select=book_id",
+            f"{SUPABASE_URL}/rest/v1/books?id=in.({','.join(map(str, book_ids))})&select={BOOK_LIST_COLUMNS}",
             headers=get_supabase_headers()
         )
-        
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    return {book["id"]: book for book in response.json()}
+
+def in_list(values: List[str]) -> str:
+    """PostgREST in.(...) operand with every value quoted, so commas or parentheses in one can't break the list"""
+    quoted = (value.replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "(" + ",".join(f'"{quote(value, safe="")}"' for value in quoted) + ")"
+
+async def load_activity_by_user(user_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    marker = activity_cache.marker()
+    async with upstream_client() as client:
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=in.{in_list(user_ids)}",
+            headers=get_supabase_headers()
+        )
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    by_user: Dict[str, List[Dict[str, Any]]] = {user_id: [] for user_id in user_ids}
+    for row in response.json():
+        by_user.setdefault(row["user_id"], []).append(row)
+    for user_id, rows in by_user.items():
+        activity_cache.put(user_id, rows, marker)
+    return by_user
+
+# Light list rows by book id, and the activity rows of a user
+book_loader = BatchLoader("books", load_books_by_id)
+activity_loader = BatchLoader("activity", load_activity_by_user, default=[])
+
+async def user_activity_rows(user_id: str) -> Dict[int, Dict[str, Any]]:
+    """A user's activity rows by book id: from the activity cache, else one batched load that fills it"""
+    cached = activity_cache.get(user_id)
+    if cached is not None:
+        return cached
+    return {row["book_id"]: row for row in await activity_loader.load(user_id)}
+
+# ============= HIGHLIGHTS =============
+
+HIGHLIGHT_COLUMNS = "id,book_id,chapter,position,end_position,text,color,note,created_at,updated_at"
+
+@app.get("/api/highlights/{user_id}/{book_id}")
+async def get_highlights(user_id: str, book_id: int, chapter: Optional[int] = None):
+    """Highlights of a book in reading order, or only those of one chapter"""
+    async with upstream_client() as client:
+        url = (f"{SUPABASE_URL}/rest/v1/highlights?user_id=eq.{user_id}&book_id=eq.{book_id}"
+               f"&select={HIGHLIGHT_COLUMNS}&order=chapter.asc,position.asc")
+        if chapter is not None:
+            url += f"&chapter=eq.{chapter}"
+        response = await client.get(url, headers=get_supabase_headers())
+
         if response.status_code == 200:
-            activities = response.json()
-            if activities:
-                book_ids = [a["book_id"] for a in activities]
-                books_response = await client.get(
-                    f"{SUPABASE_URL}/rest/v1/books?id=in.({','.join(map(str, book_ids))})&select=id,title,author,category,cover_image,is_featured,read_count,description",
-                    headers=get_supabase_headers()
-                )
-                if books_response.status_code == 200:
-                    return books_response.json()
-            return []
+            return response.json()
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+@app.post("/api/highlights")
+async def create_highlight(highlight: Highlight, request: Request):
+    """Add one highlight without touching the rest"""
+    async with upstream_client() as client:
+        now = datetime.utcnow().isoformat()
+        data = highlight.model_dump(exclude={"id"}, exclude_none=True)
+        data.update(created_at=now, updated_at=now)
+        response = await client.post(
+            f"{SUPABASE_URL}/rest/v1/highlights",
+            headers=get_supabase_headers(),
+            json=data
+        )
+
+        if response.status_code in [200, 201]:
+            created = response.json()[0] if response.json() else data
+            publish_highlight(highlight.user_id, created, request.headers.get("x-device-id"))
+            analytics.record_reader(highlight.user_id)
+            return created
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+@app.patch("/api/highlights/{user_id}/{highlight_id}")
+async def update_highlight(user_id: str, highlight_id: int, updates: HighlightUpdate, request: Request):
+    """Change the range, text, color or note of one highlight"""
+    data = updates.model_dump(exclude_unset=True)
+    if not data:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    data["updated_at"] = datetime.utcnow().isoformat()
+    async with upstream_client() as client:
+        response = await client.patch(
+            f"{SUPABASE_URL}/rest/v1/highlights?id=eq.{highlight_id}&user_id=eq.{user_id}",
+            headers=get_supabase_headers(),
+            json=data
+        )
+
+        if response.status_code in [200, 204]:
+            updated = response.json() if response.status_code == 200 else []
+            if not updated:
+                raise HTTPException(status_code=404, detail="Highlight not found")
+            publish_highlight(user_id, updated[0], request.headers.get("x-device-id"))
+            return updated[0]
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
+@app.delete("/api/highlights/{user_id}/{highlight_id}")
+async def delete_highlight(user_id: str, highlight_id: int, request: Request):
+    """Remove one highlight"""
+    async with upstream_client() as client:
+        response = await client.delete(
+            f"{SUPABASE_URL}/rest/v1/highlights?id=eq.{highlight_id}&user_id=eq.{user_id}",
+            headers=get_supabase_headers()
+        )
+
+        if response.status_code in [200, 204]:
+            deleted = response.json() if response.status_code == 200 else []
+            if not deleted:
+                raise HTTPException(status_code=404, detail="Highlight not found")
+            publish_highlight(user_id, {"id": highlight_id, "book_id": deleted[0].get("book_id"), "deleted": True},
+                              request.headers.get("x-device-id"))
+            return {"success": True}
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+# ============= CROSS-DEVICE SYNC =============
+
+@app.get("/api/sync/{user_id}")
+async def sync_stream(user_id: str, device_id: Optional[str] = None):
+    """
+    Server-sent events carrying progress and favorite changes made on the
+    user's other devices. Send the same device_id as X-Device-Id on
+    POST /api/activity so a device doesn't hear its own writes.
+    """
+    try:
+        subscriber = sync_hub.admit(user_id, device_id)
+    except SyncLimitReached as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return SyncStreamResponse(
+        subscriber,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class SyncStreamResponse(StreamingResponse):
+    """Releases the subscriber's slot even when the stream never starts (client gone first)"""
+
+    def __init__(self, subscriber, **kwargs):
+        super().__init__(sync_hub.stream(subscriber), **kwargs)
+        self.subscriber = subscriber
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            sync_hub.unsubscribe(self.subscriber)
+
+def publish_activity(activity: UserActivity, previous: Optional[Dict[str, Any]], origin: Optional[str]):
+    """Push what changed in a saved activity to the user's connected devices"""
+    if (previous is None or previous.get("last_position") != activity.last_position
+            or previous.get("chapter_read_count") != activity.chapter_read_count):
+        sync_hub.publish(activity.user_id, "progress", {
+            "book_id": activity.book_id,
+            "last_position": activity.last_position,
+            "chapter_read_count": activity.chapter_read_count,
+        }, origin)
+    if bool((previous or {}).get("is_favorite")) != activity.is_favorite:
+        sync_hub.publish(activity.user_id, "favorite", {
+            "book_id": activity.book_id,
+            "is_favorite": activity.is_favorite,
+        }, origin)
+
+def publish_highlight(user_id: str, highlight: Dict[str, Any], origin: Optional[str]):
+    # Keyed by highlight id: edits to different highlights of a book must not coalesce
+    sync_hub.publish(user_id, "highlight", highlight, origin, key=highlight.get("id"))
+
+# ============= OFFLINE BUNDLES =============
+
+BUNDLE_BOOK_COLUMNS = BOOK_LIST_COLUMNS + ",content_body,created_at,updated_at"
+
+async def _fetch_bundle_book(client, book_id: int) -> Optional[Dict[str, Any]]:
+    response = await client.get(
+        f"{SUPABASE_URL}/rest/v1/books?id=eq.{book_id}&select={BUNDLE_BOOK_COLUMNS}",
+        headers=get_supabase_headers()
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    data = response.json()
+    return data[0] if data else None
+
+@app.get("/api/users/{user_id}/offline-bundle", dependencies=[Depends(rate_limit("book"))])
+async def get_offline_bundle(user_id: str, since: Optional[str] = None, have: Optional[str] = None):
+    """
+    The user's favorite books, chapter by chapter, with their activity and
+    highlights as one streamed zip. since=<X-Bundle-Version of an earlier
+    bundle> leaves out the books that haven't changed since; have=<comma
+    separated book ids> names the books the client already holds, so newly
+    favorited ones are sent whole.
+    """
+    try:
+        since_at = parse_version(since) if since else None
+    except BundleVersionInvalid as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        held = {int(book_id) for book_id in have.split(",") if book_id.strip()} if have else set()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="have must be a comma separated list of book ids")
+    version = datetime.utcnow().isoformat()
+    rows = await user_activity_rows(user_id)
+    library = sorted(book_id for book_id, row in rows.items() if row.get("is_favorite"))
+
+    # Everything that can fail is asked before the first byte goes out
+    async with upstream_client() as client:
+        included = library
+        if since_at is not None and library:
+            # Books the client lacks, and books whose content changed since. Activity
+            # timestamps don't count: every position save bumps them.
+            stamp = since_at.isoformat()
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/books?select=id&id=in.({','.join(map(str, library))})"
+                f"&or=(updated_at.gt.{stamp},created_at.gt.{stamp})",
+                headers=get_supabase_headers()
+            )
+            if response.status_code != 200:
+                raise HTTPException(status_code=response.status_code, detail=response.text)
+            changed = {book["id"] for book in response.json()}
+            if have is not None:
+                changed.update(book_id for book_id in library if book_id not in held)
+            included = sorted(changed)
+        response = await client.get(
+            f"{SUPABASE_URL}/rest/v1/highlights?user_id=eq.{user_id}"
+            f"&select={HIGHLIGHT_COLUMNS}&order=book_id.asc,chapter.asc,position.asc",
+            headers=get_supabase_headers()
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        highlights = response.json()
+
+    async def archive():
+        bundle = BundleWriter()
+        written: List[int] = []
+        yield bundle.add_json("activity.json", {"activity": list(rows.values()), "highlights": highlights})
+        async with upstream_client() as client:
+            # The next book downloads while the current one is compressed
+            upcoming = asyncio.ensure_future(_fetch_bundle_book(client, included[0])) if included else None
+            try:
+                for n, book_id in enumerate(included):
+                    book = await upcoming
+                    upcoming = (asyncio.ensure_future(_fetch_bundle_book(client, included[n + 1]))
+                                if n + 1 < len(included) else None)
+                    if book is not None:
+                        yield await asyncio.to_thread(bundle.add_book, book)
+                        written.append(book_id)
+            finally:
+                if upcoming is not None:
+                    upcoming.cancel()
+        yield bundle.add_json("manifest.json", {
+            "format": BUNDLE_FORMAT, "user_id": user_id, "version": version, "since": since,
+            "library": library, "books": written,
+        })
+        yield bundle.close()
+
+    return StreamingResponse(archive(), media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="libreya-offline-{version[:10]}.zip"',
+        "X-Bundle-Version": version,
+    })
+
 # ============= APP SETTINGS ENDPOINTS =============
 
 @app.get("/api/settings/{key}")
 async def get_setting(key: str):
     """Get an app setting by key"""
-    async with httpx.AsyncClient() as client:
+    catalog = shared_catalog.view()
+    if catalog is not None:
+        return next((s for s in catalog.settings() if s.get("key") == key), None)
+    async with upstream_client() as client:
         response = await client.get(
             f"{SUPABASE_URL}/rest/v1/app_settings?key=eq.{key}",
             headers=get_supabase_headers()
@@ -577,7 +1266,10 @@ async def get_setting(key: str):
 @app.get("/api/settings")
 async def get_all_settings():
     """Get all app settings"""
-    async with httpx.AsyncClient() as client:
+    catalog = shared_catalog.view()
+    if catalog is not None:
+        return catalog.settings()
+    async with upstream_client() as client:
         response = await client.get(
             f"{SUPABASE_URL}/rest/v1/app_settings",
             headers=get_supabase_headers()
@@ -590,7 +1282,7 @@ async def get_all_settings():
 @app.post("/api/admin/settings")
 async def update_setting(setting: AppSettings):
     """Update or create an app setting (Admin only)"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         setting_data = {
             "key": setting.key,
             "value": setting.value,
@@ -619,27 +1311,121 @@ async def update_setting(setting: AppSettings):
             )
         
         if response.status_code in [200, 201, 204]:
+            shared_catalog.invalidate()
             return {"success": True}
         raise HTTPException(status_code=response.status_code, detail=response.text)
 
 # ============= ADMIN USER MANAGEMENT =============
 
-@app.get("/api/admin/users")
-async def get_all_users():
-    """Get all users (Admin only)"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/rest/v1/users?select=id,email,display_name,auth_provider,is_admin,terms_accepted,created_at&order=created_at.desc",
-            headers=get_supabase_headers()
-        )
-        if response.status_code == 200:
-            return response.json()
+USER_COLUMNS = ("id", "email", "display_name", "auth_provider", "is_admin", "terms_accepted", "created_at")
+USERS_PAGE_MAX = 1000
+EXPORT_PAGE_SIZE = 1000
+
+def user_filters(provider: Optional[str], is_admin: Optional[bool], terms_accepted: Optional[bool]) -> str:
+    filters = ""
+    if provider:
+        filters += f"&auth_provider=eq.{provider}"
+    if is_admin is not None:
+        filters += f"&is_admin=eq.{str(is_admin).lower()}"
+    if terms_accepted is not None:
+        filters += f"&terms_accepted=eq.{str(terms_accepted).lower()}"
+    return filters
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row.get("created_at"), row.get("id")]).encode()).decode()
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return [str(created_at), str(user_id)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def fetch_users_page(client, filters: str, limit: int, cursor: Optional[str] = None):
+    """
+    One page of users, newest first, keyset-paginated on (created_at, id) so
+    deep pages cost the same as the first. Returns (rows, next cursor or None).
+    """
+    url = (f"{SUPABASE_URL}/rest/v1/users?select={','.join(USER_COLUMNS)}"
+           f"&order=created_at.desc,id.desc&limit={limit}{filters}")
+    if cursor:
+        created_at, user_id = (quote(value, safe="") for value in decode_cursor(cursor))
+        url += f"&or=(created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{user_id}))"
+    response = await client.get(url, headers=get_supabase_headers())
+    if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail=response.text)
+    rows = response.json()
+    return rows, encode_cursor(rows[-1]) if len(rows) == limit else None
+
+@app.get("/api/admin/users", dependencies=[Depends(require_admin)])
+async def get_all_users(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    provider: Optional[str] = None,
+    is_admin: Optional[bool] = None,
+    terms_accepted: Optional[bool] = None
+):
+    """
+    Users newest first, one page at a time (Admin only). Pass the X-Next-Cursor
+    response header back as `cursor` for the next page; it is absent on the last.
+    """
+    if not 1 <= limit <= USERS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {USERS_PAGE_MAX}")
+    async with upstream_client() as client:
+        rows, next_cursor = await fetch_users_page(client, user_filters(provider, is_admin, terms_accepted),
+                                                   limit, cursor)
+    return JSONResponse(rows, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+@app.get("/api/admin/users/export", dependencies=[Depends(require_admin)])
+async def export_users(
+    format: str = "ndjson",
+    provider: Optional[str] = None,
+    is_admin: Optional[bool] = None,
+    terms_accepted: Optional[bool] = None
+):
+    """
+    Every matching user as NDJSON or CSV (Admin only), streamed page by page
+    from Supabase so memory stays flat however many users there are
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    filters = user_filters(provider, is_admin, terms_accepted)
+
+    async def pages():
+        cursor = None
+        async with upstream_client() as client:
+            while True:
+                rows, cursor = await fetch_users_page(client, filters, EXPORT_PAGE_SIZE, cursor)
+                yield rows
+                if cursor is None:
+                    return
+
+    async def ndjson():
+        async for rows in pages():
+            if rows:
+                yield "".join(json.dumps(row) + "\n" for row in rows)
+
+    async def csv_lines():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=USER_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        async for rows in pages():
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        ndjson() if format == "ndjson" else csv_lines(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'}
+    )
 
 @app.patch("/api/admin/users/{user_id}/toggle-admin")
 async def toggle_admin(user_id: str):
     """Toggle admin status for a user"""
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         get_resp = await client.get(
             f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}&select=is_admin,email",
             headers=get_supabase_headers()
@@ -656,44 +1442,36 @@ async def toggle_admin(user_id: str):
                 return {"success": True, "is_admin": new_status}
         raise HTTPException(status_code=400, detail="Failed to toggle admin status")
 
-@app.delete("/api/admin/users/{user_id}")
+@app.delete("/api/admin/users/{user_id}", dependencies=[Depends(require_admin)])
 async def delete_user(user_id: str):
     """
-    Securely delete a user using the SUPABASE_SERVICE_ROLE_KEY.
-    This bypasses Row Level Security and removes the user from:
-    1. user_activity table (cascade)
-    2. users table (app data)
-    3. auth.users (Supabase Auth - requires service role)
+    Securely delete a user using the SUPABASE_SERVICE_ROLE_KEY, as a
+    background job (see purge_user_job). Poll /api/admin/jobs/{job_id}.
     """
     if not SUPABASE_SERVICE_ROLE_KEY:
         raise HTTPException(
             status_code=500,
             detail="SUPABASE_SERVICE_ROLE_KEY is not configured. Cannot delete users securely."
         )
-    async with httpx.AsyncClient() as client:
-        # Step 1: Delete user activity records
-        await client.delete(
-            f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{user_id}",
-            headers=get_service_role_headers()
-        )
-        # Step 2: Delete from app users table
-        await client.delete(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers=get_service_role_headers()
-        )
-        # Step 3: Delete from Supabase Auth (requires service role)
-        auth_resp = await client.delete(
-            f"{SUPABASE_URL}/auth/v1/admin/users/{user_id}",
-            headers=get_service_role_headers()
-        )
-        if auth_resp.status_code in [200, 204]:
-            return {"success": True, "message": f"User {user_id} deleted from all tables"}
-        # If auth deletion failed but DB rows were removed, still report partial success
-        return {
-            "success": True,
-            "message": f"User removed from app tables. Auth removal status: {auth_resp.status_code}",
-            "warning": "Auth record may need manual cleanup if status is not 200"
-        }
+    job = submit_job("purge_user", user_id=user_id)
+    return JSONResponse(status_code=202, content={
+        "success": True,
+        "message": f"Deletion of user {user_id} queued",
+        "job_id": job.id,
+        "job": job.to_dict(),
+    })
+
+# ============= ADMIN ANALYTICS =============
+
+@app.get("/api/admin/analytics", dependencies=[Depends(require_admin)])
+async def get_analytics(days: int = 30):
+    """
+    Daily active readers, opens per book and category, favorites, signups and
+    guest-to-registered conversion for the last `days` days, from in-memory rollups
+    """
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be positive")
+    return analytics.report(days)
 
 # ============= ADMIN BATCH SETTINGS =============
 
@@ -701,7 +1479,7 @@ async def delete_user(user_id: str):
 async def update_settings_batch(settings: List[AppSettings]):
     """Update multiple settings at once"""
     results = []
-    async with httpx.AsyncClient() as client:
+    async with upstream_client() as client:
         for setting in settings:
             setting_data = {
                 "key": setting.key,
@@ -725,15 +1503,150 @@ async def update_settings_batch(settings: List[AppSettings]):
                     json=setting_data
                 )
             results.append({"key": setting.key, "success": response.status_code in [200, 201, 204]})
+    shared_catalog.invalidate()
     return {"results": results}
 
-# ============= BOOK SEEDING =============
+# ============= BACKGROUND JOBS =============
+
+jobs = JobRunner()
+
+def submit_job(kind: str, **params) -> Job:
+    try:
+        return jobs.submit(kind, **params)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+async def purge_user_job(job: Job, user_id: str):
+    """
+    Removes the user from:
+    1. user_activity and highlights tables
+    2. users table (app data)
+    3. auth.users (Supabase Auth - requires service role)
+    This bypasses Row Level Security. Once started it runs to the end, since
+    stopping halfway would leave an account without its data. If any data
+    delete fails the job fails and the auth user is kept, so the purge can be
+    run again instead of leaving personal data behind a deleted account.
+    """
+    async with upstream_client() as client:
+        job.update(0, 3, "Deleting activity and highlights")
+        # Independent tables, so both deletes go out together
+        responses = await asyncio.gather(
+            client.delete(f"{SUPABASE_URL}/rest/v1/user_activity?user_id=eq.{user_id}",
+                          headers=get_service_role_headers()),
+            client.delete(f"{SUPABASE_URL}/rest/v1/highlights?user_id=eq.{user_id}",
+                          headers=get_service_role_headers()),
+        )
+        activity_cache.remove(user_id)
+        for table, response in zip(("user_activity", "highlights"), responses):
+            if response.status_code not in [200, 204]:
+                raise RuntimeError(f"deleting {table} rows failed: {response.status_code}")
+        job.update(1, message="Deleting profile", check=False)
+        response = await client.delete(
+            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
+            headers=get_service_role_headers()
+        )
+        if response.status_code not in [200, 204]:
+            raise RuntimeError(f"deleting the profile failed: {response.status_code}")
+        job.update(2, message="Deleting auth user", check=False)
+        auth_resp = await client.delete(
+            f"{SUPABASE_URL}/auth/v1/admin/users/{user_id}",
+            headers=get_service_role_headers()
+        )
+        job.update(3, check=False)
+    if auth_resp.status_code in [200, 204]:
+        return {"message": f"User {user_id} deleted from all tables"}
+    # If auth deletion failed but DB rows were removed, still report partial success
+    return {
+        "message": f"User removed from app tables. Auth removal status: {auth_resp.status_code}",
+        "warning": "Auth record may need manual cleanup if status is not 200"
+    }
+
+async def seed_books_job(job: Job, count: int, skip_duplicates: bool = True):
+    """Seed classic books from Project Gutenberg with seed_books.py; cancellable between books"""
+    import seed_books as seeder
+
+    counts = await seeder.seed_all_books(
+        count, skip_duplicates=skip_duplicates,
+        progress=lambda done, total, title: job.update(done, total, title)
+    )
+    shared_catalog.invalidate()
+    return counts
+
+# Books per page of the text stats backfill; each row carries its whole content_body
+BACKFILL_BATCH = 20
+
+async def backfill_text_stats_job(job: Job, recompute: bool = False):
+    """
+    Store text statistics on books written before they were computed, walking
+    the catalog by id a batch at a time; cancellable between batches
+    """
+    missing = "" if recompute else "&word_count=is.null"
+    done = updated = last_id = 0
+    async with upstream_client() as client:
+        response = await client.get(f"{SUPABASE_URL}/rest/v1/books?select=id{missing}&limit=1",
+                                    headers={**get_supabase_headers(), "Prefer": "count=exact"})
+        total = response.headers.get("Content-Range", "*/0").rsplit("/", 1)[-1]
+        job.update(0, int(total) if total.isdigit() else None, "Computing text statistics")
+        while True:
+            response = await client.get(
+                f"{SUPABASE_URL}/rest/v1/books?select=id,content_body&id=gt.{last_id}{missing}"
+                f"&order=id.asc&limit={BACKFILL_BATCH}",
+                headers=get_supabase_headers()
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"paging books after id {last_id} failed: {response.status_code}")
+            rows = response.json()
+            if not rows:
+                break
+            results = await asyncio.gather(*(
+                client.patch(f"{SUPABASE_URL}/rest/v1/books?id=eq.{row['id']}",
+                             headers={**get_supabase_headers(), "Prefer": "return=minimal"},
+                             json=text_stats(row.get("content_body")))
+                for row in rows
+            ))
+            updated += sum(1 for r in results if r.status_code in [200, 204])
+            done += len(rows)
+            last_id = rows[-1]["id"]
+            job.update(done)
+    shared_catalog.invalidate()
+    return {"updated": updated, "failed": done - updated}
+
+jobs.register("purge_user", purge_user_job)
+jobs.register("seed_books", seed_books_job)
+jobs.register("backfill_text_stats", backfill_text_stats_job)
+
+@app.post("/api/admin/seed-books", status_code=202, dependencies=[Depends(require_admin)])
+async def seed_books(count: int = 50, skip_duplicates: bool = True):
+    """Start seeding books as a background job (Admin only)"""
+    if count < 1:
+        raise HTTPException(status_code=400, detail="count must be positive")
+    return submit_job("seed_books", count=count, skip_duplicates=skip_duplicates).to_dict()
+
+@app.post("/api/admin/books/backfill-stats", status_code=202, dependencies=[Depends(require_admin)])
+async def backfill_text_stats(recompute: bool = False):
+    """Start computing word count, chapter count and reading time of stored books (Admin only)"""
+    return submit_job("backfill_text_stats", recompute=recompute).to_dict()
+
+@app.get("/api/admin/jobs", dependencies=[Depends(require_admin)])
+async def list_jobs(limit: int = 50):
+    """Recent background jobs, newest first"""
+    return [job.to_dict() for job in jobs.list(limit)]
+
+@app.get("/api/admin/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def get_job(job_id: str):
+    """State, progress and result of a background job"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
-@app.post("/api/admin/seed-books")
-async def seed_books(count: int = 50):
-    """Seed books from Standard Ebooks (Admin only)"""
-    # This is a simplified version - actual seeding should be done via a separate script
-    return {"message": "Use the seed_books.py script to seed books from Standard Ebooks"}
+@app.post("/api/admin/jobs/{job_id}/cancel", dependencies=[Depends(require_admin)])
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or ask a running one to stop at its next checkpoint"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 # ============= ADS VERIFICATION =============
 
@@ -750,5 +1663,5 @@ async def get_app_ads_txt():
     return ADS_TXT_CONTENT
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    from launcher import main
+    main(SUPABASE_URL, get_supabase_headers())
@@ -0,0 +1,316 @@
+"""
+Shared-memory catalog for multi-worker serving
+One loader (the launcher process) snapshots book metadata and app settings
+into a single file of packed, array-backed sections. Every worker mmaps it and
+answers catalog list queries straight from the shared pages, so N workers
+hold one copy of the catalog instead of N.
+
+Layout: MAGIC, a u32 header length, a JSON header (generation, section
+offsets, category directory), then 8-byte aligned sections:
+  records       JSON of each book, ranked by read_count desc, id asc
+  offsets       u32[count + 1] record boundaries
+  category_ids  u16[count] index into the header's category list
+  flags         u8[count] bit 0 = is_featured
+  featured      u32 ranks of featured books
+  by_category   u32 ranks grouped per category
+  text          "title\\0author\\n" per book, lowercased, for substring search
+  text_offsets  u32[count + 1]
+  settings      JSON list of app_settings rows
+"""
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LBRCAT01"
+BOOK_COLUMNS = "id,title,author,category,cover_image,is_featured,read_count,description,word_count,chapter_count,reading_minutes"
+FEATURED = 1
+# How often a worker looks for a newer snapshot
+CHECK_INTERVAL = 1.0
+FETCH_PAGE_SIZE = 1000
+NO_CATEGORY = 0xFFFF
+
+
+def build_segment(books: List[Dict[str, Any]], settings: List[Dict[str, Any]], generation: int) -> bytes:
+    """Pack a catalog snapshot into the segment format"""
+    books = sorted(books, key=lambda b: (-(b.get("read_count") or 0), b.get("id") or 0))
+    categories = sorted({b["category"] for b in books if b.get("category")})
+    category_ids = {name: i for i, name in enumerate(categories)}
+
+    records, offsets = bytearray(), array("I", [0])
+    text, text_offsets = bytearray(), array("I", [0])
+    book_categories, flags, featured = array("H"), array("B"), array("I")
+    grouped: Dict[str, array] = {name: array("I") for name in categories}
+    for rank, book in enumerate(books):
+        records += json.dumps(book, separators=(",", ":")).encode()
+        offsets.append(len(records))
+        text += f"{(book.get('title') or '').lower()}\0{(book.get('author') or '').lower()}\n".encode()
+        text_offsets.append(len(text))
+        category = book.get("category")
+        book_categories.append(category_ids.get(category, NO_CATEGORY))
+        flags.append(FEATURED if book.get("is_featured") else 0)
+        if book.get("is_featured"):
+            featured.append(rank)
+        if category in grouped:
+            grouped[category].append(rank)
+
+    by_category, directory = array("I"), {}
+    for name in categories:
+        directory[name] = [len(by_category), len(grouped[name])]
+        by_category.extend(grouped[name])
+
+    sections = [
+        ("records", bytes(records)), ("offsets", offsets.tobytes()),
+        ("category_ids", book_categories.tobytes()), ("flags", flags.tobytes()),
+        ("featured", featured.tobytes()), ("by_category", by_category.tobytes()),
+        ("text", bytes(text)), ("text_offsets", text_offsets.tobytes()),
+        ("settings", json.dumps(settings, separators=(",", ":")).encode()),
+    ]
+    header = {"generation": generation, "created_at": time.time(), "count": len(books),
+              "categories": categories, "by_category": directory, "sections": {}}
+    # Section offsets depend on the header length, so size the header first
+    # with placeholder offsets of the final width
+    for name, data in sections:
+        header["sections"][name] = [10 ** 12, len(data)]
+    start = _align(len(MAGIC) + 4 + len(json.dumps(header).encode()))
+    position = start
+    for name, data in sections:
+        header["sections"][name] = [position, len(data)]
+        position = _align(position + len(data))
+    encoded = json.dumps(header).encode()
+    encoded += b" " * (start - len(MAGIC) - 4 - len(encoded))
+
+    out = bytearray(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+    for name, data in sections:
+        out += b"\0" * (header["sections"][name][0] - len(out))
+        out += data
+    return bytes(out)
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def publish(path: str, books: List[Dict[str, Any]], settings: List[Dict[str, Any]], generation: int):
+    """Write a new snapshot next to `path` and swap it in atomically"""
+    data = build_segment(books, settings, generation)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    # Workers still mapping the old file keep its pages until they re-open
+    os.replace(tmp, path)
+
+
+def fetch_catalog(supabase_url: str, headers: Dict[str, str],
+                  client: Optional[httpx.Client] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Read every book's list metadata and all app settings from Supabase"""
+    own_client = client is None
+    client = client or httpx.Client(timeout=30)
+    try:
+        books: List[Dict[str, Any]] = []
+        while True:
+            response = client.get(
+                f"{supabase_url}/rest/v1/books?select={BOOK_COLUMNS}&order=id.asc"
+                f"&limit={FETCH_PAGE_SIZE}&offset={len(books)}",
+                headers=headers
+            )
+            response.raise_for_status()
+            page = response.json()
+            books.extend(page)
+            if len(page) < FETCH_PAGE_SIZE:
+                break
+        response = client.get(f"{supabase_url}/rest/v1/app_settings", headers=headers)
+        response.raise_for_status()
+        return books, response.json()
+    finally:
+        if own_client:
+            client.close()
+
+
+class CatalogView:
+    """Read-only queries over one mapped snapshot"""
+
+    def __init__(self, mapped: mmap.mmap):
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a catalog segment")
+        (length,) = struct.unpack_from("<I", mapped, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(mapped[start:start + length]))
+        self.generation: int = self.header["generation"]
+        self.count: int = self.header["count"]
+        self.categories: List[str] = self.header["categories"]
+        self._mapped = mapped
+        self._memory = memoryview(mapped)
+        self.offsets = self._section("offsets").cast("I")
+        self.category_ids = self._section("category_ids").cast("H")
+        self.flags = self._section("flags")
+        self.featured = self._section("featured").cast("I")
+        self.by_category = self._section("by_category").cast("I")
+        self.text_offsets = self._section("text_offsets").cast("I")
+        self._records = self.header["sections"]["records"][0]
+        self._text = self.header["sections"]["text"]
+
+    def _section(self, name: str) -> memoryview:
+        offset, length = self.header["sections"][name]
+        return self._memory[offset:offset + length]
+
+    def record(self, rank: int) -> Dict[str, Any]:
+        start = self._records + self.offsets[rank]
+        return json.loads(self._mapped[start:self._records + self.offsets[rank + 1]])
+
+    def _search(self, needle: str):
+        """Ranks whose title or author contains needle, best ranked first"""
+        encoded = needle.lower().encode()
+        base, length = self._text
+        end, position = base + length, base
+        while True:
+            hit = self._mapped.find(encoded, position, end)
+            if hit < 0:
+                return
+            rank = bisect.bisect_right(self.text_offsets, hit - base) - 1
+            field_end = self._mapped.find(b"\0", base + self.text_offsets[rank], end)
+            if hit >= field_end:
+                field_end = base + self.text_offsets[rank + 1] - 1
+            if hit + len(encoded) <= field_end:
+                yield rank
+            position = hit + 1
+
+    def books(self, limit: int = 50, offset: int = 0, category: Optional[str] = None,
+              featured: Optional[bool] = None, search: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Same rows and order as the books list query against PostgREST"""
+        category_id = None
+        # Empty means no filter, as in the PostgREST query (book_filters)
+        if category:
+            if category not in self.header["by_category"]:
+                return []
+            category_id = self.categories.index(category)
+        # Walk the narrowest ranked source, checking the remaining filters per row
+        if search:
+            candidates = sorted(set(self._search(search)))
+        elif category:
+            start, count = self.header["by_category"][category]
+            candidates = self.by_category[start:start + count]
+        elif featured:
+            candidates = self.featured
+        else:
+            candidates = range(self.count)
+        selected: List[int] = []
+        wanted = max(0, offset) + max(0, limit)
+        for rank in candidates:
+            if category_id is not None and self.category_ids[rank] != category_id:
+                continue
+            if featured is not None and bool(self.flags[rank] & FEATURED) != featured:
+                continue
+            selected.append(rank)
+            if len(selected) >= wanted:
+                break
+        return [self.record(rank) for rank in selected[max(0, offset):]]
+
+    def settings(self) -> List[Dict[str, Any]]:
+        offset, length = self.header["sections"]["settings"]
+        return json.loads(self._mapped[offset:offset + length])
+
+
+class SharedCatalog:
+    """
+    Worker side: maps the latest published snapshot and re-maps when the
+    loader replaces it. view() is None when no snapshot is configured or
+    readable, and callers fall back to Supabase.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._view: Optional[CatalogView] = None
+        self._inode: Optional[int] = None
+        self._checked = 0.0
+
+    def view(self) -> Optional[CatalogView]:
+        if not self.path:
+            return None
+        now = time.monotonic()
+        if now - self._checked >= CHECK_INTERVAL or self._view is None:
+            self._checked = now
+            self._reopen()
+        return self._view
+
+    def _reopen(self):
+        try:
+            stat = os.stat(self.path)
+            if stat.st_ino == self._inode:
+                return
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view, self._inode = CatalogView(mapped), stat.st_ino
+        except (OSError, ValueError) as e:
+            if self._view is None:
+                logger.debug("shared catalog unavailable: %s", e)
+
+    def invalidate(self):
+        """Ask the loader for a fresh snapshot after a catalog or settings write"""
+        if self.path:
+            try:
+                with open(self.path + ".dirty", "w"):
+                    pass
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        view = self._view
+        return {"path": self.path, "generation": view.generation if view else None,
+                "books": view.count if view else 0}
+
+
+class CatalogLoader:
+    """Loader side: publishes a snapshot now and refreshes it every `interval` or on demand"""
+
+    def __init__(self, path: str, supabase_url: str, headers: Dict[str, str], interval: float = 30.0):
+        self.path = path
+        self.supabase_url = supabase_url
+        self.headers = headers
+        self.interval = interval
+        self.generation = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> bool:
+        try:
+            books, settings = fetch_catalog(self.supabase_url, self.headers)
+        except (httpx.HTTPError, ValueError) as e:
+            # Workers keep serving the previous snapshot
+            logger.warning("catalog refresh failed: %s", e)
+            return False
+        self.generation += 1
+        publish(self.path, books, settings, self.generation)
+        return True
+
+    def _run(self):
+        last = time.monotonic()
+        while not self._stop.wait(0.5):
+            dirty = os.path.exists(self.path + ".dirty")
+            if dirty or time.monotonic() - last >= self.interval:
+                if dirty:
+                    try:
+                        os.remove(self.path + ".dirty")
+                    except OSError:
+                        pass
+                self.refresh()
+                last = time.monotonic()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="catalog-loader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
@@ -0,0 +1,117 @@
+"""
+Per-Worker Snapshots for Libreya
+JSON snapshots of in-memory counters (trending, analytics) that survive a
+restart when several worker processes run side by side.
+
+Each process writes its own file, <path>.<pid>, so workers never overwrite
+each other. On startup a process claims the files left by processes that are
+gone (plus the one carrying its own pid) by renaming them, which only one
+claimant can win, and merges them into its counters: every count is restored
+exactly once, spread over the new workers. Files of live workers can be read
+to report across all of them.
+
+Writes happen in a thread so the event loop never waits on the disk.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def own_path(path: str) -> str:
+    return f"{path}.{os.getpid()}"
+
+
+def _pid_of(path: str, file: str) -> int:
+    """Pid in the name of a worker file, 0 for the single-process file of older versions"""
+    suffix = file[len(path):]
+    return int(suffix[1:]) if suffix[1:].isdigit() else 0
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _worker_files(path: str) -> List[str]:
+    files = [file for file in glob.glob(glob.escape(path) + ".*") if file[len(path) + 1:].isdigit()]
+    return ([path] if os.path.exists(path) else []) + files
+
+
+def write(path: str, data: Dict[str, Any]):
+    """Atomically replace this process's file with data"""
+    target = own_path(path)
+    tmp = target + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, target)
+
+
+def save(path: str, data: Dict[str, Any], what: str, background: bool = True):
+    """write() in a worker thread when called from the event loop, else right away"""
+    def run():
+        try:
+            write(path, data)
+        except OSError as e:
+            logger.warning("could not save %s snapshot: %s", what, e)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None or not background:
+        run()
+    else:
+        loop.run_in_executor(None, run)
+
+
+def claim(path: str, what: str) -> List[Dict[str, Any]]:
+    """Take over the snapshots nobody else owns any more; each is handed out once"""
+    pid = os.getpid()
+    claimed = []
+    for file in _worker_files(path):
+        owner = _pid_of(path, file)
+        if owner != pid and owner and _alive(owner):
+            continue
+        taken = f"{file}.claimed-{pid}"
+        try:
+            os.rename(file, taken)
+        except OSError:
+            # Claimed by another worker first
+            continue
+        try:
+            with open(taken) as f:
+                claimed.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning("could not load %s snapshot %s: %s", what, file, e)
+        finally:
+            try:
+                os.remove(taken)
+            except OSError:
+                pass
+    return claimed
+
+
+def peers(path: str) -> List[Dict[str, Any]]:
+    """Last saved snapshots of the other live workers"""
+    pid = os.getpid()
+    snapshots = []
+    for file in _worker_files(path):
+        owner = _pid_of(path, file)
+        if not owner or owner == pid or not _alive(owner):
+            continue
+        try:
+            with open(file) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
@@ -19,6 +19,9 @@ CREATE TABLE IF NOT EXISTS public.users (
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Keyset pagination of the admin user list (newest first)
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON public.users(created_at DESC, id DESC);
+
 -- ============= BOOKS TABLE =============
 CREATE TABLE IF NOT EXISTS public.books (
     id BIGSERIAL PRIMARY KEY,
@@ -42,6 +45,20 @@ CREATE INDEX IF NOT EXISTS idx_books_category ON public.books(category);
 CREATE INDEX IF NOT EXISTS idx_books_featured ON public.books(is_featured);
 CREATE INDEX IF NOT EXISTS idx_books_read_count ON public.books(read_count DESC);
 
+-- Weighted multi-labels from the categorization engine, e.g. [{"category": "Science Fiction", "weight": 0.8}]
+ALTER TABLE public.books ADD COLUMN IF NOT EXISTS categories JSONB DEFAULT '[]'::jsonb;
+
+-- Upstream text URL and HTTP cache validators, used by the seeder's --sync mode
+ALTER TABLE public.books ADD COLUMN IF NOT EXISTS source_text_url TEXT;
+ALTER TABLE public.books ADD COLUMN IF NOT EXISTS source_etag TEXT;
+ALTER TABLE public.books ADD COLUMN IF NOT EXISTS source_last_modified TEXT;
+
+-- Text statistics computed when content_body is written (backend/text_stats.py);
+-- rows stored before them are filled by the backfill-stats admin job
+ALTER TABLE public.books ADD COLUMN IF NOT EXISTS word_count INTEGER;
+ALTER TABLE public.books ADD COLUMN IF NOT EXISTS chapter_count INTEGER;
+ALTER TABLE public.books ADD COLUMN IF NOT EXISTS reading_minutes INTEGER;
+
 -- ============= USER ACTIVITY TABLE =============
 CREATE TABLE IF NOT EXISTS public.user_activity (
     id BIGSERIAL PRIMARY KEY,
@@ -60,6 +77,49 @@ CREATE INDEX IF NOT EXISTS idx_user_activity_user_id ON public.user_activity(use
 CREATE INDEX IF NOT EXISTS idx_user_activity_book_id ON public.user_activity(book_id);
 CREATE INDEX IF NOT EXISTS idx_user_activity_favorite ON public.user_activity(user_id, is_favorite) WHERE is_favorite = TRUE;
 
+-- ============= HIGHLIGHTS TABLE =============
+-- One row per highlight, so adding, editing or deleting one doesn't rewrite
+-- the user_activity.highlights array. The index serves one chapter's
+-- highlights in reading order.
+CREATE TABLE IF NOT EXISTS public.highlights (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
+    book_id BIGINT NOT NULL REFERENCES public.books(id) ON DELETE CASCADE,
+    chapter INTEGER NOT NULL DEFAULT 0,
+    position FLOAT NOT NULL DEFAULT 0.0,
+    end_position FLOAT,
+    text TEXT NOT NULL,
+    color TEXT,
+    note TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_highlights_user_book_chapter ON public.highlights(user_id, book_id, chapter, position);
+
+-- One-time copy of highlights saved in the legacy JSONB array
+INSERT INTO public.highlights (user_id, book_id, chapter, position, text, created_at, updated_at)
+SELECT ua.user_id, ua.book_id, COALESCE((h->>'chapter')::int, 0), COALESCE((h->>'position')::float, 0.0),
+       h->>'text', ua.updated_at, ua.updated_at
+FROM public.user_activity ua
+CROSS JOIN LATERAL jsonb_array_elements(ua.highlights) AS h
+WHERE jsonb_typeof(ua.highlights) = 'array' AND h->>'text' IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM public.highlights x WHERE x.user_id = ua.user_id AND x.book_id = ua.book_id
+  );
+
+-- ============= BOOK FINGERPRINTS TABLE =============
+-- MinHash signatures used by the seeder to detect near-duplicate editions.
+-- bands holds the LSH bucket keys so candidates can be found with an overlap query.
+CREATE TABLE IF NOT EXISTS public.book_fingerprints (
+    book_id BIGINT PRIMARY KEY REFERENCES public.books(id) ON DELETE CASCADE,
+    signature JSONB NOT NULL,
+    bands TEXT[] NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_book_fingerprints_bands ON public.book_fingerprints USING gin(bands);
+
 -- ============= APP SETTINGS TABLE =============
 CREATE TABLE IF NOT EXISTS public.app_settings (
     id BIGSERIAL PRIMARY KEY,
@@ -75,6 +135,8 @@ ALTER TABLE public.users ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.books ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.user_activity ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.app_settings ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.book_fingerprints ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.highlights ENABLE ROW LEVEL SECURITY;
 
 -- Users policies
 CREATE POLICY "Users can view their own profile" ON public.users
@@ -115,6 +177,14 @@ CREATE POLICY "Users can update their own activity" ON public.user_activity
 CREATE POLICY "Users can delete their own activity" ON public.user_activity
     FOR DELETE USING (true);
 
+-- Highlights policies
+CREATE POLICY "Users can manage their own highlights" ON public.highlights
+    FOR ALL USING (true);
+
+-- Book fingerprints policies (seeder only)
+CREATE POLICY "Seeder can manage fingerprints" ON public.book_fingerprints
+    FOR ALL USING (true);  -- Will be restricted by API
+
 -- App settings policies (public read, admin write)
 CREATE POLICY "Anyone can read settings" ON public.app_settings
     FOR SELECT USING (true);
@@ -218,8 +288,25 @@ ON CONFLICT (key) DO NOTHING;
 CREATE OR REPLACE FUNCTION migrate_guest_data(guest_uuid UUID, new_user_id UUID)
 RETURNS void AS $$
 BEGIN
-    -- Update all user_activity records
-    UPDATE public.user_activity 
+    -- Move user_activity records, merging books both accounts have read
+    INSERT INTO public.user_activity (user_id, book_id, last_position, is_favorite, highlights,
+                                      chapter_read_count, created_at, updated_at)
+    SELECT new_user_id, g.book_id, g.last_position, g.is_favorite, g.highlights,
+           g.chapter_read_count, g.created_at, NOW()
+    FROM public.user_activity g
+    WHERE g.user_id = guest_uuid
+    ON CONFLICT (user_id, book_id) DO UPDATE SET
+        last_position = GREATEST(user_activity.last_position, EXCLUDED.last_position),
+        is_favorite = user_activity.is_favorite OR EXCLUDED.is_favorite,
+        highlights = (SELECT COALESCE(jsonb_agg(DISTINCT h), '[]'::jsonb)
+                      FROM jsonb_array_elements(user_activity.highlights || EXCLUDED.highlights) h),
+        chapter_read_count = GREATEST(user_activity.chapter_read_count, EXCLUDED.chapter_read_count),
+        created_at = LEAST(user_activity.created_at, EXCLUDED.created_at),
+        updated_at = NOW();
+
+    DELETE FROM public.user_activity WHERE user_id = guest_uuid;
+
+    UPDATE public.highlights
     SET user_id = new_user_id, updated_at = NOW()
     WHERE user_id = guest_uuid;
     
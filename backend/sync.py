@@ -0,0 +1,164 @@
+"""
+Cross-device sync for Libreya
+In-process pub/sub pushing reading progress and favorite changes to a user's
+other connected devices over server-sent events.
+
+Each connection is one Subscriber: a coroutine parked on an asyncio.Event and
+a small dict of pending events, so idle connections cost a few KB each.
+Pending events are keyed (by default on (event, book_id)) and coalesced, so a slow reader
+only ever gets the latest position of each book. A subscriber that still
+falls MAX_PENDING keys behind is told to resync and is disconnected, instead
+of buffering without bound.
+
+Publishing is per process: with several workers, a device only hears about
+writes handled by the worker it is connected to.
+"""
+import asyncio
+import itertools
+import json
+import os
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+from metrics import Counter, gauge_from
+
+SYNC_MAX_CONNECTIONS = int(os.getenv("SYNC_MAX_CONNECTIONS", "10000"))
+SYNC_MAX_PER_USER = int(os.getenv("SYNC_MAX_PER_USER", "8"))
+SYNC_HEARTBEAT = float(os.getenv("SYNC_HEARTBEAT", "15"))
+MAX_PENDING = 64
+
+# Tells the client to refetch with the REST endpoints; the stream ends after it
+RESYNC = "resync"
+
+
+class SyncLimitReached(Exception):
+    pass
+
+
+class Subscriber:
+    def __init__(self, user_id: str, device_id: Optional[str]):
+        self.user_id = user_id
+        self.device_id = device_id
+        self.pending: "OrderedDict[Tuple[str, Any], Tuple[int, str, Dict[str, Any]]]" = OrderedDict()
+        self.wake = asyncio.Event()
+        self.overflowed = False
+
+    def offer(self, key: Tuple[str, Any], event: Tuple[int, str, Dict[str, Any]]) -> bool:
+        """Queue an event, replacing an older one with the same key; False on overflow"""
+        if key in self.pending:
+            del self.pending[key]
+        elif len(self.pending) >= MAX_PENDING:
+            self.overflowed = True
+            self.pending.clear()
+            self.wake.set()
+            return False
+        self.pending[key] = event
+        self.wake.set()
+        return True
+
+
+class SyncHub:
+    def __init__(self, max_connections: int = SYNC_MAX_CONNECTIONS, max_per_user: int = SYNC_MAX_PER_USER):
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.users: Dict[str, Set[Subscriber]] = {}
+        self.connections = 0
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.overflows = 0
+        self.rejected = 0
+        self._ids = itertools.count(1)
+
+    def admit(self, user_id: str, device_id: Optional[str] = None) -> Subscriber:
+        """
+        Subscribe a new stream for user_id, or raise SyncLimitReached when it
+        would exceed the limits. Checked and counted in one step, so concurrent
+        requests can't all pass the check before any of them is counted.
+        """
+        if self.connections >= self.max_connections or len(self.users.get(user_id, ())) >= self.max_per_user:
+            self.rejected += 1
+            raise SyncLimitReached("Too many sync connections")
+        return self.subscribe(user_id, device_id)
+
+    def subscribe(self, user_id: str, device_id: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(user_id, device_id)
+        self.users.setdefault(user_id, set()).add(subscriber)
+        self.connections += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        devices = self.users.get(subscriber.user_id)
+        if devices and subscriber in devices:
+            devices.discard(subscriber)
+            self.connections -= 1
+            if not devices:
+                del self.users[subscriber.user_id]
+
+    def publish(self, user_id: str, event: str, data: Dict[str, Any], origin: Optional[str] = None,
+                key: Any = None) -> int:
+        """
+        Queue an event for every device of user_id except the one it came from.
+        Pending events with the same (event, key) coalesce; key defaults to the book.
+        """
+        devices = self.users.get(user_id)
+        if not devices:
+            return 0
+        self.published += 1
+        message = (next(self._ids), event, data)
+        key = (event, data.get("book_id") if key is None else key)
+        reached = 0
+        for subscriber in devices:
+            if origin and subscriber.device_id == origin:
+                continue
+            if key in subscriber.pending:
+                self.coalesced += 1
+            if subscriber.offer(key, message):
+                reached += 1
+            else:
+                self.overflows += 1
+        return reached
+
+    async def stream(self, subscriber: Subscriber, heartbeat: float = SYNC_HEARTBEAT) -> AsyncIterator[str]:
+        """SSE frames for an admitted subscriber, unsubscribed when the generator ends"""
+        try:
+            yield f"retry: 5000\nevent: ready\ndata: {json.dumps({'user_id': subscriber.user_id})}\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wake.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": ping\n\n"
+                    continue
+                subscriber.wake.clear()
+                if subscriber.overflowed:
+                    yield f"event: {RESYNC}\ndata: {{}}\n\n"
+                    return
+                events = list(subscriber.pending.values())
+                subscriber.pending.clear()
+                self.delivered += len(events)
+                yield "".join(f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                              for event_id, event, data in events)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "users": len(self.users),
+            "published": self.published,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "overflows": self.overflows,
+            "rejected": self.rejected,
+        }
+
+
+hub = SyncHub()
+
+gauge_from("libreya_sync_connections", "Open cross-device sync streams",
+           lambda: {(): hub.connections})
+gauge_from("libreya_sync_events_total", "Sync events by outcome",
+           lambda: {("published",): hub.published, ("delivered",): hub.delivered,
+                    ("coalesced",): hub.coalesced, ("overflow",): hub.overflows},
+           labels=("outcome",), kind=Counter)
@@ -0,0 +1,134 @@
+"""
+Trending Books for Libreya
+Exponentially decayed open counts per book, kept in memory and fed by book
+opens, with a periodically rebuilt top-k list that order=trending reads from.
+
+Decay uses a fixed landmark instead of touching every counter: an open at
+time t adds exp(rate * (t - epoch)), so stored scores grow over time but keep
+their relative order, and the decayed score is stored / exp(rate * (now - epoch)).
+The landmark is moved forward before the weights get large.
+
+Counts are per process and persisted as a compact JSON snapshot (the top
+SNAPSHOT_SIZE books) so a restart doesn't start from zero. With several
+workers each one ranks the opens it served, which is a sample of all opens,
+and saves its own snapshot file; a restarted worker takes over the counts of
+the workers that have stopped (see snapshots.py).
+"""
+import heapq
+import math
+import os
+import time
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+import snapshots
+from metrics import gauge_from
+
+TRENDING_HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24")) * 3600
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "200"))
+TRENDING_SNAPSHOT = os.getenv("LIBREYA_TRENDING_SNAPSHOT",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), ".trending.json"))
+# Seconds between top-k rebuilds and between snapshots
+REFRESH_INTERVAL = 10.0
+SNAPSHOT_INTERVAL = 300.0
+SNAPSHOT_SIZE = 2000
+# Move the landmark before weights reach this; decayed scores below MIN_SCORE are dropped then
+MAX_WEIGHT = 1e12
+MIN_SCORE = 1e-3
+
+
+class Trending:
+    def __init__(self, half_life: float = TRENDING_HALF_LIFE, top_k: int = TRENDING_TOP_K,
+                 snapshot_path: Optional[str] = TRENDING_SNAPSHOT):
+        self.rate = math.log(2) / half_life
+        self.top_k = top_k
+        self.snapshot_path = snapshot_path
+        self.epoch = time.time()
+        self.scores: Dict[int, float] = {}
+        self.opens = 0
+        self.rebuilds = 0
+        self._top: List[Tuple[int, float]] = []
+        self._built: Optional[float] = None
+        self._saved = time.monotonic()
+
+    def _weight(self, now: float) -> float:
+        return math.exp(self.rate * (now - self.epoch))
+
+    def record(self, book_id: int, now: Optional[float] = None):
+        """Count one open of book_id"""
+        now = time.time() if now is None else now
+        weight = self._weight(now)
+        if weight > MAX_WEIGHT:
+            self._rebase(now)
+            weight = 1.0
+        self.scores[book_id] = self.scores.get(book_id, 0.0) + weight
+        self.opens += 1
+        if self.snapshot_path and time.monotonic() - self._saved >= SNAPSHOT_INTERVAL:
+            self.save()
+
+    def _rebase(self, now: float):
+        weight = self._weight(now)
+        self.scores = {book_id: score / weight for book_id, score in self.scores.items()
+                       if score / weight >= MIN_SCORE}
+        self.epoch = now
+
+    def score(self, book_id: int, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        return self.scores.get(book_id, 0.0) / self._weight(now)
+
+    def forget(self, book_id: int):
+        if self.scores.pop(book_id, None) is not None:
+            self._top = [entry for entry in self._top if entry[0] != book_id]
+
+    def top(self, now: Optional[float] = None) -> List[Tuple[int, float]]:
+        """(book_id, decayed score) of the top_k books, best first; rebuilt at most every REFRESH_INTERVAL"""
+        now = time.time() if now is None else now
+        if self._built is None or now - self._built >= REFRESH_INTERVAL:
+            weight = self._weight(now)
+            self._top = [(book_id, score / weight)
+                         for book_id, score in heapq.nlargest(self.top_k, self.scores.items(), key=itemgetter(1))]
+            self._built = now
+            self.rebuilds += 1
+        return self._top
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        weight = self._weight(now)
+        best = heapq.nlargest(SNAPSHOT_SIZE, self.scores.items(), key=itemgetter(1))
+        return {"at": now, "half_life": math.log(2) / self.rate,
+                "scores": {str(book_id): round(score / weight, 6) for book_id, score in best}}
+
+    def restore(self, snapshot: Dict[str, Any], now: Optional[float] = None):
+        """Merge a snapshot, decayed for the time since it was taken"""
+        now = time.time() if now is None else now
+        factor = math.exp(-self.rate * max(0.0, now - snapshot["at"])) * self._weight(now)
+        for book_id, score in snapshot["scores"].items():
+            self.scores[int(book_id)] = self.scores.get(int(book_id), 0.0) + score * factor
+        self._built = None
+
+    def save(self, background: bool = True):
+        self._saved = time.monotonic()
+        if self.snapshot_path:
+            snapshots.save(self.snapshot_path, self.snapshot(), "trending", background)
+
+    def load(self):
+        """Merge the snapshots of workers that have stopped"""
+        if not self.snapshot_path:
+            return
+        claimed = snapshots.claim(self.snapshot_path, "trending")
+        for snapshot in claimed:
+            try:
+                self.restore(snapshot)
+            except (ValueError, KeyError, TypeError):
+                continue
+        if claimed:
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"books": len(self.scores), "opens": self.opens, "top_k": self.top_k,
+                "half_life_hours": round(math.log(2) / self.rate / 3600, 2), "rebuilds": self.rebuilds}
+
+
+trending = Trending()
+
+gauge_from("libreya_trending_books", "Books with a decayed open count", lambda: {(): len(trending.scores)})
@@ -0,0 +1,104 @@
+"""
+Upstream (Supabase) HTTP Client for Libreya
+One pooled httpx client shared by every endpoint. Its transport stack is
+resilience (retries, breakers, stale cache) over admission control over
+per-attempt metrics and profiler traces over the pooled HTTP transport.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from admission import UpstreamLimiter
+from metrics import Counter, MetricsTransport, gauge_from, upstream_queue_wait
+from profiler import TracingTransport, on_queue_wait
+from resilience import Resilience, ResilientTransport
+
+UPSTREAM_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+UPSTREAM_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=32)
+
+limiter = UpstreamLimiter()
+
+
+def _observe_queue_wait(seconds: float):
+    upstream_queue_wait.observe(seconds)
+    on_queue_wait(seconds)
+
+
+limiter.on_wait = _observe_queue_wait
+resilience = Resilience()
+
+
+class LimitedTransport(httpx.AsyncBaseTransport):
+    """Holds an upstream slot from sending the request until its body is read"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, limiter: UpstreamLimiter):
+        self.inner = inner
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self.limiter.acquire()
+        try:
+            response = await self.inner.handle_async_request(request)
+            await response.aread()
+            return response
+        finally:
+            self.limiter.release()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def build_transport() -> httpx.AsyncBaseTransport:
+    # Retries sit above the limiter so every attempt waits for its own slot
+    timed = MetricsTransport(TracingTransport(httpx.AsyncHTTPTransport(limits=UPSTREAM_POOL_LIMITS)))
+    limited = LimitedTransport(timed, limiter)
+    return ResilientTransport(limited, resilience)
+
+
+gauge_from("libreya_upstream_queue_depth", "Requests waiting for an upstream slot",
+           lambda: {(): limiter.queue_depth})
+gauge_from("libreya_upstream_slots_in_use", "Upstream slots currently held",
+           lambda: {(): limiter.in_flight})
+gauge_from("libreya_upstream_shed_total", "Upstream requests shed by admission control",
+           lambda: {(): limiter.shed}, kind=Counter)
+gauge_from("libreya_upstream_retries_total", "Upstream read retries",
+           lambda: {(): resilience.retries}, kind=Counter)
+gauge_from("libreya_upstream_stale_served_total", "Responses served stale because the upstream failed",
+           lambda: {(): resilience.cache.stale_served}, kind=Counter)
+gauge_from("libreya_upstream_breaker_open", "1 when the circuit breaker of a table is not closed",
+           lambda: {(t,): float(b.state != "closed") for t, b in resilience.breakers.items()}, ("table",))
+
+# Pooled connections belong to the event loop that opened them
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(transport=build_transport(), timeout=UPSTREAM_TIMEOUT)
+        _client_loop = loop
+    return _client
+
+
+@asynccontextmanager
+async def upstream_client() -> AsyncIterator[httpx.AsyncClient]:
+    """Drop-in for `async with httpx.AsyncClient() as client` that reuses the shared pool"""
+    yield get_client()
+
+
+async def warm_pool(url: str, headers: dict, connections: int = 4):
+    """Open `connections` pooled connections (DNS, TCP and TLS) before the first real request"""
+    client = get_client()
+    # Concurrent requests can't share a connection, so each one opens its own
+    await asyncio.gather(*(client.get(url, headers=headers) for _ in range(connections)), return_exceptions=True)
+
+
+async def close_client():
+    global _client
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
@@ -293,7 +293,6 @@ export default function BookReaderScreen() {
         book_id: currentBook.id,
         last_position: currentActivity?.last_position || 0,
         is_favorite: newFavoriteStatus,
-        highlights: currentActivity?.highlights || [],
         chapter_read_count: currentActivity?.chapter_read_count || 0,
       };
 
@@ -115,6 +115,21 @@ export const api = {
       return data;
     }
 
+    // ============= HIGHLIGHTS =============
+    const highlightsMatch = endpoint.match(/^\/highlights\/([a-f0-9-]+)\/(\d+)$/);
+    if (highlightsMatch) {
+      const [, userId, bookId] = highlightsMatch;
+      const { data, error } = await supabase
+        .from('highlights')
+        .select('id, book_id, chapter, position, end_position, text, color, note, created_at, updated_at')
+        .eq('user_id', userId)
+        .eq('book_id', bookId)
+        .order('chapter', { ascending: true })
+        .order('position', { ascending: true });
+      if (error) throw new Error(error.message);
+      return data || [];
+    }
+
     // User's favorites
     const favoritesMatch = endpoint.match(/^\/favorites\/([a-f0-9-]+)$/);
     if (favoritesMatch) {
@@ -276,6 +291,18 @@ export const api = {
       }
     }
 
+    // ============= HIGHLIGHTS =============
+    if (endpoint === '/highlights') {
+      const now = new Date().toISOString();
+      const { data: created, error } = await supabase
+        .from('highlights')
+        .insert({ ...data, created_at: now, updated_at: now })
+        .select()
+        .single();
+      if (error) throw new Error(error.message);
+      return created;
+    }
+
     // ============= ADMIN BOOKS =============
     if (endpoint === '/admin/books') {
       const { data: newBook, error } = await supabase
@@ -370,6 +397,21 @@ export const api = {
       return updated;
     }
 
+    // ============= HIGHLIGHTS =============
+    const highlightMatch = endpoint.match(/^\/highlights\/([a-f0-9-]+)\/(\d+)$/);
+    if (highlightMatch) {
+      const [, userId, highlightId] = highlightMatch;
+      const { data: updated, error } = await supabase
+        .from('highlights')
+        .update({ ...data, updated_at: new Date().toISOString() })
+        .eq('id', highlightId)
+        .eq('user_id', userId)
+        .select()
+        .single();
+      if (error) throw new Error(error.message);
+      return updated;
+    }
+
     throw new Error(`Unknown PATCH endpoint: ${endpoint}`);
   },
 
@@ -411,6 +453,19 @@ export const api = {
       return { success: true };
     }
 
+    // ============= HIGHLIGHTS =============
+    const highlightMatch = endpoint.match(/^\/highlights\/([a-f0-9-]+)\/(\d+)$/);
+    if (highlightMatch) {
+      const [, userId, highlightId] = highlightMatch;
+      const { error } = await supabase
+        .from('highlights')
+        .delete()
+        .eq('id', highlightId)
+        .eq('user_id', userId);
+      if (error) throw new Error(error.message);
+      return { success: true };
+    }
+
     throw new Error(`Unknown DELETE endpoint: ${endpoint}`);
   },
 };
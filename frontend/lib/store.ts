@@ -26,6 +26,9 @@ export interface Book {
   is_featured: boolean;
   read_count: number;
   description?: string;
+  word_count?: number;
+  chapter_count?: number;
+  reading_minutes?: number;
 }
 
 export interface UserActivity {
@@ -34,10 +37,23 @@ export interface UserActivity {
   book_id: number;
   last_position: number;
   is_favorite: boolean;
-  highlights: Array<{ text: string; position: number; chapter?: number }>;
+  // Legacy per-row array, read only; highlights live in their own table (see Highlight)
+  highlights?: Array<{ text: string; position: number; chapter?: number }>;
   chapter_read_count: number;
 }
 
+export interface Highlight {
+  id?: number;
+  user_id?: string;
+  book_id: number;
+  chapter: number;
+  position: number;
+  end_position?: number;
+  text: string;
+  color?: string;
+  note?: string;
+}
+
 export interface AppSettings {
   terms_and_conditions: string;
   privacy_notice: string;
@@ -55,6 +71,7 @@ interface AppState {
   recommendedBooks: Book[];
   currentBook: Book | null;
   currentActivity: UserActivity | null;
+  highlights: Highlight[];
   favorites: Book[];
   settings: AppSettings | null;
   chaptersReadSinceAd: number;
@@ -76,6 +93,7 @@ interface AppState {
   updateActivity: (activity: Partial<UserActivity>) => Promise<void>;
   toggleFavorite: (bookId: number) => Promise<void>;
   addHighlight: (text: string, position: number, chapter?: number) => Promise<void>;
+  removeHighlight: (highlightId: number) => Promise<void>;
   acceptTerms: () => Promise<void>;
   deleteAccount: () => Promise<void>;
   signOut: () => Promise<void>;
@@ -93,6 +111,7 @@ export const useAppStore = create<AppState>((set, get) => ({
   recommendedBooks: [],
   currentBook: null,
   currentActivity: null,
+  highlights: [],
   favorites: [],
   settings: null,
   chaptersReadSinceAd: 0,
@@ -252,6 +271,12 @@ export const useAppStore = create<AppState>((set, get) => ({
         } catch {
           set({ currentActivity: null });
         }
+        try {
+          const highlights = await api.get(`/highlights/${user.id}/${bookId}`);
+          set({ highlights: highlights || [] });
+        } catch {
+          set({ highlights: [] });
+        }
       }
 
       return book;
@@ -299,12 +324,12 @@ export const useAppStore = create<AppState>((set, get) => ({
     const { user, currentBook, currentActivity } = get();
     if (!user || !currentBook) return;
 
+    // Highlights are saved one at a time through /highlights, never as part of the activity row
     const activity: UserActivity = {
       user_id: user.id,
       book_id: currentBook.id,
       last_position: activityUpdate.last_position ?? currentActivity?.last_position ?? 0,
       is_favorite: activityUpdate.is_favorite ?? currentActivity?.is_favorite ?? false,
-      highlights: activityUpdate.highlights ?? currentActivity?.highlights ?? [],
       chapter_read_count: activityUpdate.chapter_read_count ?? currentActivity?.chapter_read_count ?? 0,
     };
 
@@ -328,9 +353,25 @@ export const useAppStore = create<AppState>((set, get) => ({
   },
 
   addHighlight: async (text, position, chapter) => {
-    const { currentActivity } = get();
-    const highlights = [...(currentActivity?.highlights || []), { text, position, chapter }];
-    await get().updateActivity({ highlights });
+    const { user, currentBook } = get();
+    if (!user || !currentBook) return;
+
+    const highlight: Highlight = { user_id: user.id, book_id: currentBook.id, chapter: chapter ?? 0, position, text };
+    try {
+      const created = await api.post('/highlights', highlight);
+      set((state) => ({ highlights: [...state.highlights, created || highlight] }));
+    } catch (error) {
+      // Keep it locally on failure
+      set((state) => ({ highlights: [...state.highlights, highlight] }));
+    }
+  },
+
+  removeHighlight: async (highlightId) => {
+    const { user } = get();
+    if (!user) return;
+
+    set((state) => ({ highlights: state.highlights.filter((h) => h.id !== highlightId) }));
+    await api.delete(`/highlights/${user.id}/${highlightId}`).catch(() => {});
   },
 
   acceptTerms: async () => {
@@ -392,6 +433,7 @@ export const useAppStore = create<AppState>((set, get) => ({
         user: null, 
         favorites: [], 
         currentActivity: null, 
+        highlights: [],
         currentBook: null,
         books: [],
         featuredBooks: [],
@@ -403,7 +445,7 @@ export const useAppStore = create<AppState>((set, get) => ({
         await supabase.auth.signOut();
       } catch (e) {}
       await AsyncStorage.removeItem('user');
-      set({ user: null, favorites: [], currentActivity: null });
+      set({ user: null, favorites: [], currentActivity: null, highlights: [] });
       throw error;
     }
   },
@@ -426,6 +468,7 @@ export const useAppStore = create<AppState>((set, get) => ({
         user: null, 
         favorites: [], 
         currentActivity: null, 
+        highlights: [],
         currentBook: null,
         books: [],
         featuredBooks: [],
@@ -434,7 +477,7 @@ export const useAppStore = create<AppState>((set, get) => ({
     } catch (error) {
       // Still clear local state even if Supabase fails
       await AsyncStorage.removeItem('user');
-      set({ user: null, favorites: [], currentActivity: null });
+      set({ user: null, favorites: [], currentActivity: null, highlights: [] });
       throw error;
     }
   },
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The backend is a flat directory of modules run from backend/, not an installed package
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
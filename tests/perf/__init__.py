@@ -0,0 +1,2 @@
+"""Benchmarks and load generators; run as modules from the repository root"""
+import tests.conftest  # noqa: F401  (puts backend/ on sys.path)
@@ -0,0 +1,125 @@
+"""
+Cold-start benchmark: import-time profile of server.py (and the seeder) and
+time from process start to the first successful /api/books, split into
+start-up and the first request, with each warm-up mode.
+
+    python -m tests.perf.bench_cold_start
+    python -m tests.perf.bench_cold_start --runs 10 --latency-ms 30
+
+Run from the repository root. Each run is a fresh `python -m uvicorn` process
+against a stand-in Supabase; --latency-ms stands in for the connection and
+query time of the real project.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from tests.perf.catalog import seed_catalog
+from tests.perf.harness import BACKEND_DIR, REPORT_DIR, ServerProcess, run_metadata, write_report
+from tests.stand_in import StandIn
+
+DEFAULT_OUTPUT = os.path.join(REPORT_DIR, "cold_start.json")
+WARMUP_MODES = ("off", "background", "blocking")
+FIRST_REQUEST = "/api/books?limit=300"
+
+
+def import_profile(module: str = "server", top: int = 15) -> Dict[str, Any]:
+    """Parse `python -X importtime` for module: total time and the slowest imports"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append({"module": name.strip(), "self_ms": int(self_us) / 1000,
+                     "cumulative_ms": int(cumulative_us) / 1000, "depth": depth})
+    # Children are printed before their parent: the module's subtree is every
+    # row between it and the previous top-level row (interpreter start-up)
+    end = next(i for i, r in enumerate(rows) if r["module"] == module and r["depth"] == 0)
+    start = end
+    while start > 0 and rows[start - 1]["depth"] > 0:
+        start -= 1
+    subtree = rows[start:end]
+    heaviest = sorted(subtree, key=lambda r: r["cumulative_ms"], reverse=True)
+    return {"module": module, "total_ms": rows[end]["cumulative_ms"],
+            # Direct imports of the module, slowest first
+            "top_level": sorted(({"module": r["module"], "cumulative_ms": r["cumulative_ms"]} for r in subtree
+                                 if r["depth"] == 1), key=lambda r: r["cumulative_ms"], reverse=True)[:top],
+            "heaviest": [{"module": r["module"], "cumulative_ms": r["cumulative_ms"]} for r in heaviest[:top]]}
+
+
+def time_to_first_books(stand_in: StandIn, mode: str) -> Dict[str, float]:
+    """Spawn the API, wait until it accepts requests, then time the first and second /api/books"""
+    server = ServerProcess(stand_in, env={"LIBREYA_WARMUP": "" if mode == "off" else mode})
+    server.start()
+    try:
+        ready = server.wait_ready()
+        timings = []
+        for _ in range(2):
+            started = time.perf_counter()
+            response = httpx.get(server.url + FIRST_REQUEST, timeout=30)
+            response.raise_for_status()
+            timings.append(time.perf_counter() - started)
+        return {"ready_s": ready, "first_books_s": timings[0], "second_books_s": timings[1]}
+    finally:
+        server.stop()
+
+
+def run_cold_start(runs: int = 5, latency: float = 0.02, books: int = 300, modes=WARMUP_MODES,
+                   log=print) -> Dict[str, Any]:
+    profiles = {module: import_profile(module) for module in ("server", "seed_books")}
+    for module, profile in profiles.items():
+        log(f"import {module}: {profile['total_ms']:.0f} ms")
+        for row in profile["top_level"][:6]:
+            log(f"  {row['module']:<30} {row['cumulative_ms']:>8.1f} ms")
+
+    results: Dict[str, Any] = {}
+    with StandIn() as stand_in:
+        stand_in.record = False
+        seed_catalog(stand_in, books)
+        stand_in.latency = latency
+        for mode in modes:
+            samples: List[Dict[str, float]] = [time_to_first_books(stand_in, mode) for _ in range(runs)]
+            median_ms = lambda key: round(statistics.median(s[key] for s in samples) * 1000, 1)  # noqa: E731
+            results[mode] = {
+                "runs": runs,
+                "ready_median_ms": median_ms("ready_s"),
+                "first_books_median_ms": median_ms("first_books_s"),
+                "second_books_median_ms": median_ms("second_books_s"),
+                # Process start to the first successful /api/books
+                "time_to_first_books_median_ms": round(statistics.median(
+                    s["ready_s"] + s["first_books_s"] for s in samples) * 1000, 1),
+            }
+            r = results[mode]
+            log(f"warm-up {mode:<10} ready {r['ready_median_ms']:>7} ms  first /api/books {r['first_books_median_ms']:>6} ms  "
+                f"second {r['second_books_median_ms']:>6} ms  start to first books {r['time_to_first_books_median_ms']:>7} ms")
+    return {
+        "meta": {**run_metadata(), "runs": runs, "upstream_latency_ms": latency * 1000, "books": books},
+        "import_profiles": profiles,
+        "time_to_first_books": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start of the API")
+    parser.add_argument("--runs", type=int, default=5, help="Process starts per warm-up mode")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Latency added to every upstream request")
+    parser.add_argument("--books", type=int, default=300, help="Catalog size seeded into the stand-in")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON report")
+    args = parser.parse_args()
+    report = run_cold_start(args.runs, args.latency_ms / 1000, args.books)
+    write_report(args.out, report)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
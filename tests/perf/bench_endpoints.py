@@ -0,0 +1,374 @@
+"""
+Endpoint benchmark: every route in server.py against a stand-in Supabase
+seeded with synthetic catalogs, reporting throughput and latency percentiles
+as JSON so runs can be compared between commits.
+
+    python -m tests.perf.bench_endpoints                      # 300, 10k, 70k books
+    python -m tests.perf.bench_endpoints --sizes 300 --requests 50 --only books
+    python -m tests.perf.bench_endpoints --compare test_reports/bench/endpoints.json
+
+Run from the repository root.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from tests.perf.catalog import CATALOG_SIZES, CATEGORIES, Catalog, seed_catalog
+from tests.perf.harness import ADMIN_HEADERS, REPORT_DIR, BenchApp, closed_loop, run_metadata, summarize, write_report
+from tests.stand_in import StandIn
+
+DEFAULT_OUTPUT = os.path.join(REPORT_DIR, "endpoints.json")
+
+Request = Dict[str, Any]
+
+
+class Endpoint:
+    """
+    One benchmarked request shape. `build(ctx, i)` returns the i-th request as
+    keyword arguments for httpx ({"url", "json", "params"}); `prepare(ctx, n)`
+    seeds n disposable rows for endpoints that consume them (deletes, merges).
+    """
+
+    def __init__(self, method: str, route: str, build: Callable[["Context", int], Request],
+                 variant: str = "", prepare: Optional[Callable[["Context", int], List[Any]]] = None):
+        self.method = method
+        self.route = route
+        self.build = build
+        self.prepare = prepare
+        self.name = f"{method} {route}" + (f" [{variant}]" if variant else "")
+
+
+class Context:
+    def __init__(self, stand_in: StandIn, catalog: Catalog):
+        self.stand_in = stand_in
+        self.catalog = catalog
+        self.pool: List[Any] = []
+
+    def book(self, i: int) -> int:
+        ids = self.catalog.book_ids
+        return ids[(i * 7919) % len(ids)]
+
+    def user(self, i: int) -> str:
+        ids = self.catalog.user_ids
+        return ids[(i * 31) % len(ids)]
+
+    def guest(self, i: int) -> str:
+        ids = self.catalog.guest_ids
+        return ids[(i * 31) % len(ids)]
+
+
+def _disposable_users(prefix: str, reads: int = 0):
+    def prepare(ctx: Context, count: int) -> List[str]:
+        ids = [f"{prefix}-{time.monotonic_ns()}-{n}" for n in range(count)]
+        ctx.stand_in.db.insert("users", *({"id": user_id, "auth_provider": "guest"} for user_id in ids))
+        ctx.stand_in.db.insert("user_activity", *(
+            {"user_id": user_id, "book_id": ctx.book(n * reads + r), "last_position": 0.5,
+             "is_favorite": r == 0, "highlights": [], "chapter_read_count": 1}
+            for n, user_id in enumerate(ids) for r in range(reads)))
+        return ids
+    return prepare
+
+
+GUEST_BATCH = 20
+
+
+def _guest_batches(ctx: Context, count: int) -> List[List[str]]:
+    ids = _disposable_users("bench-batch", reads=5)(ctx, count * GUEST_BATCH)
+    return [ids[n * GUEST_BATCH:(n + 1) * GUEST_BATCH] for n in range(count)]
+
+
+def _disposable_books(ctx: Context, count: int) -> List[int]:
+    rows = ctx.stand_in.db.insert("books", *({"title": f"Disposable {n}", "author": "Bench", "read_count": 0}
+                                              for n in range(count)))
+    return [row["id"] for row in rows]
+
+
+def _disposable_highlights(ctx: Context, count: int) -> List[Any]:
+    rows = ctx.stand_in.db.insert("highlights", *(
+        {"user_id": ctx.user(n), "book_id": ctx.catalog.readers[ctx.user(n)][0], "chapter": 1,
+         "position": 0.5, "text": "Disposable highlight"} for n in range(count)))
+    return [(row["user_id"], row["id"]) for row in rows]
+
+
+def _queued_jobs(ctx: Context, count: int) -> List[str]:
+    """Finished job records to read or cancel"""
+    import server
+    from jobs import Job, SUCCEEDED
+
+    ids = []
+    for n in range(count):
+        job = Job("purge_user", {"user_id": f"bench-{n}"})
+        job.state, job.done, job.total = SUCCEEDED, 3, 3
+        server.jobs.jobs[job.id] = job
+        ids.append(job.id)
+    return ids
+
+
+def _new_book(i: int) -> Dict[str, Any]:
+    return {"title": f"Bench Book {i}", "author": "Bench Author", "category": "Fiction",
+            "content_body": "<h2>Chapter 1</h2>\n<p>Once upon a time.</p>\n" * 200,
+            "description": "Created by the benchmark"}
+
+
+ENDPOINTS: List[Endpoint] = [
+    # Health and operations
+    Endpoint("GET", "/api/health", lambda ctx, i: {"url": "/api/health"}),
+    Endpoint("GET", "/api/metrics", lambda ctx, i: {"url": "/api/metrics"}),
+    Endpoint("GET", "/api/admin/upstream", lambda ctx, i: {"url": "/api/admin/upstream", "headers": ADMIN_HEADERS}),
+    Endpoint("POST", "/api/init-database", lambda ctx, i: {"url": "/api/init-database"}),
+
+    # Users
+    Endpoint("POST", "/api/users", lambda ctx, i: {
+        "url": "/api/users", "json": {"id": f"bench-new-{i}", "auth_provider": "guest"}}),
+    Endpoint("GET", "/api/users/{user_id}", lambda ctx, i: {"url": f"/api/users/{ctx.user(i)}"}),
+    Endpoint("PATCH", "/api/users/{user_id}", lambda ctx, i: {
+        "url": f"/api/users/{ctx.user(i)}", "json": {"display_name": f"Reader {i}"}}),
+    Endpoint("DELETE", "/api/users/{user_id}", lambda ctx, i: {"url": f"/api/users/{ctx.pool[i]}"},
+             prepare=_disposable_users("bench-delete")),
+    Endpoint("GET", "/api/users/{user_id}/offline-bundle", lambda ctx, i: {
+        "url": f"/api/users/{ctx.user(i)}/offline-bundle"}),
+    # Catalog rows date from 2024, so a later version leaves only the manifest and activity
+    Endpoint("GET", "/api/users/{user_id}/offline-bundle", lambda ctx, i: {
+        "url": f"/api/users/{ctx.user(i)}/offline-bundle", "params": {"since": "2025-01-01T00:00:00"}},
+             variant="delta"),
+    Endpoint("POST", "/api/users/accept-terms", lambda ctx, i: {
+        "url": "/api/users/accept-terms", "json": {"user_id": ctx.user(i), "accepted": True}}),
+    Endpoint("POST", "/api/users/migrate-guest", lambda ctx, i: {
+        "url": "/api/users/migrate-guest", "json": {"guest_uuid": ctx.pool[i], "new_user_id": ctx.user(i)}},
+             prepare=_disposable_users("bench-guest", reads=5)),
+    Endpoint("POST", "/api/admin/users/migrate-guests", lambda ctx, i: {
+        "url": "/api/admin/users/migrate-guests", "headers": ADMIN_HEADERS,
+        "json": [{"guest_uuid": guest, "new_user_id": ctx.user(i * GUEST_BATCH + n)}
+                 for n, guest in enumerate(ctx.pool[i])]}, prepare=_guest_batches),
+
+    # Books
+    Endpoint("GET", "/api/books", lambda ctx, i: {"url": "/api/books"}),
+    Endpoint("GET", "/api/books", lambda ctx, i: {
+        "url": "/api/books", "params": {"category": CATEGORIES[i % len(CATEGORIES)]}}, variant="category"),
+    Endpoint("GET", "/api/books", lambda ctx, i: {
+        "url": "/api/books", "params": {"search": ("river", "Dickens", "storm", "zz")[i % 4]}}, variant="search"),
+    Endpoint("GET", "/api/books", lambda ctx, i: {"url": "/api/books", "params": {"offset": 200, "limit": 50}},
+             variant="page 5"),
+    Endpoint("GET", "/api/books/featured", lambda ctx, i: {"url": "/api/books/featured"}),
+    Endpoint("GET", "/api/books/recommended/{user_id}", lambda ctx, i: {
+        "url": f"/api/books/recommended/{ctx.user(i)}"}),
+    Endpoint("GET", "/api/books/{book_id}", lambda ctx, i: {"url": f"/api/books/{ctx.book(i)}"}),
+    # After the book opens above, so there is something trending
+    Endpoint("GET", "/api/books", lambda ctx, i: {"url": "/api/books", "params": {"order": "trending"}},
+             variant="trending"),
+    Endpoint("GET", "/api/books/categories/list", lambda ctx, i: {"url": "/api/books/categories/list"}),
+    Endpoint("GET", "/api/books/{book_id}/search", lambda ctx, i: {
+        "url": f"/api/books/{ctx.book(i % WARMUP_REQUESTS)}/search", "params": {"q": "winter garden"}},
+             variant="indexed"),
+    Endpoint("GET", "/api/books/{book_id}/search", lambda ctx, i: {
+        "url": f"/api/books/{ctx.book(i + 2000)}/search", "params": {"q": "storm"}}, variant="build"),
+    Endpoint("GET", "/api/covers/{book_id}", lambda ctx, i: {"url": f"/api/covers/{ctx.book(i % WARMUP_REQUESTS)}"},
+             variant="cached"),
+    Endpoint("GET", "/api/covers/{book_id}", lambda ctx, i: {"url": f"/api/covers/{ctx.book(i + 1000)}"},
+             variant="render"),
+
+    # Admin books
+    Endpoint("POST", "/api/admin/books", lambda ctx, i: {"url": "/api/admin/books", "json": _new_book(i)}),
+    Endpoint("PATCH", "/api/admin/books/{book_id}", lambda ctx, i: {
+        "url": f"/api/admin/books/{ctx.book(i)}", "json": {"description": f"Revised {i}"}}),
+    Endpoint("DELETE", "/api/admin/books/{book_id}", lambda ctx, i: {"url": f"/api/admin/books/{ctx.pool[i]}"},
+             prepare=_disposable_books),
+
+    # Activity
+    Endpoint("GET", "/api/activity/{user_id}", lambda ctx, i: {"url": f"/api/activity/{ctx.user(i)}"}),
+    Endpoint("GET", "/api/activity/{user_id}/{book_id}", lambda ctx, i: {
+        "url": f"/api/activity/{ctx.user(i)}/{ctx.catalog.readers[ctx.user(i)][0]}"}),
+    Endpoint("POST", "/api/activity", lambda ctx, i: {"url": "/api/activity", "json": {
+        "user_id": ctx.user(i), "book_id": ctx.catalog.readers[ctx.user(i)][0],
+        "last_position": (i % 100) / 100, "chapter_read_count": i % 30}}),
+    Endpoint("GET", "/api/favorites/{user_id}", lambda ctx, i: {"url": f"/api/favorites/{ctx.user(i)}"}),
+
+    # Highlights
+    Endpoint("GET", "/api/highlights/{user_id}/{book_id}", lambda ctx, i: {
+        "url": f"/api/highlights/{ctx.user(i)}/{ctx.catalog.readers[ctx.user(i)][0]}"}),
+    Endpoint("GET", "/api/highlights/{user_id}/{book_id}", lambda ctx, i: {
+        "url": f"/api/highlights/{ctx.user(i)}/{ctx.catalog.readers[ctx.user(i)][0]}",
+        "params": {"chapter": i % 20}}, variant="chapter"),
+    Endpoint("POST", "/api/highlights", lambda ctx, i: {"url": "/api/highlights", "json": {
+        "user_id": ctx.user(i), "book_id": ctx.catalog.readers[ctx.user(i)][0], "chapter": i % 20,
+        "position": (i % 100) / 100, "text": "A bench highlight", "color": "yellow"}}),
+    Endpoint("PATCH", "/api/highlights/{user_id}/{highlight_id}", lambda ctx, i: {
+        "url": "/api/highlights/{}/{}".format(*ctx.pool[i]), "json": {"note": f"Note {i}"}},
+             prepare=_disposable_highlights),
+    Endpoint("DELETE", "/api/highlights/{user_id}/{highlight_id}", lambda ctx, i: {
+        "url": "/api/highlights/{}/{}".format(*ctx.pool[i])}, prepare=_disposable_highlights),
+
+    # Settings
+    Endpoint("GET", "/api/settings/{key}", lambda ctx, i: {
+        "url": f"/api/settings/{ctx.catalog.setting_keys[i % len(ctx.catalog.setting_keys)]}"}),
+    Endpoint("GET", "/api/settings", lambda ctx, i: {"url": "/api/settings"}),
+    Endpoint("POST", "/api/admin/settings", lambda ctx, i: {
+        "url": "/api/admin/settings", "json": {"key": "featured_banner", "value": str(i)}}),
+    Endpoint("POST", "/api/admin/settings/batch", lambda ctx, i: {
+        "url": "/api/admin/settings/batch",
+        "json": [{"key": key, "value": str(i)} for key in ctx.catalog.setting_keys]}),
+
+    # Admin users
+    Endpoint("GET", "/api/admin/users", lambda ctx, i: {"url": "/api/admin/users", "headers": ADMIN_HEADERS}),
+    Endpoint("GET", "/api/admin/users", lambda ctx, i: {
+        "url": "/api/admin/users", "params": {"provider": "guest", "limit": 50}, "headers": ADMIN_HEADERS},
+        variant="guests"),
+    Endpoint("GET", "/api/admin/users/export", lambda ctx, i: {
+        "url": "/api/admin/users/export", "params": {"format": ("ndjson", "csv")[i % 2]}, "headers": ADMIN_HEADERS}),
+    Endpoint("GET", "/api/admin/analytics", lambda ctx, i: {"url": "/api/admin/analytics", "headers": ADMIN_HEADERS}),
+    Endpoint("PATCH", "/api/admin/users/{user_id}/toggle-admin", lambda ctx, i: {
+        "url": f"/api/admin/users/{ctx.user(i)}/toggle-admin"}),
+    Endpoint("DELETE", "/api/admin/users/{user_id}", lambda ctx, i: {
+        "url": f"/api/admin/users/{ctx.pool[i]}", "headers": ADMIN_HEADERS},
+             prepare=_disposable_users("bench-purge", reads=3)),
+
+    # Background jobs
+    Endpoint("POST", "/api/admin/seed-books", lambda ctx, i: {
+        "url": "/api/admin/seed-books", "params": {"count": 1}, "headers": ADMIN_HEADERS}),
+    Endpoint("POST", "/api/admin/books/backfill-stats", lambda ctx, i: {
+        "url": "/api/admin/books/backfill-stats", "headers": ADMIN_HEADERS}),
+    Endpoint("GET", "/api/admin/jobs", lambda ctx, i: {"url": "/api/admin/jobs", "headers": ADMIN_HEADERS}),
+    Endpoint("GET", "/api/admin/jobs/{job_id}", lambda ctx, i: {
+        "url": f"/api/admin/jobs/{ctx.pool[i]}", "headers": ADMIN_HEADERS}, prepare=_queued_jobs),
+    Endpoint("POST", "/api/admin/jobs/{job_id}/cancel", lambda ctx, i: {
+        "url": f"/api/admin/jobs/{ctx.pool[i]}/cancel", "headers": ADMIN_HEADERS}, prepare=_queued_jobs),
+
+    # Static
+    Endpoint("GET", "/api/ads.txt", lambda ctx, i: {"url": "/api/ads.txt"}),
+    Endpoint("GET", "/api/app-ads.txt", lambda ctx, i: {"url": "/api/app-ads.txt"}),
+]
+
+# Routes deliberately left out, with the reason recorded in the report
+EXCLUDED = {
+    "POST /api/admin/profile": "blocks for its sampling window by design",
+    "GET /api/sync/{user_id}": "long-lived event stream; see tests.perf.bench_sync",
+}
+
+WARMUP_REQUESTS = 5
+
+
+def uncovered_routes() -> List[str]:
+    """Routes of the app that have neither a benchmark nor an exclusion"""
+    import server
+    from fastapi.routing import APIRoute
+
+    covered = {f"{e.method} {e.route}" for e in ENDPOINTS} | set(EXCLUDED)
+    missing = []
+    for route in server.app.routes:
+        if isinstance(route, APIRoute):
+            for method in sorted(route.methods):
+                if f"{method} {route.path}" not in covered:
+                    missing.append(f"{method} {route.path}")
+    return missing
+
+
+async def bench_endpoint(client, ctx: Context, endpoint: Endpoint, requests: int, concurrency: int) -> Dict[str, Any]:
+    ctx.pool = endpoint.prepare(ctx, requests + WARMUP_REQUESTS) if endpoint.prepare else []
+
+    async def send(i: int) -> int:
+        kwargs = endpoint.build(ctx, i)
+        response = await client.request(endpoint.method, **kwargs)
+        return response.status_code
+
+    for i in range(WARMUP_REQUESTS):
+        await send(requests + i)
+    latencies, statuses, elapsed = await closed_loop(send, requests, concurrency)
+    return summarize(latencies, statuses, elapsed)
+
+
+async def bench_catalog(books: int, requests: int, concurrency: int, latency: float,
+                        only: Optional[str] = None, log=print) -> Dict[str, Any]:
+    with StandIn() as stand_in:
+        stand_in.record = False
+        started = time.perf_counter()
+        catalog = seed_catalog(stand_in, books)
+        seeded = time.perf_counter() - started
+        stand_in.latency = latency
+        results: Dict[str, Any] = {}
+        async with BenchApp(stand_in) as bench:
+            ctx = Context(stand_in, catalog)
+            async with bench.client() as client:
+                for endpoint in ENDPOINTS:
+                    if only and only not in endpoint.name:
+                        continue
+                    results[endpoint.name] = stats = await bench_endpoint(client, ctx, endpoint, requests, concurrency)
+                    log(f"  {endpoint.name:<55} {stats['throughput_rps']:>9} rps  "
+                        f"p50 {stats['p50_ms']:>9} ms  p99 {stats['p99_ms']:>9} ms"
+                        + (f"  errors {stats['errors']}" if stats["errors"] else ""))
+            import upstream
+            await upstream.close_client()
+        return {
+            "books": books,
+            "users": len(catalog.user_ids) + len(catalog.guest_ids),
+            "activity_rows": len(stand_in.db.rows["user_activity"]),
+            "seed_seconds": round(seeded, 3),
+            "endpoints": results,
+        }
+
+
+def run_benchmark(sizes=CATALOG_SIZES, requests: int = 200, concurrency: int = 8, latency: float = 0.002,
+                  only: Optional[str] = None, log=print) -> Dict[str, Any]:
+    report = {
+        "meta": {**run_metadata(), "requests_per_endpoint": requests, "concurrency": concurrency,
+                 "upstream_latency_ms": latency * 1000},
+        "excluded": EXCLUDED,
+        "uncovered": uncovered_routes(),
+        "catalogs": {},
+    }
+    for books in sizes:
+        log(f"catalog of {books} books")
+        report["catalogs"][str(books)] = asyncio.run(bench_catalog(books, requests, concurrency, latency, only, log))
+    return report
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float, log=print) -> List[str]:
+    """Log p50/p99 ratios against an earlier report; return the regressed endpoints"""
+    regressions = []
+    for size, catalog in new["catalogs"].items():
+        previous = old.get("catalogs", {}).get(size, {}).get("endpoints", {})
+        for name, stats in catalog["endpoints"].items():
+            before = previous.get(name)
+            if not before or not before["p99_ms"]:
+                continue
+            p50 = stats["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+            p99 = stats["p99_ms"] / before["p99_ms"]
+            flag = p99 > threshold or p50 > threshold
+            if flag:
+                regressions.append(f"{size} {name}")
+            log(f"{size:>6} {name:<55} p50 x{p50:5.2f}  p99 x{p99:5.2f}{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every API endpoint against a Supabase stand-in")
+    parser.add_argument("--sizes", default=",".join(map(str, CATALOG_SIZES)), help="Comma separated catalog sizes")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent in-flight requests")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Latency added to every upstream request")
+    parser.add_argument("--only", help="Only endpoints whose name contains this text")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON report")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio counted as a regression")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run_benchmark([int(s) for s in args.sizes.split(",")], args.requests, args.concurrency,
+                           args.latency_ms / 1000, args.only)
+    write_report(args.out, report)
+    print(f"wrote {args.out}")
+    if report["uncovered"]:
+        print(f"routes without a benchmark: {', '.join(report['uncovered'])}")
+    if baseline is not None and compare(baseline, report, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Sync stream benchmark: cost of idle SSE connections on one worker and how
+fast a progress save reaches the user's other device.
+
+    python -m tests.perf.bench_sync
+    python -m tests.perf.bench_sync --connections 5000 --probes 100
+
+Run from the repository root. The API runs under uvicorn in its own process
+against a stand-in Supabase. Idle streams are opened with bare asyncio sockets
+so the client side stays cheap; memory is the server's PSS before and after.
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from tests.perf.bench_workers import process_tree_pss_kb
+from tests.perf.catalog import seed_catalog
+from tests.perf.harness import REPORT_DIR, ServerProcess, closed_loop, run_metadata, summarize, write_report
+from tests.stand_in import StandIn
+
+DEFAULT_OUTPUT = os.path.join(REPORT_DIR, "sync.json")
+
+
+class StreamClient:
+    """Minimal SSE reader over a raw connection"""
+
+    def __init__(self, port: int, user_id: str, device_id: str):
+        self.port = port
+        self.path = f"/api/sync/{user_id}?device_id={device_id}"
+        self.buffer = b""
+        self.reader = self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(f"GET {self.path} HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n".encode())
+        await self.wait_for(b"event: ready")
+
+    async def wait_for(self, marker: bytes):
+        while marker not in self.buffer:
+            chunk = await self.reader.read(65536)
+            if not chunk:
+                raise ConnectionError("stream closed")
+            self.buffer += chunk
+        self.buffer = self.buffer.split(marker, 1)[1]
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+async def open_idle(port: int, count: int, batch: int = 200) -> Tuple[List[StreamClient], float]:
+    clients: List[StreamClient] = []
+    started = time.perf_counter()
+    for first in range(0, count, batch):
+        opened = [StreamClient(port, f"idle-{n}", "tablet") for n in range(first, min(count, first + batch))]
+        await asyncio.gather(*(c.open() for c in opened))
+        clients.extend(opened)
+    return clients, time.perf_counter() - started
+
+
+async def fan_out(url: str, port: int, users: List[str], book_ids: List[int]) -> List[float]:
+    """Save progress from one device, time until the user's other device hears it"""
+    delays = []
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        for n, user_id in enumerate(users):
+            listener = StreamClient(port, user_id, "tablet")
+            await listener.open()
+            try:
+                started = time.perf_counter()
+                response = await client.post("/api/activity", headers={"X-Device-Id": "phone"}, json={
+                    "user_id": user_id, "book_id": book_ids[n % len(book_ids)], "last_position": 0.5})
+                response.raise_for_status()
+                await asyncio.wait_for(listener.wait_for(b"event: progress"), 10)
+                delays.append(time.perf_counter() - started)
+            finally:
+                listener.close()
+    return delays
+
+
+async def books_latency(url: str, requests: int) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        async def send(i: int) -> int:
+            return (await client.get("/api/books?limit=50")).status_code
+        return summarize(*await closed_loop(send, requests, 8))
+
+
+async def scenario(server: ServerProcess, connections: int, probes: int, book_ids: List[int],
+                   users: List[str], log) -> Dict[str, Any]:
+    pid = server.process.pid
+    baseline_kb = process_tree_pss_kb(pid)
+    quiet = await books_latency(server.url, 200)
+    fan_out_quiet = summarize(await fan_out(server.url, server.port, users[:probes], book_ids), [200] * probes, 1)
+
+    clients, connect_seconds = await open_idle(server.port, connections)
+    await asyncio.sleep(0.5)
+    loaded_kb = process_tree_pss_kb(pid)
+    busy = await books_latency(server.url, 200)
+    fan_out_busy = summarize(await fan_out(server.url, server.port, users[probes:2 * probes], book_ids),
+                             [200] * probes, 1)
+    for client in clients:
+        client.close()
+
+    per_connection_kb = round((loaded_kb - baseline_kb) / connections, 2) if connections else 0.0
+    log(f"{connections} idle streams opened in {connect_seconds:.2f}s, {per_connection_kb} KB each")
+    log(f"progress fan-out p50 {fan_out_quiet['p50_ms']} ms idle server, {fan_out_busy['p50_ms']} ms "
+        f"with {connections} streams open")
+    log(f"/api/books p50 {quiet['p50_ms']} ms idle server, {busy['p50_ms']} ms with {connections} streams open")
+    return {
+        "idle_connections": connections,
+        "connect_seconds": round(connect_seconds, 3),
+        "server_pss_mb": {"before": round(baseline_kb / 1024, 1), "with_streams": round(loaded_kb / 1024, 1)},
+        "pss_kb_per_connection": per_connection_kb,
+        "fan_out": {"no_streams": fan_out_quiet, "with_streams": fan_out_busy},
+        "books_list": {"no_streams": quiet, "with_streams": busy},
+    }
+
+
+def run_sync(connections: int = 2000, probes: int = 50, latency: float = 0.002, log=print) -> Dict[str, Any]:
+    with StandIn() as stand_in:
+        stand_in.record = False
+        catalog = seed_catalog(stand_in, 300)
+        stand_in.latency = latency
+        users = catalog.user_ids[:2 * probes]
+        with ServerProcess(stand_in) as server:
+            result = asyncio.run(scenario(server, connections, probes, catalog.book_ids, users, log))
+    return {"meta": {**run_metadata(), "upstream_latency_ms": latency * 1000, "probes": probes}, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark idle sync streams and fan-out latency")
+    parser.add_argument("--connections", type=int, default=2000, help="Idle SSE streams held open")
+    parser.add_argument("--probes", type=int, default=50, help="Progress saves timed per phase")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Latency added to every upstream request")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON report")
+    args = parser.parse_args()
+    report = run_sync(args.connections, args.probes, args.latency_ms / 1000)
+    write_report(args.out, report)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Worker-scaling benchmark: throughput and latency of catalog reads as the
+launcher's worker count grows, with and without the shared catalog snapshot.
+
+    python -m tests.perf.bench_workers
+    python -m tests.perf.bench_workers --workers 1 2 4 8 --requests 4000
+
+Run from the repository root. Each configuration is a fresh
+`python server.py --workers N` against a stand-in Supabase with
+--latency-ms added to every upstream call. Memory is the proportional set
+size (PSS) summed over the launcher and its workers, so pages shared through
+the snapshot are counted once.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from tests.perf.catalog import CATEGORIES, seed_catalog
+from tests.perf.harness import REPORT_DIR, ServerProcess, closed_loop, run_metadata, summarize, write_report
+from tests.stand_in import StandIn
+
+DEFAULT_OUTPUT = os.path.join(REPORT_DIR, "workers.json")
+WORKER_COUNTS = (1, 2, 4)
+
+
+class LauncherProcess(ServerProcess):
+    """The API started through the built-in launcher instead of bare uvicorn"""
+
+    def __init__(self, stand_in, workers: int, shared: bool, env: Optional[Dict[str, str]] = None):
+        super().__init__(stand_in, env=env)
+        self.workers = workers
+        self.shared = shared
+
+    def command(self) -> List[str]:
+        return [sys.executable, "server.py", "--host", "127.0.0.1", "--port", str(self.port),
+                "--workers", str(self.workers), "--log-level", "warning", "--shared-catalog" if self.shared else "--no-shared-catalog"]
+
+
+def catalog_paths(book_ids: Sequence[int]) -> List[str]:
+    """The read mix: mostly home-screen lists, some browsing and search, a few detail pages"""
+    paths = ["/api/books?limit=50"] * 4 + ["/api/books/featured?limit=10"] * 2 + ["/api/settings"] * 2
+    paths += [f"/api/books?category={c}&limit=20" for c in CATEGORIES[:4]]
+    paths += ["/api/books?search=winter&limit=20", "/api/books/categories/list", "/api/books?limit=20&offset=100"]
+    paths += [f"/api/books/{book_id}" for book_id in book_ids[:2]]
+    return paths
+
+
+def process_tree_pss_kb(root: int) -> int:
+    """Sum of Pss over root and its descendants (Linux only; 0 elsewhere)"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+async def drive(url: str, paths: Sequence[str], requests: int, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        async def send(i: int) -> int:
+            # Distinct addresses so per-client rate limits don't throttle the run
+            headers = {"X-Forwarded-For": f"10.1.{i % 250}.{(i // 250) % 250 + 1}"}
+            return (await client.get(paths[i % len(paths)], headers=headers)).status_code
+        # Let every worker open its upstream pool before measuring
+        await closed_loop(send, concurrency * 4, concurrency)
+        return await closed_loop(send, requests, concurrency)
+
+
+def run_workers(worker_counts=WORKER_COUNTS, requests: int = 2000, concurrency: int = 32, books: int = 10_000,
+                latency: float = 0.005, log=print) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with StandIn() as stand_in:
+        stand_in.record = False
+        catalog = seed_catalog(stand_in, books)
+        stand_in.latency = latency
+        paths = catalog_paths(catalog.book_ids)
+        for workers in worker_counts:
+            for shared in (False, True):
+                name = f"{workers} worker{'s' if workers > 1 else ''}, {'shared catalog' if shared else 'no snapshot'}"
+                with LauncherProcess(stand_in, workers, shared) as server:
+                    stats = summarize(*asyncio.run(drive(server.url, paths, requests, concurrency)))
+                    stats["pss_mb"] = round(process_tree_pss_kb(server.process.pid) / 1024, 1)
+                stats.update(workers=workers, shared_catalog=shared)
+                results[name] = stats
+                log(f"{name:<34} {stats['throughput_rps']:>8} req/s  p50 {stats['p50_ms']:>8} ms  "
+                    f"p99 {stats['p99_ms']:>8} ms  errors {stats['errors']:>4}  pss {stats['pss_mb']:>7} MB")
+    return {
+        "meta": {**run_metadata(), "requests": requests, "concurrency": concurrency, "books": books,
+                 "upstream_latency_ms": latency * 1000, "paths": paths},
+        "configurations": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput against worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=list(WORKER_COUNTS))
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests per configuration")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--books", type=int, default=10_000, help="Catalog size seeded into the stand-in")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latency added to every upstream request")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON report")
+    args = parser.parse_args()
+    report = run_workers(args.workers, args.requests, args.concurrency, args.books, args.latency_ms / 1000)
+    write_report(args.out, report)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
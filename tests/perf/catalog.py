@@ -0,0 +1,141 @@
+"""Synthetic catalogs, users and reading activity for benchmarks"""
+import io
+import random
+from typing import Dict, List
+
+from categorizer import CATEGORY_KEYWORDS
+from tests.stand_in import FixtureFile, StandIn
+
+CATEGORIES = sorted(CATEGORY_KEYWORDS) + ["Fiction"]
+
+TITLE_WORDS = (
+    "shadow river house winter garden letters night island journey secret crown stone "
+    "voyage daughter war silence city mountain storm heart empire wolf mirror lantern "
+    "orchard harbour tower pilgrim widow sea fire glass key forest captain"
+).split()
+FIRST_NAMES = "Jane Charles Mary Leo Edith Herman George Emily Henry Virginia Joseph Louisa Arthur".split()
+LAST_NAMES = "Austen Dickens Shelley Tolstoy Wharton Melville Eliot Bronte James Woolf Conrad Alcott Doyle".split()
+
+# Full texts are shared by size class so 70k books don't cost 70k bodies of memory
+BODY_SIZES = (8 * 1024, 64 * 1024, 256 * 1024)
+COVER_COUNT = 16
+
+# Catalog sizes the endpoint benchmark runs by default (the production catalog
+# is in the low hundreds; 70k is roughly all of Project Gutenberg)
+CATALOG_SIZES = (300, 10_000, 70_000)
+
+
+def _body(size: int) -> str:
+    paragraph = "<p>" + " ".join(random.Random(size).choice(TITLE_WORDS) for _ in range(120)) + ".</p>\n"
+    text, n = "", 0
+    while len(text) < size:
+        n += 1
+        text += f"<h2>Chapter {n}</h2>\n" + paragraph * 8
+    return text
+
+
+def _cover_jpeg(seed: int) -> bytes:
+    from PIL import Image
+
+    image = Image.new("RGB", (600, 900), ((seed * 53) % 256, (seed * 97) % 256, (seed * 29) % 256))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=80)
+    return out.getvalue()
+
+
+class Catalog:
+    """Ids of everything seeded, for building requests"""
+
+    def __init__(self):
+        self.book_ids: List[int] = []
+        self.user_ids: List[str] = []
+        self.guest_ids: List[str] = []
+        self.readers: Dict[str, List[int]] = {}
+        self.setting_keys: List[str] = []
+
+
+def seed_catalog(stand_in: StandIn, books: int, users: int = 0, reads_per_user: int = 8,
+                 seed: int = 0) -> Catalog:
+    """
+    Fill the stand-in with `books` books, `users` users (a third of them guests)
+    and their activity. Read counts follow a long tail so ordering by
+    popularity looks like production.
+    """
+    rng = random.Random(seed)
+    db = stand_in.db
+    catalog = Catalog()
+    users = users or max(100, books // 10)
+    bodies = [_body(size) for size in BODY_SIZES]
+
+    for n in range(COVER_COUNT):
+        stand_in.files[f"/covers/{n}.jpg"] = FixtureFile(_cover_jpeg(n), etag=f'"cover-{n}"',
+                                                          content_type="image/jpeg")
+
+    rows = []
+    for n in range(books):
+        title = " ".join(rng.choice(TITLE_WORDS).capitalize() for _ in range(rng.randint(1, 4)))
+        rows.append({
+            "title": f"The {title}",
+            "author": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "content_body": bodies[min(2, int(rng.expovariate(1.5)))],
+            "category": rng.choice(CATEGORIES),
+            "cover_image": f"{stand_in.url}/covers/{n % COVER_COUNT}.jpg",
+            "is_featured": rng.random() < 0.02,
+            "read_count": int(rng.paretovariate(1.2)) - 1,
+            "description": f"A story of {rng.choice(TITLE_WORDS)} and {rng.choice(TITLE_WORDS)}. " * 3,
+            "source_url": f"https://www.gutenberg.org/ebooks/{n + 1}",
+            "created_at": "2024-01-01T00:00:00",
+        })
+    catalog.book_ids = [row["id"] for row in db.insert("books", *rows)]
+
+    user_rows, activity_rows = [], []
+    for n in range(users):
+        guest = n % 3 == 0
+        user_id = f"{'guest' if guest else 'user'}-{n:06d}"
+        user_rows.append({
+            "id": user_id,
+            "email": None if guest else f"reader{n}@example.com",
+            "display_name": None if guest else f"Reader {n}",
+            "auth_provider": "guest" if guest else rng.choice(("email", "google", "apple")),
+            "is_admin": False,
+            "terms_accepted": True,
+            "created_at": f"2024-{1 + n % 12:02d}-01T00:00:00",
+        })
+        (catalog.guest_ids if guest else catalog.user_ids).append(user_id)
+        read = rng.sample(catalog.book_ids, min(len(catalog.book_ids), rng.randint(1, reads_per_user * 2)))
+        catalog.readers[user_id] = read
+        for book_id in read:
+            activity_rows.append({
+                "user_id": user_id,
+                "book_id": book_id,
+                "last_position": round(rng.random(), 3),
+                "is_favorite": rng.random() < 0.2,
+                "highlights": [],
+                "chapter_read_count": rng.randint(0, 30),
+                "created_at": "2024-01-01T00:00:00",
+                "updated_at": "2024-01-01T00:00:00",
+            })
+    db.insert("users", *user_rows)
+    db.insert("user_activity", *activity_rows)
+
+    # A minority of readers annotate, some of them heavily
+    highlight_rows = []
+    for activity in activity_rows:
+        if rng.random() < 0.1:
+            for n in range(rng.randint(1, 20)):
+                highlight_rows.append({
+                    "user_id": activity["user_id"],
+                    "book_id": activity["book_id"],
+                    "chapter": rng.randint(0, 20),
+                    "position": round(rng.random(), 4),
+                    "text": " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(3, 25))),
+                    "color": "yellow",
+                    "created_at": "2024-01-01T00:00:00",
+                    "updated_at": "2024-01-01T00:00:00",
+                })
+    db.insert("highlights", *highlight_rows)
+
+    catalog.setting_keys = ["ads_enabled", "featured_banner", "terms_version", "min_app_version"]
+    db.insert("app_settings", *({"key": key, "value": "true", "updated_at": "2024-01-01T00:00:00"}
+                                for key in catalog.setting_keys))
+    return catalog
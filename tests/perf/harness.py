@@ -0,0 +1,264 @@
+"""
+Shared plumbing for benchmarks: point the app at a stand-in, drive it
+in-process over ASGI and summarize latencies.
+"""
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+REPORT_DIR = os.path.join(REPO_ROOT, "test_reports", "bench")
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+
+# Pre-verified admin token inside BenchApp, so admin routes cost no auth lookups
+BENCH_ADMIN_TOKEN = "bench-admin-token"
+ADMIN_HEADERS = {"Authorization": f"Bearer {BENCH_ADMIN_TOKEN}"}
+
+
+async def _stub_seed_books(job, count: int, skip_duplicates: bool = True):
+    """Stands in for the seeding job, which would download from Project Gutenberg"""
+    for n in range(count):
+        job.update(n + 1, count, f"Book {n + 1}")
+    return {"added": 0, "skipped": count}
+
+
+async def _stub_backfill_text_stats(job, recompute: bool = False):
+    """Stands in for the backfill, which would rewrite every book of the catalog while other routes are timed"""
+    job.update(0, 0)
+    return {"updated": 0, "failed": 0}
+
+
+class BenchApp:
+    """
+    Context manager wiring server.py to a stand-in: Supabase URL and keys,
+    fresh upstream client and resilience state, throwaway cover cache and job
+    directories, unpersisted trending counts and analytics, empty activity and
+    search index caches, stub seeding and backfill jobs, an admin token
+    (ADMIN_HEADERS) and rate limits lifted (every benchmark request comes from
+    one client). Use
+    `async with` where the loop outlives the block, so background jobs are
+    stopped before the patches are undone.
+    """
+
+    def __init__(self, stand_in):
+        self.stand_in = stand_in
+        self._patches: List[Tuple[Any, str, Any]] = []
+        self._cover_dir: Optional[tempfile.TemporaryDirectory] = None
+        self._jobs_dir: Optional[tempfile.TemporaryDirectory] = None
+        self.jobs = None
+
+    def _set(self, target, name: str, value):
+        self._patches.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+    def __enter__(self):
+        import server
+        import upstream
+        from activity_cache import ActivityCache
+        from admission import RATE_LIMITS
+        from analytics import Analytics
+        from book_search import SearchIndexCache
+        from covers import CoverCache
+        from jobs import JobRunner
+        from resilience import Resilience
+        from trending import Trending
+
+        self._cover_dir = tempfile.TemporaryDirectory(prefix="libreya-bench-covers-")
+        self._jobs_dir = tempfile.TemporaryDirectory(prefix="libreya-bench-jobs-")
+        # Background jobs run against the stand-in too, with room for every benchmark request
+        self.jobs = JobRunner(self._jobs_dir.name, queue_size=1_000_000)
+        self.jobs.kinds = {**server.jobs.kinds, "seed_books": _stub_seed_books,
+                           "backfill_text_stats": _stub_backfill_text_stats}
+        self._set(server, "jobs", self.jobs)
+        self._set(server, "_admin_tokens", {BENCH_ADMIN_TOKEN: float("inf")})
+        self._set(server, "trending", Trending(snapshot_path=None))
+        self._set(server, "analytics", Analytics(snapshot_path=None))
+        self._set(server, "activity_cache", ActivityCache())
+        self._set(server, "search_indexes", SearchIndexCache())
+        self._set(server, "SUPABASE_URL", self.stand_in.url)
+        self._set(server, "SUPABASE_ANON_KEY", "bench-anon-key")
+        self._set(server, "SUPABASE_SERVICE_ROLE_KEY", "bench-service-key")
+        self._set(server, "cover_cache", CoverCache(self._cover_dir.name))
+        self._set(upstream, "resilience", Resilience())
+        self._set(upstream, "_client", None)
+        for limiter in RATE_LIMITS.values():
+            self._set(limiter, "rate", 1e9)
+            self._set(limiter, "burst", 1e9)
+        self.app = server.app
+        return self
+
+    def __exit__(self, *exc):
+        for target, name, value in reversed(self._patches):
+            setattr(target, name, value)
+        self._patches.clear()
+        for directory in (self._cover_dir, self._jobs_dir):
+            if directory is not None:
+                directory.cleanup()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        await self.jobs.stop()
+        self.__exit__(*exc)
+
+    def client(self) -> httpx.AsyncClient:
+        transport = httpx.ASGITransport(app=self.app, client=("10.0.0.1", 40000))
+        return httpx.AsyncClient(transport=transport, base_url="http://libreya.bench", timeout=60)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """
+    The API under uvicorn in its own process, pointed at a stand-in, so load
+    generated here doesn't compete with the app for the interpreter.
+    """
+
+    def __init__(self, stand_in, env: Optional[Dict[str, str]] = None, args: Sequence[str] = ()):
+        self.stand_in = stand_in
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = env or {}
+        self.args = list(args)
+        self.process: Optional[subprocess.Popen] = None
+        self._cover_dir: Optional[tempfile.TemporaryDirectory] = None
+
+    def command(self) -> List[str]:
+        return [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+                "--port", str(self.port), "--log-level", "warning", *self.args]
+
+    def start(self) -> "ServerProcess":
+        self._cover_dir = tempfile.TemporaryDirectory(prefix="libreya-bench-covers-")
+        env = {
+            **os.environ,
+            "SUPABASE_URL": self.stand_in.url,
+            "SUPABASE_ANON_KEY": "bench-anon-key",
+            "SUPABASE_SERVICE_ROLE_KEY": "bench-service-key",
+            "COVER_CACHE_DIR": self._cover_dir.name,
+            "LIBREYA_TRENDING_SNAPSHOT": "",
+            "LIBREYA_ANALYTICS_SNAPSHOT": "",
+            **self.env,
+        }
+        self.process = subprocess.Popen(self.command(), cwd=BACKEND_DIR, env=env)
+        return self
+
+    def wait_ready(self, path: str = "/api/health", timeout: float = 30.0) -> float:
+        """Poll until `path` answers 200; returns seconds since the process was started"""
+        started = time.perf_counter()
+        while time.perf_counter() - started < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with {self.process.returncode}")
+            try:
+                if httpx.get(self.url + path, timeout=1.0).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"server not ready after {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self._cover_dir is not None:
+            self._cover_dir.cleanup()
+
+    def __enter__(self) -> "ServerProcess":
+        self.start()
+        self.wait_ready()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+async def closed_loop(send: Callable[[int], Awaitable[int]], count: int,
+                      concurrency: int) -> Tuple[List[float], List[int], float]:
+    """
+    Issue `count` calls of send(i) from `concurrency` workers, each starting its
+    next call as soon as the previous one finished. send returns a status code
+    (0 for an exception). Returns (latencies, statuses, elapsed seconds).
+    """
+    latencies: List[float] = []
+    statuses: List[int] = []
+    counter = iter(range(count))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                status = await send(i)
+            except Exception:
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def percentile(ordered: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies: Sequence[float], statuses: Sequence[int], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    codes: Dict[str, int] = {}
+    for status in statuses:
+        codes[str(status)] = codes.get(str(status), 0) + 1
+    ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(ordered),
+        "errors": sum(1 for s in statuses if s == 0 or s >= 500),
+        "statuses": codes,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p90_ms": ms(percentile(ordered, 90)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+def run_metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_report(path: str, report: Dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
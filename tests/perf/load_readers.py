@@ -0,0 +1,299 @@
+"""
+Reader-traffic load generator. Simulated guests and registered users replay
+what the app does: open the home tab (three list calls in parallel), open a
+book, save the reading position every few seconds, now and then favorite a
+book. The population grows in stages; each stage reports throughput and
+latency so the saturation point and latency curves can be read off.
+
+    python -m tests.perf.load_readers                          # API in its own process
+    python -m tests.perf.load_readers --stages 100,500,2000 --stage-seconds 60
+    python -m tests.perf.load_readers --url http://127.0.0.1:8001   # an already running API
+
+Run from the repository root. Without --url a stand-in Supabase is seeded and
+the API is started under uvicorn pointed at it; --mode asgi drives the app
+in-process instead (quick, but generator and app then share one core).
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from tests.perf.catalog import seed_catalog
+from tests.perf.harness import REPORT_DIR, BenchApp, ServerProcess, run_metadata, summarize, write_report
+from tests.stand_in import StandIn
+
+DEFAULT_OUTPUT = os.path.join(REPORT_DIR, "load_readers.json")
+DEFAULT_STAGES = (50, 100, 200, 400, 800, 1600, 3200)
+
+
+class Behaviour:
+    """Think times (seconds, before time scaling) and probabilities of a reader"""
+
+    home_think = (2.0, 8.0)
+    books_per_visit = (1, 3)
+    position_interval = 5.0
+    position_updates_mean = 12
+    favorite_chance = {"guest": 0.05, "registered": 0.15}
+    between_visits = (10.0, 60.0)
+    # Zipf exponent of book popularity
+    popularity_skew = 1.1
+
+
+class Simulation:
+    def __init__(self, client: httpx.AsyncClient, book_ids: Sequence[int], registered: Sequence[str],
+                 guests: Sequence[str], time_scale: float = 1.0, seed: int = 0,
+                 behaviour: Behaviour = Behaviour()):
+        self.client = client
+        self.book_ids = list(book_ids)
+        self.registered = list(registered)
+        self.guests = list(guests)
+        self.time_scale = time_scale
+        self.behaviour = behaviour
+        self.rng = random.Random(seed)
+        weights = [1 / (rank + 1) ** behaviour.popularity_skew for rank in range(len(self.book_ids))]
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.stage = -1
+        # stage -> request kind -> [(latency, status)]
+        self.samples: Dict[int, Dict[str, List]] = defaultdict(lambda: defaultdict(list))
+        self.stopped = False
+        self.tasks: List[asyncio.Task] = []
+
+    # ----- plumbing -----
+
+    async def think(self, low: float, high: Optional[float] = None):
+        await asyncio.sleep(self.rng.uniform(low, high if high is not None else low) * self.time_scale)
+
+    async def call(self, user: "Reader", kind: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        stage = self.stage
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.request(method, url, headers=user.headers, **kwargs)
+            status = response.status_code
+        except Exception:
+            status = 0
+        if stage >= 0:
+            self.samples[stage][kind].append((time.perf_counter() - started, status))
+        return response
+
+    def pick_book(self, rng: random.Random) -> int:
+        return rng.choices(self.book_ids, cum_weights=self.cum_weights)[0]
+
+    # ----- population -----
+
+    def grow(self, users: int, ramp: float):
+        """Add readers until `users` are active, starting them spread over `ramp` seconds"""
+        for n in range(len(self.tasks), users):
+            guest = n % 5 < 3
+            pool = self.guests if guest else self.registered
+            user_id = pool[(n // 5) % len(pool)] if pool else f"load-{n}"
+            reader = Reader(self, n, user_id, "guest" if guest else "registered", self.rng.random() * ramp)
+            self.tasks.append(asyncio.get_running_loop().create_task(reader.run()))
+
+    async def stop(self):
+        self.stopped = True
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class Reader:
+    def __init__(self, sim: Simulation, n: int, user_id: str, kind: str, delay: float):
+        self.sim = sim
+        self.user_id = user_id
+        self.kind = kind
+        self.delay = delay
+        self.rng = random.Random(n)
+        # Each simulated reader is its own client as far as rate limiting goes
+        self.headers = {"X-Forwarded-For": f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"}
+
+    async def run(self):
+        sim, b, rng = self.sim, self.sim.behaviour, self.rng
+        await asyncio.sleep(self.delay)
+        while not sim.stopped:
+            await self.home()
+            for _ in range(rng.randint(*b.books_per_visit)):
+                await sim.think(*b.home_think)
+                await self.read(sim.pick_book(rng))
+            await sim.think(*b.between_visits)
+
+    async def home(self):
+        sim = self.sim
+        await asyncio.gather(
+            sim.call(self, "home_books", "GET", "/api/books", params={"limit": 300}),
+            sim.call(self, "home_featured", "GET", "/api/books/featured", params={"limit": 10}),
+            sim.call(self, "home_recommended", "GET", f"/api/books/recommended/{self.user_id}", params={"limit": 10}),
+        )
+
+    async def read(self, book_id: int):
+        sim, b, rng = self.sim, self.sim.behaviour, self.rng
+        await sim.call(self, "open_book", "GET", f"/api/books/{book_id}")
+        await sim.call(self, "book_activity", "GET", f"/api/activity/{self.user_id}/{book_id}")
+        position, chapters = rng.random() * 0.5, rng.randint(0, 20)
+        favorite = False
+        updates = max(1, int(rng.expovariate(1 / b.position_updates_mean)))
+        for _ in range(updates):
+            await sim.think(b.position_interval * 0.8, b.position_interval * 1.2)
+            position = min(1.0, position + rng.uniform(0.002, 0.02))
+            chapters += rng.random() < 0.2
+            await sim.call(self, "save_position", "POST", "/api/activity", json={
+                "user_id": self.user_id, "book_id": book_id, "last_position": round(position, 4),
+                "is_favorite": favorite, "chapter_read_count": chapters})
+            if not favorite and rng.random() < b.favorite_chance[self.kind] / updates:
+                favorite = True
+                await sim.call(self, "favorite", "POST", "/api/activity", json={
+                    "user_id": self.user_id, "book_id": book_id, "last_position": round(position, 4),
+                    "is_favorite": True, "chapter_read_count": chapters})
+                await sim.call(self, "favorites_list", "GET", f"/api/favorites/{self.user_id}")
+
+
+def stage_report(users: int, samples: Dict[str, List], seconds: float) -> Dict[str, Any]:
+    everything = [s for kind in samples.values() for s in kind]
+    overall = summarize([lat for lat, _ in everything], [st for _, st in everything], seconds)
+    overall["rate_limited"] = overall["statuses"].get("429", 0)
+    return {
+        "users": users,
+        **overall,
+        "by_kind": {kind: summarize([lat for lat, _ in s], [st for _, st in s], seconds)
+                    for kind, s in sorted(samples.items())},
+    }
+
+
+def find_saturation(stages: List[Dict[str, Any]], slo_p99_ms: float, max_error_rate: float) -> Dict[str, Any]:
+    """
+    First stage where p99 breaks the SLO, errors pass the limit, or throughput
+    stops following the population (less than half the expected growth).
+    """
+    previous = None
+    for stage in stages:
+        reason = None
+        error_rate = stage["errors"] / stage["requests"] if stage["requests"] else 0.0
+        if stage["p99_ms"] > slo_p99_ms:
+            reason = f"p99 {stage['p99_ms']}ms over the {slo_p99_ms}ms SLO"
+        elif error_rate > max_error_rate:
+            reason = f"error rate {error_rate:.1%}"
+        elif previous and previous["throughput_rps"]:
+            expected = stage["users"] / previous["users"]
+            achieved = stage["throughput_rps"] / previous["throughput_rps"]
+            if achieved - 1 < (expected - 1) / 2:
+                reason = f"throughput grew x{achieved:.2f} for x{expected:.2f} users"
+        if reason:
+            return {"saturated": True, "users": stage["users"], "reason": reason,
+                    "last_healthy_users": previous["users"] if previous else None,
+                    "max_throughput_rps": max(s["throughput_rps"] for s in stages)}
+        previous = stage
+    return {"saturated": False, "users": None, "reason": None,
+            "last_healthy_users": stages[-1]["users"] if stages else None,
+            "max_throughput_rps": max((s["throughput_rps"] for s in stages), default=0.0)}
+
+
+async def run_stages(sim: Simulation, stages: Sequence[int], stage_seconds: float, log=print) -> List[Dict[str, Any]]:
+    reports = []
+    log(f"{'users':>7} {'rps':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>7} {'429':>6}")
+    for index, users in enumerate(stages):
+        # Newcomers arrive over the first third of the stage rather than all at once
+        sim.grow(users, stage_seconds / 3)
+        sim.stage = index
+        started = time.perf_counter()
+        await asyncio.sleep(stage_seconds)
+        elapsed = time.perf_counter() - started
+        report = stage_report(users, sim.samples.pop(index, {}), elapsed)
+        reports.append(report)
+        log(f"{users:>7} {report['throughput_rps']:>9} {report['p50_ms']:>9} {report['p90_ms']:>9} "
+            f"{report['p99_ms']:>9} {report['errors']:>7} {report['rate_limited']:>6}")
+    sim.stage = -1
+    await sim.stop()
+    return reports
+
+
+async def _discover(client: httpx.AsyncClient) -> List[int]:
+    response = await client.get("/api/books", params={"limit": 300})
+    response.raise_for_status()
+    return [book["id"] for book in response.json()]
+
+
+async def _simulate(client, book_ids, registered, guests, stages, stage_seconds, time_scale, log):
+    if not book_ids:
+        book_ids = await _discover(client)
+    sim = Simulation(client, book_ids, registered, guests, time_scale)
+    return await run_stages(sim, stages, stage_seconds, log)
+
+
+def run_load(stages: Sequence[int] = DEFAULT_STAGES, stage_seconds: float = 30.0, time_scale: float = 1.0,
+             books: int = 300, latency: float = 0.005, mode: str = "spawn", url: Optional[str] = None,
+             slo_p99_ms: float = 500.0, max_error_rate: float = 0.01, log=print) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=max(stages) + 10, max_keepalive_connections=max(stages) + 10)
+    timeout = httpx.Timeout(30.0)
+
+    if url:
+        async def external():
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+                return await _simulate(client, [], [], [], stages, stage_seconds, time_scale, log)
+        reports = asyncio.run(external())
+        target = {"url": url}
+    else:
+        with StandIn() as stand_in:
+            stand_in.record = False
+            catalog = seed_catalog(stand_in, books, users=max(max(stages), 100))
+            stand_in.latency = latency
+            args = (catalog.book_ids, catalog.user_ids, catalog.guest_ids, stages, stage_seconds, time_scale, log)
+            if mode == "asgi":
+                with BenchApp(stand_in) as bench:
+                    async def in_process():
+                        import upstream
+                        async with bench.client() as client:
+                            try:
+                                return await _simulate(client, *args)
+                            finally:
+                                await upstream.close_client()
+                    reports = asyncio.run(in_process())
+            else:
+                with ServerProcess(stand_in) as server:
+                    async def spawned():
+                        async with httpx.AsyncClient(base_url=server.url, limits=limits, timeout=timeout) as client:
+                            return await _simulate(client, *args)
+                    reports = asyncio.run(spawned())
+            target = {"mode": mode, "books": books, "upstream_latency_ms": latency * 1000}
+
+    return {
+        "meta": {**run_metadata(), **target, "stage_seconds": stage_seconds, "time_scale": time_scale,
+                 "slo_p99_ms": slo_p99_ms, "max_error_rate": max_error_rate},
+        "saturation": find_saturation(reports, slo_p99_ms, max_error_rate),
+        "stages": reports,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay reader traffic against the API in growing stages")
+    parser.add_argument("--stages", default=",".join(map(str, DEFAULT_STAGES)), help="Active users per stage")
+    parser.add_argument("--stage-seconds", type=float, default=30.0, help="Measured duration of each stage")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="Multiplier on think times (0.1 = ten times more impatient readers)")
+    parser.add_argument("--books", type=int, default=300, help="Catalog size seeded into the stand-in")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latency added to every upstream request")
+    parser.add_argument("--mode", choices=("spawn", "asgi"), default="spawn", help="How to run the API locally")
+    parser.add_argument("--url", help="Load an already running API instead (its data is used as is)")
+    parser.add_argument("--slo-p99-ms", type=float, default=500.0, help="p99 latency counted as saturated")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    report = run_load([int(s) for s in args.stages.split(",")], args.stage_seconds, args.time_scale,
+                      args.books, args.latency_ms / 1000, args.mode, args.url, args.slo_p99_ms)
+    write_report(args.out, report)
+    saturation = report["saturation"]
+    if saturation["saturated"]:
+        print(f"saturated at {saturation['users']} users ({saturation['reason']}); "
+              f"last healthy stage {saturation['last_healthy_users']} users")
+    else:
+        print(f"no saturation up to {saturation['last_healthy_users']} users")
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+"""
+Local HTTP stand-in for Supabase (PostgREST) and Project Gutenberg.
+
+Runs a threaded HTTP server on 127.0.0.1 with an in-memory table store that
+understands the subset of the PostgREST query grammar the backend uses, plus
+static fixture files served with ETag/Last-Modified validators.
+"""
+import heapq
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+# Conflict target, whether ids are generated and which columns get an equality
+# index (so eq/in lookups stay cheap on benchmark-sized tables), per table
+DEFAULT_TABLES = {
+    "users": {"pk": ["id"], "serial": False, "index": ["id"]},
+    "books": {"pk": ["id"], "serial": True, "index": ["id", "category", "is_featured"]},
+    "user_activity": {"pk": ["id"], "serial": True, "index": ["user_id"]},
+    "app_settings": {"pk": ["id"], "serial": True, "index": ["key"]},
+    "book_fingerprints": {"pk": ["book_id"], "serial": False, "index": ["book_id"]},
+    "highlights": {"pk": ["id"], "serial": True, "index": ["user_id"]},
+}
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+class FixtureFile:
+    """A static file served with cache validators"""
+
+    def __init__(self, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 content_type: str = "text/plain; charset=utf-8"):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+
+
+class Response:
+    def __init__(self, status: int, body: Any = b"", headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        if isinstance(body, (list, dict)):
+            body = json.dumps(body).encode()
+            headers = {"Content-Type": "application/json", **(headers or {})}
+        elif isinstance(body, str):
+            body = body.encode()
+        self.body = body
+        self.headers = headers or {}
+
+
+def _split_top_level(value: str) -> List[str]:
+    """Split on commas that are not inside parentheses or braces"""
+    parts, depth, current = [], 0, ""
+    for char in value:
+        if char in "({":
+            depth += 1
+        elif char in ")}":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _coerce(raw: str, sample: Any) -> Any:
+    """Convert a filter value to the type of the stored value it is compared with"""
+    if raw == "null":
+        return None
+    if isinstance(sample, bool):
+        return raw.lower() == "true"
+    if isinstance(sample, int):
+        try:
+            return int(raw)
+        except ValueError:
+            return float(raw)
+    if isinstance(sample, float):
+        return float(raw)
+    return raw
+
+
+@lru_cache(maxsize=256)
+def _like_regex(pattern: str, case_insensitive: bool) -> "re.Pattern":
+    regex = "^" + ".*".join(re.escape(p) for p in re.split(r"[*%]", pattern)) + "$"
+    return re.compile(regex, re.IGNORECASE if case_insensitive else 0)
+
+
+def _like(pattern: str, value: Any, case_insensitive: bool) -> bool:
+    if value is None:
+        return False
+    return _like_regex(pattern, case_insensitive).match(str(value)) is not None
+
+
+def _compare(row: Dict[str, Any], column: str, op: str, raw: Any) -> bool:
+    if op == "group":
+        results = (_compare(row, *part) for part in raw)
+        return all(results) if column == "and" else any(results)
+    value = row.get(column)
+    negate = False
+    if op.startswith("not."):
+        negate, op = True, op[4:]
+    if op == "in":
+        result = _index_key(value) in _in_set(raw)
+    elif op == "is":
+        result = value is None if raw == "null" else value is (raw == "true")
+    elif op == "ov":
+        items = set(raw.strip("{}").split(","))
+        result = bool(items & set(value or []))
+    elif op == "cs":
+        items = set(raw.strip("{}").split(","))
+        result = items <= set(value or [])
+    elif op in ("like", "ilike"):
+        result = _like(raw, value, op == "ilike")
+    else:
+        target = _coerce(raw, value)
+        if value is None or target is None:
+            result = op == "eq" and value is target
+        elif op == "eq":
+            result = value == target
+        elif op == "neq":
+            result = value != target
+        elif op == "gt":
+            result = value > target
+        elif op == "gte":
+            result = value >= target
+        elif op == "lt":
+            result = value < target
+        elif op == "lte":
+            result = value <= target
+        else:
+            raise ValueError(f"unsupported operator {op}")
+    return not result if negate else result
+
+
+def _index_key(value: Any) -> str:
+    """Spell a stored value the way it appears in a filter"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _in_items(raw: str) -> List[str]:
+    return [unquote(v).strip('"') for v in raw.strip("()").split(",") if v != ""]
+
+
+@lru_cache(maxsize=256)
+def _in_set(raw: str) -> frozenset:
+    return frozenset(_in_items(raw))
+
+
+def _parse_condition(expression: str) -> Tuple[str, str, Any]:
+    """'title.ilike.*x*' -> ('title', 'ilike', '*x*'); 'and(a,b)' -> ('and', 'group', [a, b])"""
+    for mode in ("and", "or"):
+        if expression.startswith(mode + "("):
+            return mode, "group", [_parse_condition(p) for p in _split_top_level(expression[len(mode) + 1:-1])]
+    column, rest = expression.split(".", 1)
+    if rest.startswith("not."):
+        op, raw = rest[4:].split(".", 1)
+        return column, "not." + op, raw
+    op, raw = rest.split(".", 1)
+    return column, op, raw
+
+
+class FakePostgrest:
+    """In-memory tables behind a PostgREST-shaped interface"""
+
+    def __init__(self, tables: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.config = {name: dict(cfg) for name, cfg in (tables or DEFAULT_TABLES).items()}
+        self.rows: Dict[str, List[Dict[str, Any]]] = {name: [] for name in self.config}
+        self.next_id: Dict[str, int] = {name: 1 for name in self.config}
+        # table -> column -> index key -> rows, built lazily
+        self.indexes: Dict[str, Dict[str, Dict[str, List[Dict[str, Any]]]]] = {}
+        self.lock = threading.Lock()
+
+    # ----- direct access for tests -----
+
+    def insert(self, table: str, *rows: Dict[str, Any]) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [self._insert_row(table, dict(row)) for row in rows]
+
+    def table(self, table: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [dict(row) for row in self.rows.get(table, [])]
+
+    # ----- query evaluation -----
+
+    def _cfg(self, table: str) -> Dict[str, Any]:
+        if table not in self.config:
+            self.config[table] = {"pk": ["id"], "serial": True}
+            self.rows[table] = []
+            self.next_id[table] = 1
+        return self.config[table]
+
+    def _insert_row(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        cfg = self._cfg(table)
+        if cfg["serial"] and row.get("id") is None:
+            row["id"] = self.next_id[table]
+        if isinstance(row.get("id"), int):
+            self.next_id[table] = max(self.next_id[table], row["id"] + 1)
+        self.rows[table].append(row)
+        for column, index in self.indexes.get(table, {}).items():
+            index.setdefault(_index_key(row.get(column)), []).append(row)
+        return row
+
+    def _index(self, table: str, column: str) -> Dict[str, List[Dict[str, Any]]]:
+        indexes = self.indexes.setdefault(table, {})
+        index = indexes.get(column)
+        if index is None:
+            index = indexes[column] = {}
+            for row in self.rows[table]:
+                index.setdefault(_index_key(row.get(column)), []).append(row)
+        return index
+
+    def _update_rows(self, table: str, rows: List[Dict[str, Any]], changes: Dict[str, Any]):
+        """Apply changes, moving rows between index buckets when an indexed value changes"""
+        for column, index in self.indexes.get(table, {}).items():
+            if column not in changes:
+                continue
+            new_key = _index_key(changes[column])
+            for row in rows:
+                old_key = _index_key(row.get(column))
+                if old_key != new_key:
+                    bucket = [r for r in index.get(old_key, ()) if r is not row]
+                    if bucket:
+                        index[old_key] = bucket
+                    else:
+                        index.pop(old_key, None)
+                    index.setdefault(new_key, []).append(row)
+        for row in rows:
+            row.update(changes)
+
+    def _delete_rows(self, table: str, rows: List[Dict[str, Any]]):
+        doomed = {id(r) for r in rows}
+        if not doomed:
+            return
+        self.rows[table] = [r for r in self.rows[table] if id(r) not in doomed]
+        for column, index in self.indexes.get(table, {}).items():
+            for key in {_index_key(row.get(column)) for row in rows}:
+                bucket = [r for r in index.get(key, ()) if id(r) not in doomed]
+                if bucket:
+                    index[key] = bucket
+                else:
+                    index.pop(key, None)
+
+    def _candidates(self, table: str, conditions) -> List[Dict[str, Any]]:
+        """Narrow the scan through an indexed eq/in condition when there is one"""
+        indexed = self.config[table].get("index", ())
+        for mode, parts in conditions:
+            if mode != "and" or len(parts) != 1:
+                continue
+            column, op, raw = parts[0]
+            if column in indexed and op in ("eq", "in"):
+                keys = [raw] if op == "eq" else _in_items(raw)
+                index = self._index(table, column)
+                return [row for key in dict.fromkeys(keys) for row in index.get(key, ())]
+        return self.rows[table]
+
+    def _filter(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        conditions = []
+        for key, value in params:
+            if key in RESERVED_PARAMS:
+                continue
+            if key in ("or", "and"):
+                parts = [_parse_condition(p) for p in _split_top_level(value[1:-1])]
+                conditions.append((key, parts))
+            else:
+                op, raw = value.split(".", 1)
+                if op == "not":
+                    op2, raw = raw.split(".", 1)
+                    op = "not." + op2
+                conditions.append(("and", [(key, op, raw)]))
+
+        def matches(row):
+            for mode, parts in conditions:
+                results = (_compare(row, c, o, r) for c, o, r in parts)
+                if not (any(results) if mode == "or" else all(results)):
+                    return False
+            return True
+
+        candidates = self._candidates(table, conditions)
+        if not conditions:
+            return candidates
+        return [row for row in candidates if matches(row)]
+
+    @staticmethod
+    def _order(rows: List[Dict[str, Any]], order: Optional[str], top: Optional[int] = None) -> List[Dict[str, Any]]:
+        if not order:
+            return rows
+        terms = order.split(",")
+        if top is not None and len(terms) == 1 and top < len(rows):
+            # Same result as a stable sort cut to `top`, without sorting the whole table
+            bits = terms[0].split(".")
+            column, descending = bits[0], "desc" in bits[1:]
+            present = [r for r in rows if r.get(column) is not None]
+            pick = heapq.nlargest if descending else heapq.nsmallest
+            best = pick(top, present, key=lambda r: r[column])
+            if len(best) < top:
+                best += [r for r in rows if r.get(column) is None][:top - len(best)]
+            return best
+        for term in reversed(terms):
+            bits = term.split(".")
+            column, descending = bits[0], "desc" in bits[1:]
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            present.sort(key=lambda r: r[column], reverse=descending)
+            rows = present + missing
+        return rows
+
+    @staticmethod
+    def _project(rows: List[Dict[str, Any]], select: Optional[str]) -> List[Dict[str, Any]]:
+        if not select or select == "*":
+            return [dict(r) for r in rows]
+        columns = [c.strip() for c in select.split(",")]
+        return [{c: r.get(c) for c in columns} for r in rows]
+
+    def handle(self, method: str, table: str, params: List[Tuple[str, str]],
+               headers: Dict[str, str], body: bytes) -> Response:
+        query = dict(params)
+        prefer = headers.get("prefer", "")
+        minimal = "return=minimal" in prefer
+        with self.lock:
+            cfg = self._cfg(table)
+            if method in ("GET", "HEAD"):
+                rows = self._filter(table, params)
+                total = len(rows)
+                offset = int(query.get("offset", 0))
+                limit = int(query["limit"]) if "limit" in query else None
+                rows = self._order(rows, query.get("order"), offset + limit if limit is not None else None)
+                rows = rows[offset:offset + limit if limit is not None else None]
+                extra = {}
+                if "count=exact" in prefer:
+                    end = offset + len(rows) - 1
+                    extra["Content-Range"] = f"{offset}-{end}/{total}" if rows else f"*/{total}"
+                return Response(200, self._project(rows, query.get("select")), extra)
+
+            if method == "POST":
+                payload = json.loads(body or b"null")
+                items = payload if isinstance(payload, list) else [payload]
+                conflict = query.get("on_conflict")
+                keys = conflict.split(",") if conflict else cfg["pk"]
+                upsert = "resolution=merge-duplicates" in prefer
+                written = []
+                for item in items:
+                    existing = None
+                    if all(item.get(k) is not None for k in keys):
+                        pool = self.rows[table]
+                        if keys[0] in cfg.get("index", ()):
+                            pool = self._index(table, keys[0]).get(_index_key(item[keys[0]]), ())
+                        existing = next((r for r in pool if all(r.get(k) == item[k] for k in keys)), None)
+                    if existing is not None:
+                        if not upsert:
+                            return Response(409, {"code": "23505", "message": "duplicate key value violates unique constraint"})
+                        self._update_rows(table, [existing], item)
+                        written.append(existing)
+                    else:
+                        written.append(self._insert_row(table, dict(item)))
+                return Response(201, b"" if minimal else [dict(r) for r in written])
+
+            if method == "PATCH":
+                patch = json.loads(body or b"{}")
+                rows = self._filter(table, params)
+                self._update_rows(table, rows, patch)
+                return Response(204 if minimal else 200, b"" if minimal else [dict(r) for r in rows])
+
+            if method == "DELETE":
+                rows = self._filter(table, params)
+                self._delete_rows(table, rows)
+                return Response(204 if minimal else 200, b"" if minimal else [dict(r) for r in rows])
+
+        return Response(405, {"message": f"method {method} not allowed"})
+
+
+class StandIn:
+    """
+    Threaded local HTTP server combining a FakePostgrest at /rest/v1/ with
+    fixture files everywhere else.
+
+    Hooks for tests:
+      latency     seconds slept before every request is answered
+      record      keep every request in .requests (turned off by benchmarks)
+      fault_hook  callable(method, path) -> Optional[Response]; a Response
+                  short-circuits the request, the string "drop" closes the
+                  connection without answering
+    """
+
+    def __init__(self, tables: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.db = FakePostgrest(tables)
+        self.files: Dict[str, FixtureFile] = {}
+        self.latency = 0.0
+        self.record = True
+        self.fault_hook: Optional[Callable[[str, str], Any]] = None
+        self.requests: List[Tuple[str, str, Dict[str, str]]] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, method: str, prefix: str) -> int:
+        """Number of requests received with the given method and path prefix"""
+        return sum(1 for m, p, _ in self.requests if m == method and p.startswith(prefix))
+
+    def start(self) -> "StandIn":
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, Nagle's
+            # algorithm and delayed ACKs add ~40ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                headers = {k.lower(): v for k, v in self.headers.items()}
+                if stand_in.record:
+                    stand_in.requests.append((self.command, self.path, headers))
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                response = stand_in.fault_hook(self.command, self.path) if stand_in.fault_hook else None
+                if response == "drop":
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if response is None:
+                    response = stand_in.route(self.command, self.path, headers, body)
+                self.send_response(response.status)
+                for key, value in response.headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(response.body)))
+                self.end_headers()
+                if self.command != "HEAD" and response.body:
+                    self.wfile.write(response.body)
+
+            do_GET = do_HEAD = do_POST = do_PATCH = do_DELETE = _dispatch
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self) -> "StandIn":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def route(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Response:
+        parts = urlsplit(path)
+        if parts.path.startswith("/rest/v1/"):
+            table = parts.path[len("/rest/v1/"):]
+            params = parse_qsl(parts.query, keep_blank_values=True)
+            try:
+                return self.db.handle(method, table, params, headers, body)
+            except (ValueError, KeyError) as e:
+                return Response(400, {"message": str(e)})
+        return self.serve_file(method, parts.path, headers)
+
+    def serve_file(self, method: str, path: str, headers: Dict[str, str]) -> Response:
+        fixture = self.files.get(path)
+        if fixture is None or method not in ("GET", "HEAD"):
+            return Response(404, b"Not Found")
+        validators = {}
+        if fixture.etag:
+            validators["ETag"] = fixture.etag
+        if fixture.last_modified:
+            validators["Last-Modified"] = fixture.last_modified
+        if fixture.etag and headers.get("if-none-match") == fixture.etag:
+            return Response(304, b"", validators)
+        if (not fixture.etag and fixture.last_modified
+                and headers.get("if-modified-since") == fixture.last_modified):
+            return Response(304, b"", validators)
+        return Response(200, fixture.body, {"Content-Type": fixture.content_type, **validators})
@@ -0,0 +1,61 @@
+"""Per-user activity cache: LRU bounds, load/write races and reads answered locally"""
+import asyncio
+
+from activity_cache import ActivityCache
+from tests.perf.harness import BenchApp
+from tests.stand_in import StandIn
+
+
+def test_lru_by_user_within_row_budget_and_stale_loads_dropped():
+    cache = ActivityCache(max_users=3, max_rows=5, ttl=60)
+    for user_id, books in (("a", 1), ("b", 2), ("c", 2)):
+        cache.put(user_id, [{"book_id": n} for n in range(books)], cache.marker())
+    assert cache.get("a") is not None          # a is now the most recently used
+    cache.put("d", [{"book_id": 9}], cache.marker())
+    assert list(cache.users) == ["c", "a", "d"] and cache.rows == 4
+
+    cache.upsert("d", {"book_id": 10})
+    cache.upsert("d", {"book_id": 11})
+    assert "c" not in cache.users and cache.rows == 4
+    cache.upsert("x", {"book_id": 1})           # not cached: nothing to update
+    assert "x" not in cache.users
+
+    # A load that started before a write to the same user must not replace it
+    marker = cache.marker()
+    cache.upsert("a", {"book_id": 0, "last_position": 0.9})
+    cache.put("a", [{"book_id": 0, "last_position": 0.1}], marker)
+    assert cache.get("a")[0]["last_position"] == 0.9
+    cache.remove("a", 0)
+    cache.remove_book(11)
+    assert 0 not in cache.get("a") and list(cache.get("d")) == [9, 10]
+
+
+def test_active_readers_are_served_from_the_cache():
+    with StandIn() as stand_in:
+        dracula, emma = (row["id"] for row in stand_in.db.insert(
+            "books", {"title": "Dracula", "author": "Bram Stoker"}, {"title": "Emma", "author": "Jane Austen"}))
+        stand_in.db.insert("user_activity", {"user_id": "u1", "book_id": dracula, "last_position": 0.2,
+                                             "is_favorite": True})
+
+        async def run():
+            async with bench.client() as client:
+                assert len((await client.get("/api/activity/u1")).json()) == 1
+                loads = stand_in.count("GET", "/rest/v1/user_activity")
+
+                assert (await client.get(f"/api/activity/u1/{dracula}")).json()["last_position"] == 0.2
+                assert [b["id"] for b in (await client.get("/api/favorites/u1")).json()] == [dracula]
+                for book_id, position, favorite in ((dracula, 0.5, True), (emma, 0.1, True)):
+                    response = await client.post("/api/activity", json={
+                        "user_id": "u1", "book_id": book_id, "last_position": position, "is_favorite": favorite})
+                    assert response.status_code == 200
+                assert (await client.get(f"/api/activity/u1/{dracula}")).json()["last_position"] == 0.5
+                assert {b["id"] for b in (await client.get("/api/favorites/u1")).json()} == {dracula, emma}
+                # Reads and the saves' existence checks never went back upstream
+                assert stand_in.count("GET", "/rest/v1/user_activity") == loads
+
+                await client.delete("/api/users/u1")
+                assert (await client.get("/api/activity/u1")).json() == []
+                assert stand_in.count("GET", "/rest/v1/user_activity") == loads + 1
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
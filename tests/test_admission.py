@@ -0,0 +1,83 @@
+"""Upstream admission (shedding, FIFO handoff, timeouts) and per-client rate limits"""
+import asyncio
+
+import pytest
+
+import admission
+from admission import RateLimiter, UpstreamLimiter, UpstreamSaturated, client_key, parse_networks
+from tests.perf.harness import ADMIN_HEADERS, BenchApp
+from tests.stand_in import StandIn
+
+
+def test_upstream_limiter_hands_slots_over_in_order_and_sheds_beyond_the_queue():
+    async def run():
+        limiter = UpstreamLimiter(max_concurrency=1, max_queue=2, queue_timeout=0.05)
+        await limiter.acquire()
+        order = []
+
+        async def wait(name):
+            await limiter.acquire()
+            order.append(name)
+
+        first = asyncio.ensure_future(wait("first"))
+        second = asyncio.ensure_future(wait("second"))
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 2
+        with pytest.raises(UpstreamSaturated):
+            await limiter.acquire()
+
+        # Each release hands the one slot to the oldest waiter
+        limiter.release()
+        await first
+        limiter.release()
+        await second
+        assert order == ["first", "second"] and limiter.in_flight == 1
+
+        # A waiter that times out or is cancelled leaves the queue and takes no slot
+        with pytest.raises(UpstreamSaturated):
+            await limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert limiter.queue_depth == 0
+        limiter.release()
+        assert limiter.in_flight == 0
+        assert limiter.stats()["shed"] == 2 and limiter.stats()["admitted"] == 3
+    asyncio.run(run())
+
+
+def test_rate_limiter_refills_buckets_and_forwarded_for_is_only_believed_from_proxies(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=2.0, burst=3)
+    assert [limiter.check("a")[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.check("a")[1] == pytest.approx(0.5)
+    assert limiter.check("b")[0]
+    now[0] += 1.0
+    assert [limiter.check("a")[0] for _ in range(3)] == [True, True, False]
+    # Never refilled past the burst
+    now[0] += 60
+    assert [limiter.check("a")[0] for _ in range(4)] == [True, True, True, False]
+
+    trusted = parse_networks("127.0.0.1, 10.0.0.0/8")
+    spoofed = {"x-forwarded-for": "1.2.3.4"}
+    assert client_key(spoofed, "203.0.113.9", trusted) == "203.0.113.9"
+    # Behind the proxies: the right-most hop that isn't one of them
+    chain = {"x-forwarded-for": "1.2.3.4, 198.51.100.7, 10.0.0.5"}
+    assert client_key(chain, "127.0.0.1", trusted) == "198.51.100.7"
+    assert client_key({}, "127.0.0.1", trusted) == "127.0.0.1"
+    assert client_key({}, None, trusted) == "unknown"
+
+
+def test_upstream_stats_are_admin_only():
+    with StandIn() as stand_in:
+        async def run():
+            async with bench.client() as client:
+                assert (await client.get("/api/admin/upstream")).status_code == 401
+                stats = (await client.get("/api/admin/upstream", headers=ADMIN_HEADERS)).json()
+                assert set(stats["rate_limits"]) == {"book", "search"}
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
@@ -0,0 +1,86 @@
+"""Admin analytics rollups: distinct readers and the events feeding the report"""
+import asyncio
+import json
+import os
+
+from analytics import Analytics, HyperLogLog
+from tests.perf.harness import ADMIN_HEADERS, BenchApp
+from tests.stand_in import StandIn
+
+
+def test_distinct_reader_estimate_and_merge():
+    monday, tuesday = HyperLogLog(), HyperLogLog()
+    for n in range(20000):
+        monday.add(f"reader-{n}")
+        monday.add(f"reader-{n}")
+    for n in range(10000, 30000):
+        tuesday.add(f"reader-{n}")
+    assert abs(monday.count() - 20000) < 20000 * 0.05
+    monday.merge(tuesday)
+    assert abs(monday.count() - 30000) < 30000 * 0.05
+    small = HyperLogLog()
+    for n in range(7):
+        small.add(str(n))
+    assert small.count() == 7
+
+
+def test_report_follows_opens_favorites_and_conversions():
+    with StandIn() as stand_in:
+        dracula, emma = (row["id"] for row in stand_in.db.insert(
+            "books", {"title": "Dracula", "author": "Bram Stoker", "category": "Horror"},
+            {"title": "Emma", "author": "Jane Austen", "category": "Romance"}))
+
+        async def run():
+            async with bench.client() as client:
+                for book_id in (dracula, dracula, emma):
+                    assert (await client.get(f"/api/books/{book_id}")).status_code == 200
+                for user_id in ("guest-1", "guest-2"):
+                    await client.post("/api/users", json={"id": user_id, "auth_provider": "guest"})
+                # Posted again on every later login: still one signup
+                for _ in range(2):
+                    await client.post("/api/users", json={"id": "u1", "email": "a@example.com",
+                                                          "auth_provider": "google"})
+                for favorite in (True, True, False):
+                    await client.post("/api/activity", json={"user_id": "guest-1", "book_id": dracula,
+                                                             "is_favorite": favorite})
+                await client.post("/api/activity", json={"user_id": "u1", "book_id": emma, "is_favorite": True})
+                await client.post("/api/users/migrate-guest", json={"guest_uuid": "guest-1", "new_user_id": "u1"})
+
+                assert (await client.get("/api/admin/analytics")).status_code == 401
+                return (await client.get("/api/admin/analytics", params={"days": 7}, headers=ADMIN_HEADERS)).json()
+
+        with BenchApp(stand_in) as bench:
+            report = asyncio.run(run())
+
+        totals = report["totals"]
+        assert totals["opens"] == 3 and totals["active_readers"] == 2
+        assert totals["favorites_added"] == 2 and totals["favorites_removed"] == 1
+        assert totals["signups"] == {"guest": 2, "google": 1} and totals["guest_migrations"] == 1
+        assert report["guest_conversion_rate"] == 0.5
+        assert report["top_books"][0] == {"book_id": dracula, "opens": 2}
+        assert report["opens_by_category"] == {"Horror": 2, "Romance": 1}
+        assert len(report["days"]) == 1
+
+
+def test_workers_keep_their_own_snapshots_and_restarts_take_over_stopped_ones(tmp_path):
+    path = str(tmp_path / "analytics.json")
+    stopped = Analytics(snapshot_path=path)
+    stopped.record_signup("guest")
+    stopped.record_signup("guest")
+    # Left behind by a worker that has exited, and the file of a sibling that is still serving
+    with open(f"{path}.999999999", "w") as f:
+        json.dump(stopped._snapshot(), f)
+    sibling = Analytics(snapshot_path=path)
+    sibling.record_signup("google")
+    with open(f"{path}.{os.getppid()}", "w") as f:
+        json.dump(sibling._snapshot(), f)
+
+    worker = Analytics(snapshot_path=path)
+    worker.record_migration()
+    worker.load()
+    assert sum(day.signups["guest"] for day in worker.days.values()) == 2
+    assert not os.path.exists(f"{path}.999999999") and os.path.exists(f"{path}.{os.getpid()}")
+    # The report adds the live sibling's last snapshot; its counts stay its own
+    assert worker.report()["totals"]["signups"] == {"guest": 2, "google": 1}
+    assert worker.report()["guest_conversion_rate"] == 0.5
+    assert os.path.exists(f"{path}.{os.getppid()}")
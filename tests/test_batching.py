@@ -0,0 +1,83 @@
+"""Request batching: one upstream call per tick, shared failures and fewer calls per home screen"""
+import asyncio
+
+from batching import BatchLoader
+from tests.perf.catalog import seed_catalog
+from tests.perf.harness import BenchApp
+from tests.stand_in import Response, StandIn
+
+
+def test_concurrent_loads_share_one_call_per_batch():
+    calls = []
+
+    async def load(keys):
+        calls.append(sorted(keys))
+        if "broken" in keys:
+            raise LookupError("upstream failed")
+        return {key: key.upper() for key in keys if key != "missing"}
+
+    async def run():
+        loader = BatchLoader("test-letters", load, default="?", max_batch=3)
+        values = await asyncio.gather(*(loader.load(key) for key in "abcab"), loader.load("missing"))
+        assert values == ["A", "B", "C", "A", "B", "?"]
+        assert calls == [["a", "b", "c"], ["missing"]]
+        assert await loader.load_many("xy") == ["X", "Y"]
+
+        # A failed batch is retried key by key: only the bad key's request fails
+        results = await asyncio.gather(loader.load("broken"), loader.load("d"), return_exceptions=True)
+        assert isinstance(results[0], LookupError) and results[1] == "D"
+        assert calls[-3:] == [["broken", "d"], ["broken"], ["d"]]
+        assert loader.batches == 6 and loader.keys == 8
+    asyncio.run(run())
+
+
+def test_home_screens_of_many_users_batch_their_lookups():
+    with StandIn() as stand_in:
+        catalog = seed_catalog(stand_in, 60, users=30)
+        users = catalog.user_ids[:20]
+
+        async def run():
+            async with bench.client() as client:
+                async def home(user_id):
+                    favorites, recommended = await asyncio.gather(
+                        client.get(f"/api/favorites/{user_id}"), client.get(f"/api/books/recommended/{user_id}"))
+                    assert favorites.status_code == recommended.status_code == 200
+                    return favorites.json()
+                return await asyncio.gather(*(home(user_id) for user_id in users))
+
+        with BenchApp(stand_in) as bench:
+            stand_in.requests.clear()
+            results = asyncio.run(run())
+
+        # Same answers as querying each user on its own
+        for user_id, favorites in zip(users, results):
+            expected = {row["book_id"] for row in stand_in.db.table("user_activity")
+                        if row["user_id"] == user_id and row["is_favorite"]}
+            assert {book["id"] for book in favorites} == expected
+        activity_calls = stand_in.count("GET", "/rest/v1/user_activity")
+        book_lookups = sum(1 for method, path, _ in stand_in.requests
+                           if method == "GET" and path.startswith("/rest/v1/books?id=in."))
+        # Unbatched this is 40 activity and 40 book lookups
+        assert activity_calls <= 4 and book_lookups <= 4
+
+
+def test_a_malformed_user_id_only_fails_its_own_request():
+    with StandIn() as stand_in:
+        stand_in.db.insert("user_activity", {"user_id": "reader-1", "book_id": 1, "last_position": 0.5})
+        # user_id is a uuid column: PostgREST rejects the whole filter when one value isn't one
+        stand_in.fault_hook = lambda method, path: (
+            Response(400, {"message": "invalid input syntax for type uuid"})
+            if path.startswith("/rest/v1/user_activity") and "bad" in path else None)
+
+        async def run():
+            async with bench.client() as client:
+                return await asyncio.gather(client.get("/api/activity/reader-1"),
+                                            client.get("/api/activity/bad%29id,x"))
+
+        with BenchApp(stand_in) as bench:
+            good, bad = asyncio.run(run())
+
+        assert good.status_code == 200 and good.json()[0]["last_position"] == 0.5
+        assert bad.status_code == 400
+        paths = [path for method, path, _ in stand_in.requests if path.startswith("/rest/v1/user_activity")]
+        assert len(paths) == 3 and "%22reader-1%22" in paths[0] and "%22bad%29id%2Cx%22)" in paths[0]
@@ -0,0 +1,21 @@
+"""The endpoint benchmark covers every route and runs clean on a small catalog"""
+from tests.perf.bench_endpoints import compare, run_benchmark, uncovered_routes
+
+
+def test_every_route_has_a_benchmark():
+    assert uncovered_routes() == []
+
+
+def test_small_catalog_run_is_error_free():
+    report = run_benchmark(sizes=(300,), requests=3, concurrency=2, latency=0.0, log=lambda *_: None)
+    endpoints = report["catalogs"]["300"]["endpoints"]
+    assert "GET /api/books [search]" in endpoints
+    failing = {name: stats["statuses"] for name, stats in endpoints.items() if stats["errors"]}
+    assert failing == {}
+    assert all(stats["requests"] == 3 and stats["p99_ms"] > 0 for stats in endpoints.values())
+
+    slower = {"catalogs": {"300": {"endpoints": {
+        name: {**stats, "p50_ms": stats["p50_ms"] * 2, "p99_ms": stats["p99_ms"] * 2}
+        for name, stats in endpoints.items()}}}}
+    assert compare(report, slower, threshold=1.25, log=lambda *_: None)
+    assert compare(slower, report, threshold=1.25, log=lambda *_: None) == []
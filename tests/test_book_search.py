@@ -0,0 +1,76 @@
+"""In-book search: phrase positions, snippets, one build per book and LRU eviction"""
+import asyncio
+
+from book_search import BookIndex, SearchIndexCache, query_terms
+from tests.perf.harness import BenchApp
+from tests.stand_in import StandIn
+from text_stats import split_chapters, strip_html
+
+BODY = ("<p>Call me Ishmael.</p>\n"
+        "<h2>CHAPTER I</h2>\n<p>The white whale, the WHITE whale!</p>\n<p>Some years ago.</p>\n"
+        "<h2>CHAPTER II</h2>\n<p>It was white</p>\n<p>Whale oil for the lamps.</p>\n")
+
+
+def test_phrases_are_found_with_offsets_into_the_chapter_text():
+    index = BookIndex(split_chapters(BODY, "Moby Dick"))
+    chapter_one = strip_html(split_chapters(BODY)[1][1])
+
+    matches = [index.match(p, 2) for p in index.find(query_terms('"White Whale"'))]
+    # Chapter II has "white" ending one paragraph and "Whale" starting the next: still adjacent words
+    assert [(m["chapter"], m["chapter_title"]) for m in matches] == [
+        (1, "CHAPTER I"), (1, "CHAPTER I"), (2, "CHAPTER II")]
+    assert [chapter_one[m["offset"]:m["offset"] + m["length"]] for m in matches[:2]] == ["white whale", "WHITE whale"]
+    assert matches[0]["snippet"] == "The white whale, the WHITE whale! Some years ago."
+    assert len(index.find(query_terms("white whale oil"))) == 1
+    # ... but a phrase never spans two chapters
+    assert index.find(query_terms("ago it was")) == []
+    assert index.find(query_terms("ishmael")) and index.find(query_terms("kraken")) == []
+
+    async def run():
+        loads = []
+
+        async def load(book_id):
+            loads.append(book_id)
+            await asyncio.sleep(0.01)
+            return None if book_id == 404 else (f"Book {book_id}", BODY * book_id)
+
+        cache = SearchIndexCache(max_bytes=1)
+        first, second = await asyncio.gather(cache.get(1, load), cache.get(1, load))
+        assert first is second and loads == [1]
+        assert await cache.get(404, load) is None
+        # Over the budget: only the most recently built index stays
+        await cache.get(2, load)
+        assert list(cache.indexes) == [2] and cache.evictions == 1 and cache.bytes == cache.indexes[2][1].size
+        # A book changed while its index was being built gets a fresh build next time
+        building = asyncio.ensure_future(cache.get(3, load))
+        await asyncio.sleep(0)
+        cache.invalidate(3)
+        await building
+        assert 3 not in cache.indexes
+    asyncio.run(run())
+
+
+def test_search_endpoint_builds_the_index_once_and_drops_it_on_update():
+    with StandIn() as stand_in:
+        book_id = stand_in.db.insert("books", {"title": "Moby Dick", "author": "Herman Melville",
+                                               "content_body": BODY})[0]["id"]
+
+        async def run():
+            async with bench.client() as client:
+                responses = await asyncio.gather(*(
+                    client.get(f"/api/books/{book_id}/search", params={"q": "white whale", "limit": 1})
+                    for _ in range(5)))
+                assert all(r.status_code == 200 for r in responses)
+                result = responses[0].json()
+                assert result["total"] == 3 and len(result["matches"]) == 1
+                assert stand_in.count("GET", "/rest/v1/books") == 1
+
+                assert (await client.get("/api/books/999/search", params={"q": "whale"})).status_code == 404
+                assert (await client.get(f"/api/books/{book_id}/search", params={"q": "?!"})).status_code == 400
+
+                await client.patch(f"/api/admin/books/{book_id}", json={"content_body": "<p>A white whale.</p>"})
+                result = (await client.get(f"/api/books/{book_id}/search", params={"q": "white whale"})).json()
+                assert result["total"] == 1 and result["matches"][0]["chapter_title"] == "Moby Dick"
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
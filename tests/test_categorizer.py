@@ -0,0 +1,42 @@
+"""Categorization engine: weighted multi-labels, word-boundary matching and re-categorizing the corpus"""
+import asyncio
+
+import seed_books
+from categorizer import DEFAULT_CATEGORY, categorize, primary_category, score_categories
+from tests.stand_in import StandIn
+
+
+def test_labels_are_weighted_and_keywords_only_match_whole_words():
+    labels = categorize("The War of the Worlds", "H.G. Wells",
+                        body="<p>The Martians had come from Mars, and the war was lost.</p>")
+    assert primary_category(labels) == "Science Fiction"
+    assert dict(labels).get("History", 0) < dict(labels)["Science Fiction"] / 2
+
+    # Several genres at once, weights summing to one, best first
+    labels = categorize("A Journey to the Centre of the Earth", "Jules Verne")
+    assert [c for c, _ in labels] == ["Adventure", "Science Fiction"]
+    assert abs(sum(w for _, w in labels) - 1) < 0.01 and labels[0][1] > labels[1][1]
+
+    # "war" in Warden or postwar, "play" in Playford or display, "essay" in essayists: no hits
+    assert score_categories("The Warden of Playford", "Anon", description="a postwar display of essayists") == {}
+    assert categorize("Untitled", "Anon") == [(DEFAULT_CATEGORY, 1.0)]
+    assert primary_category(categorize("Untitled", "Anon", description="A history of the war of the roses")) == "History"
+
+
+def test_recategorize_reads_descriptions_and_skips_unchanged_books(monkeypatch):
+    with StandIn() as stand_in:
+        monkeypatch.setattr(seed_books, "SUPABASE_URL", stand_in.url)
+        monkeypatch.setattr(seed_books, "SUPABASE_ANON_KEY", "test-anon-key")
+        stand_in.db.insert("books", *(
+            {"title": title, "author": "Anon", "description": description, "category": "Fiction"}
+            for title, description in [("Collected Works", "Sonnets and ballads in verse"),
+                                       ("Untitled", "")]))
+
+        assert asyncio.run(seed_books.recategorize_all_books()) == 1
+        books = stand_in.db.table("books")
+        assert [book["category"] for book in books] == ["Poetry", "Fiction"]
+        assert stand_in.count("PATCH", "/rest/v1/books") == 2
+
+        # Nothing changed since: no writes at all
+        assert asyncio.run(seed_books.recategorize_all_books()) == 0
+        assert stand_in.count("PATCH", "/rest/v1/books") == 2
@@ -0,0 +1,33 @@
+"""Cold start: heavy imports stay deferred and the optional warm-up primes the pool"""
+import asyncio
+import subprocess
+import sys
+
+import server
+import upstream
+from tests.conftest import BACKEND_DIR
+from tests.stand_in import StandIn
+
+
+def test_seeder_import_does_not_load_the_html_parser():
+    code = "import sys, seed_books; print('bs4' in sys.modules, 'lxml' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert result.stdout.split() == ["False", "False"]
+
+
+def test_warm_up_opens_connections_and_runs_the_home_requests(monkeypatch):
+    with StandIn() as stand_in:
+        monkeypatch.setattr(server, "SUPABASE_URL", stand_in.url)
+        monkeypatch.setattr(server, "SUPABASE_ANON_KEY", "test-anon-key")
+        monkeypatch.setattr(server, "warmup_status", {"mode": "blocking", "state": "idle"})
+        monkeypatch.setattr(upstream, "_client", None)
+        stand_in.db.insert("books", {"title": "Dracula", "author": "Bram Stoker", "is_featured": True})
+
+        async def run():
+            await server.warm_up()
+            await upstream.close_client()
+        asyncio.run(run())
+
+        assert stand_in.count("GET", "/rest/v1/books?select=id&limit=1") == server.WARMUP_CONNECTIONS
+        assert server.warmup_status["state"] == "done"
+        assert set(server.warmup_status["requests"].values()) == {200}
@@ -0,0 +1,55 @@
+"""Cover proxy: ETag revalidation, invalidation on a new cover_image, and failures"""
+import asyncio
+
+import server
+from tests.perf.catalog import _cover_jpeg
+from tests.perf.harness import BenchApp
+from tests.stand_in import FixtureFile, StandIn
+
+
+def test_cover_is_fetched_once_revalidated_and_refetched_after_a_new_cover_image():
+    with StandIn() as stand_in:
+        for n in range(2):
+            stand_in.files[f"/covers/{n}.jpg"] = FixtureFile(_cover_jpeg(n), content_type="image/jpeg")
+        book_id = stand_in.db.insert("books", {"title": "Emma", "author": "Jane Austen",
+                                               "cover_image": f"{stand_in.url}/covers/0.jpg"})[0]["id"]
+
+        async def run():
+            async with bench.client() as client:
+                first = await client.get(f"/api/covers/{book_id}")
+                assert first.status_code == 200 and first.headers["content-type"] == "image/jpeg"
+                etag = first.headers["etag"]
+                again = await client.get(f"/api/covers/{book_id}", headers={"If-None-Match": etag})
+                assert again.status_code == 304 and again.headers["etag"] == etag
+                medium = await client.get(f"/api/covers/{book_id}", params={"size": "medium"})
+                assert len(medium.content) > len(first.content)
+                assert stand_in.count("GET", "/covers/") == 1
+
+                await client.patch(f"/api/admin/books/{book_id}",
+                                   json={"cover_image": f"{stand_in.url}/covers/1.jpg"})
+                changed = await client.get(f"/api/covers/{book_id}", headers={"If-None-Match": etag})
+                assert changed.status_code == 200 and changed.headers["etag"] != etag
+                assert stand_in.count("GET", "/covers/1.jpg") == 1
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
+
+
+def test_missing_and_broken_covers_are_404_and_502():
+    with StandIn() as stand_in:
+        ids = [row["id"] for row in stand_in.db.insert("books", *(
+            {"title": f"Book {n}", "author": "Author", "cover_image": cover}
+            for n, cover in enumerate([None, f"{stand_in.url}/covers/gone.jpg", "data:image/jpeg;base64",
+                                       "data:image/jpeg;base64,abc", "data:image/jpeg;base64,aGVsbG8="])))]
+
+        async def run():
+            async with bench.client() as client:
+                statuses = [(await client.get(f"/api/covers/{book_id}")).status_code for book_id in ids]
+                assert statuses == [404, 502, 502, 502, 502]
+                assert (await client.get("/api/covers/999")).status_code == 404
+                assert (await client.get(f"/api/covers/{ids[1]}", params={"size": "huge"})).status_code == 400
+            # Failed downloads don't leave their per-book locks behind
+            assert server.cover_cache._locks == {}
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
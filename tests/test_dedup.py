@@ -0,0 +1,62 @@
+"""Near-duplicate editions: signature similarity and the seeder skipping a second edition"""
+import asyncio
+import random
+
+import seed_books
+from dedup import DUPLICATE_THRESHOLD, LSHIndex, fingerprint_row, minhash, similarity
+from tests.stand_in import FixtureFile, StandIn
+
+_WORDS = ("whale ship sea captain harpoon voyage deck mast storm island sailor rope wind "
+          "wave oil boat crew night morning cabin").split()
+
+
+def _text(seed: int, words: int = 3000) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _edition(text: str) -> str:
+    """The same text with another front matter and a few words changed, as a second edition"""
+    words = text.split()
+    for i in range(0, len(words), 500):
+        words[i] = "editor"
+    return "Transcribed from the 1892 edition. " + " ".join(words)
+
+
+def test_near_identical_texts_score_above_the_threshold_and_unrelated_ones_do_not():
+    original = _text(1)
+    assert similarity(minhash(original), minhash(_edition(original))) >= DUPLICATE_THRESHOLD
+    assert similarity(minhash(original), minhash(_text(2))) < DUPLICATE_THRESHOLD
+
+    index = LSHIndex()
+    for book_id in range(1, 6):
+        index.add(book_id, minhash(_text(book_id)))
+    assert [book_id for book_id, _ in index.query(minhash(_edition(_text(3))))] == [3]
+    assert index.query(minhash(_text(99))) == []
+
+
+def test_seeder_skips_a_book_that_duplicates_a_stored_fingerprint(monkeypatch):
+    with StandIn() as stand_in:
+        monkeypatch.setattr(seed_books, "SUPABASE_URL", stand_in.url)
+        monkeypatch.setattr(seed_books, "SUPABASE_ANON_KEY", "test-anon-key")
+        monkeypatch.setattr(seed_books, "GUTENBERG_BASE_URL", stand_in.url)
+        original = _text(1)
+        stand_in.db.insert("book_fingerprints", *(
+            fingerprint_row(book_id, minhash(_text(book_id))) for book_id in range(2, 7)))
+        stand_in.files["/cache/epub/11/pg11.txt"] = FixtureFile(original.encode())
+        stand_in.files["/cache/epub/12/pg12.txt"] = FixtureFile(_edition(original).encode())
+
+        async def run():
+            index = await seed_books.load_fingerprint_index(page_size=2)
+            assert len(index) == 5
+            first = await seed_books.seed_single_book({"title": "Moby Dick", "author": "Herman Melville",
+                                                       "gutenberg_id": 11}, index)
+            assert first is not None and len(index) == 6
+            second = await seed_books.seed_single_book({"title": "Moby-Dick; or, The Whale",
+                                                        "author": "Herman Melville", "gutenberg_id": 12}, index)
+            assert second is None
+        asyncio.run(run())
+
+        assert [book["title"] for book in stand_in.db.table("books")] == ["Moby Dick"]
+        pages = [p for m, p, _ in stand_in.requests if m == "GET" and p.startswith("/rest/v1/book_fingerprints")]
+        assert len(pages) == 3 and "offset=" not in pages[-1] and "book_id=gt.5" in pages[-1]
@@ -0,0 +1,82 @@
+"""Guest migration: rows for the same book merge instead of colliding"""
+import asyncio
+
+from guest_merge import merge_activity
+from tests.perf.harness import ADMIN_HEADERS, BenchApp
+from tests.stand_in import Response, StandIn
+
+
+def test_merge_takes_furthest_position_ors_favorites_and_unions_highlights():
+    note = {"text": "It was a dark night", "position": 0.1}
+    rows = [
+        {"user_id": "member", "book_id": 1, "last_position": 0.7, "is_favorite": False,
+         "highlights": [note], "chapter_read_count": 3, "created_at": "2024-02-01", "updated_at": "2024-02-02"},
+        {"user_id": "guest", "book_id": 1, "last_position": 0.4, "is_favorite": True,
+         "highlights": [note, {"text": "Dawn", "position": 0.3}], "chapter_read_count": 5,
+         "created_at": "2024-01-01", "updated_at": "2024-01-05"},
+        {"user_id": "guest", "book_id": 2, "last_position": 0.2, "is_favorite": False, "highlights": None},
+        {"user_id": "other-guest", "book_id": 1, "last_position": 0.9, "is_favorite": False, "highlights": []},
+    ]
+    merged, collisions = merge_activity([("guest", "member"), ("other-guest", "member")], rows)
+    by_book = {row["book_id"]: row for row in merged}
+    assert collisions == 2 and set(by_book) == {1, 2}
+    assert by_book[1]["last_position"] == 0.9 and by_book[1]["is_favorite"] is True
+    assert by_book[1]["highlights"] == [note, {"text": "Dawn", "position": 0.3}]
+    assert by_book[1]["chapter_read_count"] == 5
+    assert (by_book[1]["created_at"], by_book[1]["updated_at"]) == ("2024-01-01", "2024-02-02")
+    assert by_book[2]["user_id"] == "member" and by_book[2]["highlights"] == []
+
+
+def test_migrations_upsert_merged_rows_and_remove_the_guests():
+    with StandIn() as stand_in:
+        stand_in.db.insert("users", *({"id": user_id} for user_id in ("g1", "g2", "g3", "m1", "m2")))
+        stand_in.db.insert("user_activity",
+                           {"user_id": "m1", "book_id": 1, "last_position": 0.8, "is_favorite": False},
+                           {"user_id": "g1", "book_id": 1, "last_position": 0.3, "is_favorite": True},
+                           {"user_id": "g1", "book_id": 2, "last_position": 0.5, "is_favorite": False},
+                           {"user_id": "g2", "book_id": 3, "last_position": 0.1, "is_favorite": True},
+                           {"user_id": "g3", "book_id": 3, "last_position": 0.6, "is_favorite": False})
+        stand_in.db.insert("highlights", {"user_id": "g1", "book_id": 2, "text": "kept"})
+
+        async def run():
+            async with bench.client() as client:
+                single = await client.post("/api/users/migrate-guest", json={"guest_uuid": "g1", "new_user_id": "m1"})
+                assert single.status_code == 200 and single.json()["merged"] == 1
+                batch = [{"guest_uuid": "g2", "new_user_id": "m2"}, {"guest_uuid": "g3", "new_user_id": "m2"}]
+                assert (await client.post("/api/admin/users/migrate-guests", json=batch)).status_code == 401
+                response = await client.post("/api/admin/users/migrate-guests", json=batch, headers=ADMIN_HEADERS)
+                assert response.json() == {"success": True, "guests": 2, "rows": 1, "merged": 1}
+                duplicate = [{"guest_uuid": "m1", "new_user_id": "m2"}, {"guest_uuid": "m1", "new_user_id": "m2"}]
+                assert (await client.post("/api/admin/users/migrate-guests", json=duplicate,
+                                          headers=ADMIN_HEADERS)).status_code == 400
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
+
+        activity = {(row["user_id"], row["book_id"]): row for row in stand_in.db.table("user_activity")}
+        assert set(activity) == {("m1", 1), ("m1", 2), ("m2", 3)}
+        assert activity[("m1", 1)]["last_position"] == 0.8 and activity[("m1", 1)]["is_favorite"] is True
+        assert activity[("m2", 3)]["last_position"] == 0.6 and activity[("m2", 3)]["is_favorite"] is True
+        assert [row["id"] for row in stand_in.db.table("users")] == ["m1", "m2"]
+        assert stand_in.db.table("highlights")[0]["user_id"] == "m1"
+
+
+def test_guest_is_kept_when_its_highlights_could_not_be_moved():
+    with StandIn() as stand_in:
+        stand_in.db.insert("users", {"id": "g1"}, {"id": "m1"})
+        stand_in.db.insert("user_activity", {"user_id": "g1", "book_id": 1, "last_position": 0.3})
+        stand_in.db.insert("highlights", {"user_id": "g1", "book_id": 1, "text": "kept"})
+        stand_in.fault_hook = lambda method, path: (
+            Response(500, {"message": "boom"}) if method == "PATCH" and path.startswith("/rest/v1/highlights") else None)
+
+        async def run():
+            async with bench.client() as client:
+                response = await client.post("/api/users/migrate-guest", json={"guest_uuid": "g1", "new_user_id": "m1"})
+                assert response.status_code == 500
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
+
+        assert stand_in.count("DELETE", "/rest/v1/") == 0
+        assert [row["id"] for row in stand_in.db.table("users")] == ["g1", "m1"]
+        assert [(row["user_id"], row["text"]) for row in stand_in.db.table("highlights")] == [("g1", "kept")]
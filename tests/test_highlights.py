@@ -0,0 +1,43 @@
+"""Highlights are added, edited and removed one at a time, and position saves don't carry them"""
+import asyncio
+
+from tests.perf.harness import BenchApp
+from tests.stand_in import StandIn
+
+
+def test_highlight_deltas_and_chapter_reads():
+    with StandIn() as stand_in:
+        book_id = stand_in.db.insert("books", {"title": "Emma", "author": "Jane Austen"})[0]["id"]
+
+        async def run():
+            async with bench.client() as client:
+                for chapter, position in ((2, 0.7), (1, 0.9), (2, 0.1)):
+                    response = await client.post("/api/highlights", json={
+                        "user_id": "u1", "book_id": book_id, "chapter": chapter,
+                        "position": position, "text": f"passage {chapter}/{position}"})
+                    assert response.status_code == 200 and response.json()["id"]
+
+                chapter_two = (await client.get(f"/api/highlights/u1/{book_id}", params={"chapter": 2})).json()
+                assert [h["position"] for h in chapter_two] == [0.1, 0.7]
+                everything = (await client.get(f"/api/highlights/u1/{book_id}")).json()
+                assert [(h["chapter"], h["position"]) for h in everything] == [(1, 0.9), (2, 0.1), (2, 0.7)]
+
+                target = chapter_two[0]["id"]
+                edited = await client.patch(f"/api/highlights/u1/{target}", json={"note": "lovely", "color": "pink"})
+                assert edited.json()["note"] == "lovely" and edited.json()["text"] == "passage 2/0.1"
+                assert (await client.patch(f"/api/highlights/u2/{target}", json={"note": "x"})).status_code == 404
+                assert (await client.delete(f"/api/highlights/u2/{target}")).status_code == 404
+                assert (await client.delete(f"/api/highlights/u1/{target}")).status_code == 200
+                assert len((await client.get(f"/api/highlights/u1/{book_id}")).json()) == 2
+
+                # A position save without highlights leaves the legacy array alone
+                stand_in.db.insert("user_activity", {"user_id": "u1", "book_id": book_id, "last_position": 0.1,
+                                                     "highlights": [{"text": "old", "position": 0.2}]})
+                response = await client.post("/api/activity", json={
+                    "user_id": "u1", "book_id": book_id, "last_position": 0.6})
+                assert response.status_code == 200
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
+
+        assert stand_in.db.table("user_activity")[0]["highlights"] == [{"text": "old", "position": 0.2}]
@@ -0,0 +1,129 @@
+"""Background jobs: progress, cancellation, restarts and the user purge"""
+import asyncio
+
+import jobs
+from jobs import JobRunner
+from tests.perf.harness import ADMIN_HEADERS, BenchApp
+from tests.stand_in import Response, StandIn
+
+
+def test_runner_reports_progress_cancels_and_marks_interrupted_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "PERSIST_INTERVAL", 0)
+
+    async def count(job, steps):
+        for n in range(steps):
+            job.update(n + 1, steps, f"step {n + 1}")
+            await asyncio.sleep(0.01)
+        return {"steps": steps}
+
+    async def run():
+        runner = JobRunner(str(tmp_path), workers=1, queue_size=2)
+        runner.register("count", count)
+        finished = runner.submit("count", steps=3)
+        slow = runner.submit("count", steps=1000)
+        try:
+            runner.submit("count", steps=1)
+            raise AssertionError("queue limit ignored")
+        except jobs.JobQueueFull:
+            pass
+        while finished.state != jobs.SUCCEEDED:
+            await asyncio.sleep(0.01)
+        assert finished.result == {"steps": 3} and finished.progress == 100.0
+
+        while slow.done < 5:
+            await asyncio.sleep(0.01)
+        runner.cancel(slow.id)
+        while slow.state == jobs.RUNNING:
+            await asyncio.sleep(0.01)
+        assert slow.state == jobs.CANCELLED and slow.done < 1000
+
+        # A job still running when the process stops is reported as interrupted after a restart
+        stuck = runner.submit("count", steps=1000)
+        while stuck.state != jobs.RUNNING:
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        restarted = JobRunner(str(tmp_path))
+        restarted.load()
+        assert restarted.get(stuck.id).state == jobs.INTERRUPTED
+        assert restarted.get(finished.id).message == "step 3"
+        assert JobRunner(str(tmp_path)).get(slow.id).state == jobs.CANCELLED
+    asyncio.run(run())
+
+
+def test_jobs_of_another_worker_are_listed_and_cancelled_through_the_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "PERSIST_INTERVAL", 0)
+
+    async def count(job, steps):
+        for n in range(steps):
+            job.update(n + 1, steps)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        owner, other = JobRunner(str(tmp_path), workers=1), JobRunner(str(tmp_path))
+        owner.register("count", count)
+        running = owner.submit("count", steps=1000)
+        queued = owner.submit("count", steps=1)
+        while running.done < 2:
+            await asyncio.sleep(0.01)
+        assert [job.id for job in other.list()] == [queued.id, running.id]
+
+        assert other.cancel(running.id).cancel_requested and other.cancel(queued.id).cancel_requested
+        assert other.cancel("missing") is None
+        while queued.state == jobs.QUEUED or running.state == jobs.RUNNING:
+            await asyncio.sleep(0.01)
+        assert running.state == queued.state == jobs.CANCELLED and running.done < 1000
+        assert other.get(running.id).state == jobs.CANCELLED
+        await owner.stop()
+    asyncio.run(run())
+
+
+def test_user_purge_runs_in_the_background():
+    with StandIn() as stand_in:
+        stand_in.db.insert("users", {"id": "u1", "email": "a@example.com"})
+        stand_in.db.insert("user_activity", {"user_id": "u1", "book_id": 1, "last_position": 0.3})
+        stand_in.db.insert("highlights", {"user_id": "u1", "book_id": 1, "text": "marked"})
+
+        async def run():
+            async with bench.client() as client:
+                assert (await client.delete("/api/admin/users/u1")).status_code == 401
+                response = await client.delete("/api/admin/users/u1", headers=ADMIN_HEADERS)
+                assert response.status_code == 202
+                job_id = response.json()["job_id"]
+                for _ in range(200):
+                    job = (await client.get(f"/api/admin/jobs/{job_id}", headers=ADMIN_HEADERS)).json()
+                    if job["state"] not in ("queued", "running"):
+                        break
+                    await asyncio.sleep(0.01)
+                assert job["state"] == "succeeded" and job["progress"] == 100.0
+                assert job_id in [j["id"] for j in (await client.get("/api/admin/jobs", headers=ADMIN_HEADERS)).json()]
+                assert (await client.get("/api/admin/jobs/missing", headers=ADMIN_HEADERS)).status_code == 404
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
+
+        assert stand_in.db.table("users") == []
+        assert stand_in.db.table("user_activity") == [] and stand_in.db.table("highlights") == []
+
+
+def test_user_purge_fails_and_keeps_the_auth_user_when_a_data_delete_fails():
+    with StandIn() as stand_in:
+        stand_in.db.insert("users", {"id": "u1", "email": "a@example.com"})
+        stand_in.db.insert("highlights", {"user_id": "u1", "book_id": 1, "text": "marked"})
+        stand_in.fault_hook = lambda method, path: (
+            Response(500, {"message": "boom"}) if method == "DELETE" and path.startswith("/rest/v1/highlights") else None)
+
+        async def run():
+            async with bench.client() as client:
+                job_id = (await client.delete("/api/admin/users/u1", headers=ADMIN_HEADERS)).json()["job_id"]
+                for _ in range(200):
+                    job = (await client.get(f"/api/admin/jobs/{job_id}", headers=ADMIN_HEADERS)).json()
+                    if job["state"] not in ("queued", "running"):
+                        break
+                    await asyncio.sleep(0.01)
+                assert job["state"] == "failed" and "highlights" in job["error"]
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
+
+        assert [row["id"] for row in stand_in.db.table("users")] == ["u1"]
+        assert stand_in.count("DELETE", "/auth/v1/") == 0
@@ -0,0 +1,33 @@
+"""Reader load generator: traffic shape, stage reports and saturation detection"""
+from tests.perf.load_readers import find_saturation, run_load
+
+
+def stage(users, rps, p99, errors=0, requests=1000):
+    return {"users": users, "throughput_rps": rps, "p99_ms": p99, "errors": errors, "requests": requests}
+
+
+def test_short_in_process_run_replays_reader_sessions():
+    report = run_load(stages=(4, 8), stage_seconds=1.0, time_scale=0.01, books=300, latency=0.0,
+                      mode="asgi", log=lambda *_: None)
+    assert [s["users"] for s in report["stages"]] == [4, 8]
+    kinds = set()
+    for s in report["stages"]:
+        kinds |= set(s["by_kind"])
+        assert s["errors"] == 0
+    assert {"home_books", "home_featured", "home_recommended", "open_book", "save_position"} <= kinds
+    assert "saturated" in report["saturation"]
+
+
+def test_saturation_is_the_first_stage_that_stops_scaling():
+    healthy = [stage(100, 50, 80), stage(200, 99, 90)]
+    assert find_saturation(healthy, 500, 0.01)["saturated"] is False
+
+    flat = healthy + [stage(400, 120, 150)]
+    result = find_saturation(flat, 500, 0.01)
+    assert (result["users"], result["last_healthy_users"]) == (400, 200)
+
+    slow = healthy + [stage(400, 190, 900)]
+    assert "SLO" in find_saturation(slow, 500, 0.01)["reason"]
+
+    failing = healthy + [stage(400, 190, 100, errors=50)]
+    assert "error rate" in find_saturation(failing, 500, 0.01)["reason"]
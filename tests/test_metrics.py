@@ -0,0 +1,57 @@
+"""Prometheus scrape: histogram series for routes and per-table upstream calls"""
+import asyncio
+import re
+from typing import Dict
+
+from tests.perf.harness import BenchApp
+from tests.stand_in import StandIn
+
+_SAMPLE_RE = re.compile(r"^([a-z_]+)(\{.*\})? (\S+)$")
+
+
+def _samples(text: str) -> Dict[str, float]:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, labels, value = _SAMPLE_RE.match(line).groups()
+            samples[name + (labels or "")] = float(value)
+    return samples
+
+
+def test_scrape_has_route_and_upstream_histograms():
+    route = 'method="GET",route="/api/books/{book_id}",status="200"'
+    upstream = 'table="books",operation="select",status="200"'
+    with StandIn() as stand_in:
+        book_id = stand_in.db.insert("books", {"title": "Dracula", "author": "Bram Stoker"})[0]["id"]
+
+        async def run():
+            async with bench.client() as client:
+                before = _samples((await client.get("/api/metrics")).text)
+                for _ in range(3):
+                    assert (await client.get(f"/api/books/{book_id}")).status_code == 200
+                await client.post("/api/activity", json={"user_id": "u1", "book_id": book_id})
+                scrape = await client.get("/api/metrics")
+                assert scrape.headers["content-type"].startswith("text/plain; version=0.0.4")
+                return before, scrape.text
+
+        with BenchApp(stand_in) as bench:
+            before, text = asyncio.run(run())
+
+    after = _samples(text)
+    assert "# TYPE libreya_http_request_duration_seconds histogram" in text
+
+    def grew(series: str) -> float:
+        return after[series] - before.get(series, 0)
+
+    name = "libreya_http_request_duration_seconds"
+    assert grew(f"{name}_count{{{route}}}") == 3 and grew(f"{name}_sum{{{route}}}") > 0
+    buckets = [value for key, value in after.items() if key.startswith(f"{name}_bucket{{{route},le=")]
+    assert buckets == sorted(buckets) and buckets[-1] == after[f"{name}_count{{{route}}}"]
+    assert after[f'{name}_bucket{{{route},le="+Inf"}}'] == buckets[-1]
+
+    # Upstream calls are broken down by table and operation
+    name = "libreya_upstream_request_duration_seconds"
+    assert grew(f"{name}_count{{{upstream}}}") >= 3
+    assert any(key.startswith(f'{name}_count{{table="user_activity",operation="insert"') for key in after)
+    assert grew(f'libreya_upstream_response_bytes_count{{table="books",operation="select"}}') >= 3
+    assert after['libreya_upstream_requests_in_flight{table="books"}'] == 0
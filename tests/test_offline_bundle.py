@@ -0,0 +1,65 @@
+"""Offline bundles: a streamed zip of the user's favorites, and deltas since an earlier bundle"""
+import asyncio
+import io
+import json
+import zipfile
+
+from tests.perf.harness import BenchApp
+from tests.stand_in import StandIn
+
+OLD = "2024-01-01T00:00:00"
+
+
+def _bundle(response) -> zipfile.ZipFile:
+    assert response.status_code == 200 and response.headers["content-type"] == "application/zip"
+    return zipfile.ZipFile(io.BytesIO(response.content))
+
+
+def test_bundle_holds_chapters_metadata_and_activity_then_deltas_only_changed_books():
+    with StandIn() as stand_in:
+        ids = [row["id"] for row in stand_in.db.insert("books", *(
+            {"title": f"Book {n}", "author": "Author", "created_at": OLD, "updated_at": OLD,
+             "content_body": f"<p>Foreword {n}.</p>\n<h2>One</h2>\n<p>First.</p>\n<h2>Two</h2>\n<p>Second.</p>\n"}
+            for n in range(4)))]
+        for n, book_id in enumerate(ids):
+            stand_in.db.insert("user_activity", {"user_id": "u1", "book_id": book_id, "is_favorite": n < 3,
+                                                 "last_position": 0.5, "updated_at": OLD})
+        stand_in.db.insert("highlights", {"user_id": "u1", "book_id": ids[0], "chapter": 1, "position": 0,
+                                          "text": "First."})
+
+        async def run():
+            async with bench.client() as client:
+                response = await client.get("/api/users/u1/offline-bundle")
+                archive = _bundle(response)
+                version = response.headers["x-bundle-version"]
+                manifest = json.loads(archive.read("manifest.json"))
+                assert manifest["version"] == version and manifest["library"] == ids[:3] == manifest["books"]
+                metadata = json.loads(archive.read(f"books/{ids[0]}/metadata.json"))
+                assert [c["title"] for c in metadata["chapters"]] == ["Preface", "One", "Two"]
+                assert "content_body" not in metadata and metadata["title"] == "Book 0"
+                assert archive.read(metadata["chapters"][2]["path"]) == b"\n<p>Second.</p>\n"
+                activity = json.loads(archive.read("activity.json"))
+                assert len(activity["activity"]) == 4 and activity["highlights"][0]["text"] == "First."
+                assert not any(name.startswith(f"books/{ids[3]}/") for name in archive.namelist())
+
+                # Later: one book is revised, another one newly favorited and a third one read on
+                await client.patch(f"/api/admin/books/{ids[1]}", json={"description": "Revised"})
+                await client.post("/api/activity", json={"user_id": "u1", "book_id": ids[3], "is_favorite": True})
+                await client.post("/api/activity", json={"user_id": "u1", "book_id": ids[2], "is_favorite": True,
+                                                         "last_position": 0.9})
+
+                have = ",".join(map(str, manifest["books"]))
+                delta = _bundle(await client.get("/api/users/u1/offline-bundle",
+                                                 params={"since": version, "have": have}))
+                manifest = json.loads(delta.read("manifest.json"))
+                assert manifest["books"] == [ids[1], ids[3]] and manifest["library"] == ids
+                assert {name.split("/")[1] for name in delta.namelist() if name.startswith("books/")} == \
+                    {str(ids[1]), str(ids[3])}
+
+                bad = await client.get("/api/users/u1/offline-bundle", params={"since": "yesterday"})
+                assert bad.status_code == 400
+                bad = await client.get("/api/users/u1/offline-bundle", params={"since": version, "have": "1,x"})
+                assert bad.status_code == 400
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())
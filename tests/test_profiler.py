@@ -0,0 +1,85 @@
+"""Admin sampling profiler: access control, request traces and collapsed stacks"""
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+import upstream
+from profiler import profiler
+from tests.stand_in import Response, StandIn
+
+ADMIN = {"Authorization": "Bearer admin-token"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    with StandIn() as stand_in:
+        monkeypatch.setattr(server, "SUPABASE_URL", stand_in.url)
+        monkeypatch.setattr(server, "SUPABASE_ANON_KEY", "test-anon-key")
+        monkeypatch.setattr(upstream, "_client", None)
+        monkeypatch.setattr(server, "_admin_tokens", {})
+        stand_in.db.insert("books", {"title": "Dracula", "author": "Bram Stoker", "is_featured": True})
+        stand_in.db.insert("users", {"id": "u-reader", "email": "reader@example.com", "is_admin": False})
+
+        def auth(method, path):
+            if path.startswith("/auth/v1/user"):
+                token = stand_in.requests[-1][2].get("authorization", "")
+                if token == "Bearer admin-token":
+                    return Response(200, {"id": "u-admin", "email": server.ADMIN_EMAIL})
+                if token == "Bearer reader-token":
+                    return Response(200, {"id": "u-reader", "email": "reader@example.com"})
+                return Response(401, {"message": "invalid JWT"})
+            return None
+        stand_in.fault_hook = auth
+        with TestClient(server.app) as test_client:
+            yield test_client
+
+
+def test_profiler_requires_an_admin_token(client):
+    assert client.post("/api/admin/profile?seconds=0.05").status_code == 401
+    assert client.post("/api/admin/profile?seconds=0.05", headers={"Authorization": "Bearer bogus"}).status_code == 401
+    reader = {"Authorization": "Bearer reader-token"}
+    assert client.post("/api/admin/profile?seconds=0.05", headers=reader).status_code == 403
+
+
+def test_traces_the_next_matching_requests(client):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(
+        response=client.post("/api/admin/profile?seconds=10&requests=2&path=/api/books", headers=ADMIN)))
+    thread.start()
+    deadline = time.time() + 5
+    while profiler.session is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    client.get("/api/health")
+    assert client.get("/api/books/featured").status_code == 200
+    assert client.get("/api/books").status_code == 200
+    thread.join(5)
+
+    profile = result["response"].json()
+    assert profile["requests_traced"] == 2
+    assert [t["path"] for t in profile["traces"]] == ["/api/books/featured", "/api/books"]
+    featured = profile["traces"][0]
+    assert featured["status"] == 200
+    assert featured["upstream_calls"][0]["table"] == "books"
+    assert featured["wall_ms"] >= featured["upstream_ms"] > 0
+    assert profiler.session is None
+
+
+def test_collapsed_output_and_single_session(client):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(
+        response=client.post("/api/admin/profile?seconds=0.3&format=collapsed", headers=ADMIN)))
+    thread.start()
+    deadline = time.time() + 5
+    while profiler.session is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert client.post("/api/admin/profile?seconds=0.1", headers=ADMIN).status_code == 409
+    thread.join(5)
+
+    lines = result["response"].text.strip().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
@@ -0,0 +1,164 @@
+"""Retries, circuit breakers and stale fallback against a fault-injecting stand-in"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+import upstream
+from admission import UpstreamSaturated
+from resilience import Resilience
+from tests.stand_in import Response, StandIn
+
+BOOK = {"title": "Dracula", "author": "Bram Stoker", "category": "Horror", "is_featured": True, "read_count": 3}
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    with StandIn() as server_stand_in:
+        monkeypatch.setattr(server, "SUPABASE_URL", server_stand_in.url)
+        monkeypatch.setattr(server, "SUPABASE_ANON_KEY", "test-anon-key")
+        server_stand_in.db.insert("books", BOOK)
+        yield server_stand_in
+
+
+@pytest.fixture
+def resilience(monkeypatch):
+    layer = Resilience(attempts=3, base_delay=0.001, max_delay=0.005,
+                       breaker_threshold=3, breaker_reset=0.2,
+                       policies={"books": (0, 3600)})
+    monkeypatch.setattr(upstream, "resilience", layer)
+    monkeypatch.setattr(upstream, "_client", None)
+    return layer
+
+
+@pytest.fixture
+def client(stand_in, resilience):
+    return TestClient(server.app)
+
+
+def fail_first(count, method, prefix, status=503):
+    calls = {"n": 0}
+
+    def hook(request_method, path):
+        if request_method == method and path.startswith(prefix) and calls["n"] < count:
+            calls["n"] += 1
+            return "drop" if status is None else Response(status, {"message": "injected"})
+        return None
+    return hook
+
+
+def test_idempotent_reads_retry_transient_failures(client, stand_in, resilience):
+    stand_in.fault_hook = fail_first(2, "GET", "/rest/v1/books", status=503)
+    response = client.get("/api/books/featured")
+    assert response.status_code == 200
+    assert response.json()[0]["title"] == "Dracula"
+    assert stand_in.count("GET", "/rest/v1/books") == 3
+    assert resilience.retries == 2
+
+
+def test_dropped_connections_are_retried(client, stand_in):
+    stand_in.fault_hook = fail_first(1, "GET", "/rest/v1/books", status=None)
+    assert client.get("/api/books/featured").status_code == 200
+
+
+def test_writes_are_not_retried(client, stand_in):
+    stand_in.fault_hook = fail_first(5, "PATCH", "/rest/v1/books", status=503)
+    response = client.patch("/api/admin/books/1", json={"is_featured": False})
+    assert response.status_code == 503
+    assert stand_in.count("PATCH", "/rest/v1/books") == 1
+
+
+def test_breaker_opens_then_fails_fast_and_recovers(client, stand_in, resilience):
+    stand_in.fault_hook = lambda method, path: Response(503, {"message": "down"}) if "/users" in path else None
+
+    assert client.get("/api/users/someone").status_code == 503
+    assert resilience.breakers["users"].state == "open"
+    sent = stand_in.count("GET", "/rest/v1/users")
+    assert sent == 3
+
+    # Open breaker: rejected locally without touching the upstream
+    response = client.get("/api/users/someone")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert stand_in.count("GET", "/rest/v1/users") == sent
+
+    # Other tables keep working
+    assert client.get("/api/books/featured").status_code == 200
+
+    # After the reset timeout one probe goes through and closes the breaker
+    stand_in.fault_hook = None
+    stand_in.db.insert("users", {"id": "someone", "email": "a@b.c"})
+    time.sleep(0.25)
+    assert client.get("/api/users/someone").status_code == 200
+    assert resilience.breakers["users"].state == "closed"
+
+
+def test_public_reads_served_stale_during_outage(client, stand_in, resilience):
+    first = client.get("/api/books/featured")
+    assert first.status_code == 200
+
+    stand_in.fault_hook = lambda method, path: "drop" if path.startswith("/rest/v1/books") else None
+    for _ in range(5):
+        response = client.get("/api/books/featured")
+        assert response.status_code == 200
+        assert response.json() == first.json()
+    assert resilience.cache.stale_served == 5
+    assert resilience.breakers["books"].state == "open"
+
+
+def test_uncached_reads_fail_with_503_during_outage(client, stand_in):
+    stand_in.fault_hook = lambda method, path: "drop" if path.startswith("/rest/v1/books") else None
+    response = client.get("/api/books/featured")
+    assert response.status_code == 503
+
+
+def test_probe_that_never_reaches_upstream_releases_the_half_open_slot():
+    class Inner(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self.errors = [UpstreamSaturated("queue full"), asyncio.CancelledError()]
+
+        async def handle_async_request(self, request):
+            if self.errors:
+                raise self.errors.pop(0)
+            return httpx.Response(200, json=[], request=request)
+
+    async def run():
+        layer = Resilience(attempts=1, breaker_threshold=1, breaker_reset=0, policies={})
+        layer.breaker("books").record_failure()
+        inner = Inner()
+        request = httpx.Request("GET", "http://upstream/rest/v1/books")
+        for error in (UpstreamSaturated, asyncio.CancelledError):
+            with pytest.raises(error):
+                await layer.handle(inner, request)
+            assert layer.breaker("books").state == "half_open" and not layer.breaker("books").probing
+        assert (await layer.handle(inner, request)).status_code == 200
+        assert layer.breaker("books").state == "closed"
+    asyncio.run(run())
+
+
+def test_background_refresh_is_held_until_it_finishes():
+    class Inner(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self.served = 0
+
+        async def handle_async_request(self, request):
+            self.served += 1
+            return httpx.Response(200, json=[{"n": self.served}], request=request)
+
+    async def run():
+        layer = Resilience(attempts=1, policies={"books": (0.01, 3600)})
+        inner = Inner()
+        request = httpx.Request("GET", "http://upstream/rest/v1/books")
+        await layer.handle(inner, request)
+        await asyncio.sleep(0.02)
+
+        stale = await layer.handle(inner, request)
+        await stale.aread()
+        assert stale.json() == [{"n": 1}] and len(layer._refreshes) == 1
+        await asyncio.gather(*layer._refreshes)
+        await asyncio.sleep(0)
+        assert not layer._refreshes and inner.served == 2
+    asyncio.run(run())
@@ -0,0 +1,91 @@
+"""Incremental re-seeding (seed_books.py --sync) against a local stand-in"""
+import asyncio
+
+import pytest
+
+import seed_books
+from tests.stand_in import FixtureFile, StandIn
+
+TEXT_V1 = "CHAPTER I\n\nIt is a truth universally acknowledged.\n\nCHAPTER II\n\nMr. Bennet was among the earliest."
+TEXT_V2 = TEXT_V1 + "\n\nCHAPTER III\n\nNot all that Mrs. Bennet could ask was sufficient."
+TEXT_PATH = "/cache/epub/1342/pg1342.txt"
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    with StandIn() as server:
+        monkeypatch.setattr(seed_books, "SUPABASE_URL", server.url)
+        monkeypatch.setattr(seed_books, "SUPABASE_ANON_KEY", "test-anon-key")
+        monkeypatch.setattr(seed_books, "GUTENBERG_BASE_URL", server.url)
+        server.db.insert("books", {
+            "title": "Pride and Prejudice",
+            "author": "Jane Austen",
+            "content_body": "<p>old</p>",
+            "source_url": "https://www.gutenberg.org/ebooks/1342",
+        })
+        yield server
+
+
+def test_sync_patches_only_when_upstream_changed(stand_in):
+    stand_in.files[TEXT_PATH] = FixtureFile(TEXT_V1.encode(), etag='"v1"')
+
+    # No validators stored yet: unconditional fetch, book is updated
+    assert asyncio.run(seed_books.sync_books()) == {"unchanged": 0, "updated": 1, "failed": 0}
+    book = stand_in.db.table("books")[0]
+    assert book["source_etag"] == '"v1"'
+    assert book["source_text_url"] == stand_in.url + TEXT_PATH
+    assert "<h2>CHAPTER II</h2>" in book["content_body"]
+    assert stand_in.count("PATCH", "/rest/v1/books") == 1
+
+    # Same upstream text: conditional request answered with 304, nothing written
+    assert asyncio.run(seed_books.sync_books()) == {"unchanged": 1, "updated": 0, "failed": 0}
+    conditional = [h for m, p, h in stand_in.requests if m == "GET" and p == TEXT_PATH][-1]
+    assert conditional["if-none-match"] == '"v1"'
+    assert stand_in.count("PATCH", "/rest/v1/books") == 1
+
+    # Upstream changed: 200 with a new ETag, book re-processed
+    stand_in.files[TEXT_PATH] = FixtureFile(TEXT_V2.encode(), etag='"v2"')
+    assert asyncio.run(seed_books.sync_books()) == {"unchanged": 0, "updated": 1, "failed": 0}
+    book = stand_in.db.table("books")[0]
+    assert book["source_etag"] == '"v2"'
+    assert "<h2>CHAPTER III</h2>" in book["content_body"]
+    assert stand_in.count("PATCH", "/rest/v1/books") == 2
+    assert len(stand_in.db.table("book_fingerprints")) == 1
+
+
+def test_sync_uses_last_modified_when_there_is_no_etag(stand_in):
+    stamp = "Wed, 01 Jan 2025 00:00:00 GMT"
+    stand_in.files[TEXT_PATH] = FixtureFile(TEXT_V1.encode(), last_modified=stamp)
+
+    assert asyncio.run(seed_books.sync_books())["updated"] == 1
+    assert stand_in.db.table("books")[0]["source_last_modified"] == stamp
+
+    assert asyncio.run(seed_books.sync_books())["unchanged"] == 1
+    conditional = [h for m, p, h in stand_in.requests if m == "GET" and p == TEXT_PATH][-1]
+    assert conditional["if-modified-since"] == stamp
+    assert "if-none-match" not in conditional
+
+
+def test_sync_reports_missing_source(stand_in):
+    assert asyncio.run(seed_books.sync_books()) == {"unchanged": 0, "updated": 0, "failed": 1}
+    assert stand_in.count("PATCH", "/rest/v1/books") == 0
+
+
+def test_seeding_stores_validators(stand_in):
+    stand_in.files[TEXT_PATH] = FixtureFile(TEXT_V1.encode(), etag='"v1"')
+    created = asyncio.run(seed_books.seed_single_book(
+        {"title": "Pride and Prejudice", "author": "Jane Austen", "gutenberg_id": 1342}
+    ))
+    assert created["source_etag"] == '"v1"'
+    assert created["category"] == "Romance"
+
+
+def test_sync_recategorizes_with_the_stored_description(stand_in):
+    stand_in.db.insert("books", {
+        "title": "Collected Works", "author": "Anon", "description": "Sonnets and ballads in verse",
+        "content_body": "<p>old</p>", "source_url": "https://www.gutenberg.org/ebooks/1000",
+    })
+    stand_in.files["/cache/epub/1000/pg1000.txt"] = FixtureFile(b"CHAPTER I\n\nSome pages.", etag='"v1"')
+
+    assert asyncio.run(seed_books.sync_books()) == {"unchanged": 0, "updated": 1, "failed": 1}
+    assert stand_in.db.table("books")[1]["category"] == "Poetry"
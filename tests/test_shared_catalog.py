@@ -0,0 +1,70 @@
+"""Shared catalog snapshot: same answers as Supabase, and workers pick up republished snapshots"""
+import asyncio
+
+import server
+import shared_catalog
+from shared_catalog import CatalogLoader, SharedCatalog
+from tests.perf.catalog import CATEGORIES, seed_catalog
+from tests.perf.harness import BenchApp
+from tests.stand_in import StandIn
+
+QUERIES = [
+    "/api/books?limit=50",
+    "/api/books?limit=20&offset=40",
+    f"/api/books?category={CATEGORIES[0]}&limit=30",
+    "/api/books?featured=true&limit=100",
+    "/api/books?featured=false&limit=10&offset=5",
+    "/api/books?search=WINTER&limit=25",
+    f"/api/books?search=austen&category={CATEGORIES[1]}",
+    "/api/books?category=Nonexistent",
+    "/api/books?category=&limit=15",
+    "/api/books/featured?limit=10",
+    "/api/books/categories/list",
+    "/api/settings",
+]
+
+
+def test_snapshot_answers_match_supabase(tmp_path, monkeypatch):
+    with StandIn() as stand_in:
+        seed_catalog(stand_in, 300)
+        path = str(tmp_path / "catalog.seg")
+        assert CatalogLoader(path, stand_in.url, {}).refresh()
+
+        async def fetch_all():
+            async with bench.client() as client:
+                return [(await client.get(q)).json() for q in QUERIES]
+
+        with BenchApp(stand_in) as bench:
+            monkeypatch.setattr(server, "shared_catalog", SharedCatalog(None))
+            expected = asyncio.run(fetch_all())
+            monkeypatch.setattr(server, "shared_catalog", SharedCatalog(path))
+            before = len(stand_in.requests)
+            actual = asyncio.run(fetch_all())
+
+        assert stand_in.requests[before:] == []
+        for query, want, got in zip(QUERIES, expected, actual):
+            assert got == want, query
+        assert any(expected[0]) and expected[5]
+
+
+def test_workers_see_republished_snapshot_after_a_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_catalog, "CHECK_INTERVAL", 0)
+    with StandIn() as stand_in:
+        stand_in.db.insert("books", {"title": "Dracula", "author": "Bram Stoker", "read_count": 5})
+        path = str(tmp_path / "catalog.seg")
+        loader = CatalogLoader(path, stand_in.url, {}, interval=3600)
+        loader.refresh()
+        worker = SharedCatalog(path)
+        assert [b["title"] for b in worker.view().books()] == ["Dracula"]
+
+        stand_in.db.insert("books", {"title": "Emma", "author": "Jane Austen", "read_count": 9})
+        loader.start()
+        try:
+            worker.invalidate()
+            for _ in range(100):
+                if worker.view().generation == 2:
+                    break
+                asyncio.run(asyncio.sleep(0.05))
+        finally:
+            loader.stop()
+        assert [b["title"] for b in worker.view().books()] == ["Emma", "Dracula"]
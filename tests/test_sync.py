@@ -0,0 +1,92 @@
+"""Cross-device sync: coalescing, back-pressure and an end-to-end progress push"""
+import asyncio
+
+import httpx
+import pytest
+
+import sync
+from sync import SyncHub, SyncLimitReached
+from tests.perf.bench_sync import StreamClient
+from tests.perf.harness import ServerProcess
+from tests.stand_in import StandIn
+
+
+def test_hub_coalesces_skips_the_origin_and_cuts_off_slow_devices(monkeypatch):
+    monkeypatch.setattr(sync, "MAX_PENDING", 3)
+
+    async def run():
+        hub = SyncHub(max_connections=10, max_per_user=2)
+        phone = hub.admit("u1", "phone")
+        tablet = hub.admit("u1", "tablet")
+        try:
+            hub.admit("u1")
+            raise AssertionError("third device admitted")
+        except SyncLimitReached:
+            pass
+
+        for position in (0.1, 0.2, 0.3):
+            hub.publish("u1", "progress", {"book_id": 7, "last_position": position}, origin="phone")
+        assert phone.pending == {}
+        assert [data["last_position"] for _, _, data in tablet.pending.values()] == [0.3]
+        assert hub.coalesced == 2
+
+        for book_id in (8, 9, 10):
+            hub.publish("u1", "progress", {"book_id": book_id, "last_position": 0.5})
+        assert tablet.overflowed and hub.overflows == 1
+        assert len(phone.pending) == 3
+
+        stream = hub.stream(hub.admit("u2", "reader"))
+        assert "event: ready" in await stream.__anext__()
+        hub.publish("u2", "favorite", {"book_id": 1, "is_favorite": True})
+        assert "event: favorite" in await stream.__anext__()
+        await stream.aclose()
+        assert "u2" not in hub.users
+    asyncio.run(run())
+
+
+def test_stream_slot_is_released_when_the_response_never_starts(monkeypatch):
+    import server
+    monkeypatch.setattr(server, "sync_hub", SyncHub(max_connections=1))
+
+    async def run():
+        response = await server.sync_stream("u1", "phone")
+        assert server.sync_hub.connections == 1
+        # The client went away before the first byte could be sent
+        async def send(message):
+            raise OSError("connection reset")
+
+        async def receive():
+            return {"type": "http.disconnect"}
+        with pytest.raises(Exception):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        assert server.sync_hub.connections == 0 and "u1" not in server.sync_hub.users
+        await server.sync_stream("u1", "phone")
+    asyncio.run(run())
+
+
+def test_progress_saved_on_one_device_reaches_the_other():
+    with StandIn() as stand_in:
+        stand_in.db.insert("books", {"title": "Dracula", "author": "Bram Stoker"})
+        book_id = stand_in.db.table("books")[0]["id"]
+        with ServerProcess(stand_in) as server:
+            async def run():
+                phone = StreamClient(server.port, "reader-1", "phone")
+                tablet = StreamClient(server.port, "reader-1", "tablet")
+                await phone.open()
+                await tablet.open()
+                async with httpx.AsyncClient(base_url=server.url) as client:
+                    response = await client.post("/api/activity", headers={"X-Device-Id": "phone"}, json={
+                        "user_id": "reader-1", "book_id": book_id, "last_position": 0.42, "is_favorite": True})
+                    assert response.status_code == 200
+                await asyncio.wait_for(tablet.wait_for(b"event: progress"), 5)
+                assert b'"last_position": 0.42' in tablet.buffer
+                await asyncio.wait_for(tablet.wait_for(b"event: favorite"), 5)
+                # The saving device doesn't hear its own write
+                try:
+                    await asyncio.wait_for(phone.wait_for(b"event: progress"), 0.3)
+                    raise AssertionError("origin device received its own event")
+                except asyncio.TimeoutError:
+                    pass
+                phone.close()
+                tablet.close()
+            asyncio.run(run())
@@ -0,0 +1,53 @@
+"""Text statistics: chapter splitting like the reader, write-time stats and the backfill job"""
+import asyncio
+
+import server
+from tests.perf.harness import ADMIN_HEADERS, BenchApp
+from tests.stand_in import StandIn
+from text_stats import split_chapters, text_stats
+
+BODY = ("<p>A note before the first chapter.</p>\n"
+        "<h2>CHAPTER I</h2>\n<p>It was a dark &amp; stormy night.</p>\n"
+        "<h2> </h2>\n<p>Untitled chapter here.</p>\n")
+
+
+def test_chapters_split_like_the_reader_and_stats_count_plain_words():
+    chapters = split_chapters(BODY, "Title")
+    assert [title for title, _ in chapters] == ["Preface", "CHAPTER I", "Chapter 2"]
+    assert text_stats(BODY) == {"word_count": 18, "chapter_count": 3, "reading_minutes": 1}
+    # No headings: the whole book is one chapter named after it
+    assert split_chapters("<p>one two</p>", "Title") == [("Title", "<p>one two</p>")]
+    assert text_stats("<p>" + "word " * 500 + "</p>")["reading_minutes"] == 3
+    assert text_stats(None) == {"word_count": 0, "chapter_count": 0, "reading_minutes": 0}
+
+
+def test_backfill_job_fills_missing_stats_and_lists_return_them(monkeypatch):
+    monkeypatch.setattr(server, "BACKFILL_BATCH", 2)
+    with StandIn() as stand_in:
+        stand_in.db.insert("books", *({"title": f"Book {n}", "author": "Author", "read_count": n,
+                                       "content_body": BODY * (n + 1)} for n in range(5)))
+        stand_in.db.insert("books", {"title": "Done", "author": "Author", "content_body": BODY,
+                                     "word_count": 1, "chapter_count": 1, "reading_minutes": 1})
+
+        async def run():
+            bench.jobs.kinds["backfill_text_stats"] = server.backfill_text_stats_job
+            async with bench.client() as client:
+                response = await client.post("/api/admin/books/backfill-stats", headers=ADMIN_HEADERS)
+                assert response.status_code == 202
+                job_id = response.json()["id"]
+                for _ in range(200):
+                    job = (await client.get(f"/api/admin/jobs/{job_id}", headers=ADMIN_HEADERS)).json()
+                    if job["state"] not in ("queued", "running"):
+                        break
+                    await asyncio.sleep(0.01)
+                assert job["state"] == "succeeded" and job["result"] == {"updated": 5, "failed": 0}
+                assert job["total"] == 5
+                books = (await client.get("/api/books", params={"limit": 10})).json()
+                assert all("content_body" not in book for book in books)
+                return {book["title"]: book for book in books}
+
+        with BenchApp(stand_in) as bench:
+            books = asyncio.run(run())
+            assert books["Book 1"]["word_count"] == 36 and books["Book 1"]["chapter_count"] == 5
+            # Rows that already had stats are left alone unless recomputing
+            assert books["Done"]["word_count"] == 1
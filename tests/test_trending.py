@@ -0,0 +1,67 @@
+"""Trending ranking: decay, snapshots and order=trending on the books list"""
+import asyncio
+
+from tests.perf.harness import BenchApp
+from tests.stand_in import StandIn
+from trending import Trending
+
+HOUR = 3600.0
+
+
+def test_recent_opens_outrank_old_ones_and_survive_a_restart(tmp_path):
+    now = 1_000_000.0
+    ranking = Trending(half_life=HOUR, top_k=2, snapshot_path=str(tmp_path / "trending.json"))
+    ranking.epoch = now
+    for _ in range(10):
+        ranking.record(1, now)          # popular, but three half-lives ago
+    for _ in range(2):
+        ranking.record(2, now + 3 * HOUR)
+    ranking.record(3, now + 3 * HOUR)
+    later = now + 3 * HOUR
+    assert abs(ranking.score(1, later) - 1.25) < 1e-9
+    assert [book_id for book_id, _ in ranking.top(later)] == [2, 1]
+
+    # Moving the landmark keeps the decayed scores
+    ranking._rebase(later)
+    assert abs(ranking.score(1, later) - 1.25) < 1e-9 and ranking.epoch == later
+
+    snapshot = ranking.snapshot(later)
+    restored = Trending(half_life=HOUR, snapshot_path=None)
+    restored.epoch = later
+    restored.restore(snapshot, later + HOUR)
+    assert abs(restored.score(2, later + HOUR) - 1.0) < 1e-6
+    assert [book_id for book_id, _ in restored.top(later + HOUR)] == [2, 1, 3]
+
+    # Through this worker's own snapshot file, taken over once by the next process
+    current = Trending(half_life=HOUR, snapshot_path=str(tmp_path / "trending.json"))
+    for book_id in (1, 2, 3):
+        current.record(book_id)
+    current.save()
+    reloaded = Trending(half_life=HOUR, snapshot_path=str(tmp_path / "trending.json"))
+    reloaded.load()
+    assert set(reloaded.scores) == {1, 2, 3}
+    again = Trending(half_life=HOUR, snapshot_path=str(tmp_path / "trending.json"))
+    again.load()
+    assert set(again.scores) == {1, 2, 3}
+
+
+def test_order_trending_ranks_recent_opens_and_tops_up_with_popular_books():
+    with StandIn() as stand_in:
+        ids = [row["id"] for row in stand_in.db.insert("books", *(
+            {"title": f"Book {n}", "author": "Author", "category": "Fiction" if n % 2 else "Poetry",
+             "read_count": 100 - n} for n in range(6)))]
+
+        async def run():
+            async with bench.client() as client:
+                for book_id, opens in ((ids[5], 3), (ids[3], 1)):
+                    for _ in range(opens):
+                        assert (await client.get(f"/api/books/{book_id}")).status_code == 200
+                books = (await client.get("/api/books", params={"order": "trending", "limit": 4})).json()
+                assert [b["id"] for b in books] == [ids[5], ids[3], ids[0], ids[1]]
+                assert books[0]["trending_score"] > books[1]["trending_score"]
+                fiction = (await client.get("/api/books", params={"order": "trending", "category": "Fiction"})).json()
+                assert [b["id"] for b in fiction] == [ids[5], ids[3], ids[1]]
+                assert (await client.get("/api/books", params={"order": "newest"})).status_code == 400
+
+        with BenchApp(stand_in) as bench:
+            asyncio.run(run())